@@ -0,0 +1,180 @@
+# Central scheduler for periodic background jobs. Every job registered with @client.background lives in one heap ordered by
+# next run time, and a single task sleeps until the earliest one is due, so there's one timer for the whole bot instead of
+# a sleeping loop per job.
+#
+# Scheduling modes:
+# - "fixed_rate" runs are anchored to the time the job first started, so a job with a period of 60 runs at :00, :01, ...
+#   no matter how long each run takes. If a run is still going when the next one is due that's an overrun.
+# - "fixed_delay" waits `period` seconds after each run finishes before starting the next one (what the old
+#   while/sleep loops did, but without losing the schedule if a run throws).
+# Missed runs (the event loop was blocked, the machine was suspended, a run overran) are either dropped ("skip") or run
+# back to back until the job has caught up ("catch_up"). jitter adds a random 0-jitter second delay to each run so jobs
+# with the same period don't all fire on the same tick.
+
+from typing import Awaitable, Callable, List
+
+import asyncio
+import heapq
+import itertools
+import log
+import random
+import time
+
+
+catch_up_limit = 10
+# most runs a catch_up job can be owed at once, anything past that is dropped as missed so that a job which always
+# overruns doesn't build up an endless backlog
+
+
+class Job:
+	def __init__(self, func: Callable[[], Awaitable[None]], period: float, mode: str = "fixed_rate", jitter: float = 0.0,
+					misfire: str = "skip", delay: float = 0.0):
+		if mode not in ["fixed_rate", "fixed_delay"]:
+			raise ValueError(f"unknown scheduling mode {mode} for background job {func.__name__} (should be fixed_rate or fixed_delay)")
+		if misfire not in ["skip", "catch_up"]:
+			raise ValueError(f"unknown misfire policy {misfire} for background job {func.__name__} (should be skip or catch_up)")
+		self.func = func
+		self.name = f"{func.__module__}.{func.__name__}"
+		self.period = period
+		self.mode = mode
+		self.jitter = jitter
+		self.misfire = misfire
+		self.delay = delay
+
+		self.base: float = None  # nominal time of the next run, without jitter (loop time)
+		self.next_run: float = None  # actual time of the next run (loop time)
+		self.task: asyncio.Task = None
+		self.pending = 0  # catch-up runs still owed
+
+		self.runs = 0
+		self.failures = 0
+		self.overruns = 0
+		self.missed = 0
+		self.last_started: float = None  # wall clock time
+		self.last_duration: float = None
+		self.max_duration: float = None
+
+	@property
+	def running(self) -> bool:
+		return self.task is not None and not self.task.done()
+
+
+class BackgroundScheduler:
+	def __init__(self, measure: Callable[..., Awaitable[None]] = None):
+		# measure is called as measure("background", func) to run a job, for timing it (see metrics.py)
+		self.jobs: List[Job] = []
+		self._measure = measure
+		self._heap = []
+		self._sequence = itertools.count()
+		self._loop: asyncio.AbstractEventLoop = None
+		self._wakeup: asyncio.Event = None
+		self._task: asyncio.Task = None
+
+	def add(self, job: Job) -> None:
+		self.jobs.append(job)
+		if self._loop is not None:
+			self._schedule(job, self._loop.time() + job.delay)
+
+	def start(self, loop: asyncio.AbstractEventLoop) -> None:
+		if self._task is not None:
+			return
+		self._loop = loop
+		self._wakeup = asyncio.Event()
+		now = loop.time()
+		for job in self.jobs:
+			self._schedule(job, now + job.delay)
+		self._task = loop.create_task(self._run())
+		log.debug(f"background scheduler started with {len(self.jobs)} jobs")
+
+	def stop(self) -> None:
+		if self._task is not None:
+			self._task.cancel()
+			self._task = None
+		for job in self.jobs:
+			if job.running:
+				job.task.cancel()
+
+	def _schedule(self, job: Job, base: float) -> None:
+		job.base = base
+		job.next_run = base + (random.uniform(0, job.jitter) if job.jitter else 0)
+		heapq.heappush(self._heap, (job.next_run, next(self._sequence), job))
+		if self._wakeup is not None:
+			self._wakeup.set()
+
+	async def _run(self) -> None:
+		while True:
+			now = self._loop.time()
+			while self._heap and self._heap[0][0] <= now:
+				_, _, job = heapq.heappop(self._heap)
+				self._fire(job, now)
+			timeout = (self._heap[0][0] - now) if self._heap else None
+			self._wakeup.clear()
+			try:
+				await asyncio.wait_for(self._wakeup.wait(), timeout)
+			except asyncio.TimeoutError:
+				pass
+
+	def _fire(self, job: Job, now: float) -> None:
+		if job.running:
+			# the last run still hasn't finished (only possible with fixed_rate)
+			job.overruns += 1
+			if job.misfire == "catch_up":
+				self._owe(job, 1)
+				log.warning(f"Background job {job.name}() overran its {job.period}s period, next run queued behind it")
+			else:
+				job.missed += 1
+				log.warning(f"Background job {job.name}() overran its {job.period}s period, skipping a run")
+		else:
+			job.task = self._loop.create_task(self._execute(job))
+
+		if job.mode == "fixed_rate":
+			base = job.base + job.period
+			if base <= now:
+				# we're more than a whole period late
+				behind = int((now - base) // job.period) + 1
+				if job.misfire == "catch_up":
+					self._owe(job, behind)
+				else:
+					job.missed += behind
+				log.warning(f"Background job {job.name}() missed {behind} run(s), {'catching up' if job.misfire == 'catch_up' else 'skipping them'}")
+				base += behind * job.period
+			self._schedule(job, base)
+
+	def _owe(self, job: Job, runs: int) -> None:
+		owed = min(runs, catch_up_limit - job.pending)
+		job.pending += max(0, owed)
+		job.missed += runs - max(0, owed)
+
+	async def _execute(self, job: Job) -> None:
+		while True:
+			job.last_started = time.time()
+			start = time.perf_counter()
+			try:
+				if self._measure is not None:
+					await self._measure("background", job.func)
+				else:
+					await job.func()
+			except asyncio.CancelledError:
+				raise
+			except Exception:
+				job.failures += 1
+				log.error(f"Error processing background task {job.func.__name__}():", include_exception=True)
+			duration = time.perf_counter() - start
+			job.runs += 1
+			job.last_duration = duration
+			job.max_duration = duration if job.max_duration is None else max(job.max_duration, duration)
+
+			if job.mode == "fixed_delay":
+				self._schedule(job, self._loop.time() + job.period)
+				return
+			if duration > job.period:
+				log.warning(f"Background job {job.name}() took {duration:.3f}s, longer than its {job.period}s period")
+			if job.pending == 0:
+				return
+			job.pending -= 1
+
+	def next_run_in(self, job: Job) -> float:
+		# Seconds until the job next runs, or None if it isn't scheduled (not started yet, or fixed_delay and running)
+		if self._loop is None or job.next_run is None or (job.mode == "fixed_delay" and job.running):
+			return None
+		return job.next_run - self._loop.time()
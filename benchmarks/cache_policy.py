@@ -0,0 +1,145 @@
+# Memory report for message cache policies.
+#
+# Feeds the same simulated traffic through discord.py's stock cache (a deque of the last N messages) and through
+# cache.QuotaMessageCache with a few quota settings, and reports for each one how much memory the cache holds, how much of
+# the cache the busiest guild ends up with, how many of the quiet guilds still have their recent messages cached (what
+# reactions and edits there need), and what looking up a cached message by ID costs.
+#
+# The traffic is skewed the way it is on the real bot: one guild sends most of the messages, a handful are active, and
+# the rest are quiet. The stand-in messages hold roughly what a discord.Message holds (content, a few lists, IDs, and
+# references to the author, channel and guild) so the absolute sizes are estimates, but the comparison between policies
+# holds. Member and presence caches depend on live guild data and aren't simulated here.
+#
+# Run from the repository root with:  python benchmarks/cache_policy.py
+
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache  # noqa: E402
+
+
+guild_count = 200
+channels_per_guild = 5
+message_count = 200000
+recent_needed = 50  # a quiet guild counts as covered if its last this many messages are all cached
+
+
+class Guild:
+	def __init__(self, id: int):
+		self.id = id
+
+
+class Channel:
+	def __init__(self, id: int, guild: Guild):
+		self.id = id
+		self.guild = guild
+
+
+class Message:
+	__slots__ = ("id", "channel", "guild", "author", "content", "embeds", "attachments", "mentions", "role_mentions",
+				"reactions", "created_at", "edited_at", "type", "flags", "pinned", "tts", "nonce", "_state", "_cs_clean")
+
+	def __init__(self, id: int, channel: Channel, content: str):
+		self.id = id
+		self.channel = channel
+		self.guild = channel.guild
+		self.author = None
+		self.content = content
+		self.embeds = []
+		self.attachments = []
+		self.mentions = []
+		self.role_mentions = []
+		self.reactions = []
+		self.created_at = None
+		self.edited_at = None
+		self.type = 0
+		self.flags = 0
+		self.pinned = False
+		self.tts = False
+		self.nonce = str(id)
+		self._state = None
+		self._cs_clean = None
+
+
+def build_traffic():
+	random.seed(0)
+	guilds = [Guild(1000 + x) for x in range(guild_count)]
+	channels = {x.id: [Channel(x.id * 100 + y, x) for y in range(channels_per_guild)] for x in guilds}
+	# guild 0 gets 60% of the traffic, the next 10 guilds share 30%, everyone else shares the last 10%
+	weights = [60.0] + [3.0] * 10 + [10.0 / (guild_count - 11)] * (guild_count - 11)
+	picks = random.choices(guilds, weights=weights, k=message_count)
+	words = ["arbys", "beef", "music", "stats", "help", "the", "a", "ping", "when", "lol"]
+	messages = []
+	for i, guild in enumerate(picks):
+		content = " ".join(random.choices(words, k=random.randint(3, 30)))
+		messages.append(Message(10**17 + i, random.choice(channels[guild.id]), content))
+	return guilds, messages
+
+
+def policies():
+	return {
+		"stock deque, 50000": lambda: deque(maxlen=50000),
+		"stock deque, 10000": lambda: deque(maxlen=10000),
+		"quota 50000, 5000/guild": lambda: cache.QuotaMessageCache(50000, 5000),
+		"quota 40000, 1000/guild (default)": lambda: cache.QuotaMessageCache(40000, 1000),
+		"quota 20000, 1000/guild": lambda: cache.QuotaMessageCache(20000, 1000),
+		"quota 20000, 1000/guild, busiest 200": lambda: cache.QuotaMessageCache(20000, 1000, guild_quotas={1000: 200}),
+	}
+
+
+def message_size(message: Message) -> int:
+	return (sys.getsizeof(message) + sys.getsizeof(message.content) + sys.getsizeof(message.nonce) +
+			sum(sys.getsizeof(x) for x in [message.embeds, message.attachments, message.mentions, message.role_mentions, message.reactions]))
+
+
+def find_stock(store, message_id: int):
+	# what discord.py's ConnectionState._get_message() does with the stock deque
+	for x in reversed(store):
+		if x.id == message_id:
+			return x
+	return None
+
+
+def main():
+	guilds, messages = build_traffic()
+	last_by_guild = {}
+	for message in messages:
+		last_by_guild.setdefault(message.guild.id, []).append(message.id)
+	quiet = [x.id for x in guilds[11:] if x.id in last_by_guild]
+
+	print(f"{message_count} messages across {guild_count} guilds, {len(quiet)} quiet guilds")
+	print(f"{'policy':<38} {'cached':>8} {'memory (MiB)':>13} {'busiest guild':>14} {'quiet covered':>14} {'lookup (us)':>12}")
+	for name, factory in policies().items():
+		store = factory()
+		tracemalloc.start()
+		before = tracemalloc.get_traced_memory()[0]
+		for message in messages:
+			store.append(message)
+		held = tracemalloc.get_traced_memory()[0] - before
+		tracemalloc.stop()
+		# the messages themselves exist regardless of policy, count what the cache keeps alive on top of its own overhead
+		held += sum(message_size(x) for x in store)
+
+		cached_ids = {x.id for x in store}
+		busiest = sum(1 for x in store if x.guild.id == guilds[0].id)
+		covered = sum(1 for x in quiet if all(y in cached_ids for y in last_by_guild[x][-recent_needed:]))
+
+		targets = [last_by_guild[x][-1] for x in quiet[:20]]
+		if isinstance(store, cache.QuotaMessageCache):
+			lookup = timeit.timeit(lambda: [store.get(x) for x in targets], number=20)
+		else:
+			lookup = timeit.timeit(lambda: [find_stock(store, x) for x in targets], number=20)
+		lookup_us = lookup / (20 * len(targets)) * 1_000_000
+
+		print(f"{name:<38} {len(store):>8} {held/(1024*1024):>13.1f} {busiest/len(store)*100:>13.1f}% "
+			f"{covered/len(quiet)*100:>13.1f}% {lookup_us:>12.2f}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,82 @@
+# Benchmark for command dispatch cost as the number of registered commands grows.
+#
+# Compares the old linear scan (prefix.check_command_prefix() over every trigger and alias) against the hashed lookup
+# used by FrameworkClient.on_message (prefix.get_command_token() plus one dict lookup). The hashed path should stay
+# flat from a handful of commands up to a thousand, the linear scan should not.
+#
+# Run from the repository root with:  python benchmarks/command_dispatch.py
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import prefix  # noqa: E402
+
+
+command_counts = [40, 100, 250, 500, 1000]
+iterations = 20000
+
+
+def build_lookup(n: int):
+	# Roughly mirrors what the real bot registers: a trigger with an alias or two on some of them.
+	command_lookup = {}
+	alias_lookup = {}
+	for i in range(n):
+		trigger = f"command{i}"
+		command_lookup[trigger] = trigger
+		if i % 3 == 0:
+			alias = f"c{i}"
+			command_lookup[alias] = trigger
+			alias_lookup[alias] = trigger
+	return command_lookup, alias_lookup
+
+
+def build_messages(command_lookup, count: int = 256):
+	# A mix of known commands with arguments, aliases, and unknown commands
+	keys = list(command_lookup.keys())
+	messages = []
+	for i in range(count):
+		if i % 10 == 0:
+			messages.append("notacommand with some arguments")
+		else:
+			messages.append(f"{random.choice(keys).upper() if i % 4 == 0 else random.choice(keys)} some arguments here")
+	return messages
+
+
+def linear_dispatch(command_lookup, alias_lookup, messages):
+	for command in messages:
+		known_cmd, run_by = prefix.check_command_prefix(command, list(command_lookup.keys()))
+		if known_cmd:
+			command_lookup[run_by]
+
+
+def hashed_dispatch(command_lookup, alias_lookup, messages):
+	for command in messages:
+		token = prefix.get_command_token(command)
+		handler = command_lookup.get(token)
+		run_by = alias_lookup.get(token, token)
+
+
+def main():
+	random.seed(0)
+	print(f"{'commands':>10} {'linear (us/msg)':>18} {'hashed (us/msg)':>18}")
+	for n in command_counts:
+		command_lookup, alias_lookup = build_lookup(n)
+		messages = build_messages(command_lookup)
+		rounds = max(1, iterations // len(messages))
+		# the linear scan gets fewer rounds at large sizes otherwise this takes forever
+		linear_rounds = max(1, rounds * 40 // n)
+
+		linear = timeit.timeit(lambda: linear_dispatch(command_lookup, alias_lookup, messages), number=linear_rounds)
+		hashed = timeit.timeit(lambda: hashed_dispatch(command_lookup, alias_lookup, messages), number=rounds)
+
+		linear_us = linear / (linear_rounds * len(messages)) * 1_000_000
+		hashed_us = hashed / (rounds * len(messages)) * 1_000_000
+		print(f"{n:>10} {linear_us:>18.3f} {hashed_us:>18.3f}")
+
+
+if __name__ == "__main__":
+	main()
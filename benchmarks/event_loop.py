@@ -0,0 +1,167 @@
+# Benchmark comparing event loop implementations (see eventloop.py) on the bot's own message dispatch.
+#
+# Each loop is measured in a separate process, since the loop is picked when the client is created. Every run:
+# - pushes fake messages through FrameworkClient.on_message as fast as it can, with a few message handlers registered
+#   (run concurrently, as with config.concurrent_message_handlers) and about a third of the messages being commands that
+#   "send" a reply, and reports messages per second
+# - then feeds messages in at a steady busy-bot rate while a 20 ms periodic timer (the cadence of a voice frame) runs on
+#   the same loop, and reports how late its ticks were. discord.py sends voice frames from its own player thread, so
+#   this measures what everything else on the loop sees under load (gateway heartbeats, voice websocket keepalives,
+#   background jobs) rather than the audio itself.
+#
+# Run from the repository root with:  python benchmarks/event_loop.py
+# Loops that aren't installed are reported as such and skipped.
+
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import types
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+loops = ["asyncio", "uvloop"]
+message_count = 50000
+concurrency = 50  # messages in flight at once
+frame_interval = 0.02
+steady_rate = 2000  # messages per second during the jitter run
+steady_duration = 5.0
+
+
+class FakeChannel:
+	def __init__(self, id: int):
+		self.id = id
+		self.sent = 0
+
+	async def send(self, content=None, embed=None, **kwargs):
+		self.sent += 1
+		await asyncio.sleep(0)  # stands in for handing the request to the HTTP client
+
+
+def build_messages(prefix: str):
+	random.seed(0)
+	guilds = [types.SimpleNamespace(id=1000 + x) for x in range(20)]
+	channels = [FakeChannel(5000 + x) for x in range(60)]
+	authors = [types.SimpleNamespace(id=9000 + x, bot=False, mention=f"<@{9000 + x}>") for x in range(200)]
+	messages = []
+	for i in range(message_count):
+		channel = random.choice(channels)
+		content = f"{prefix}bench{random.randint(0, 2)} some arguments" if i % 3 == 0 else "just chatting about beef " * random.randint(1, 5)
+		messages.append(types.SimpleNamespace(id=i, content=content, guild=random.choice(guilds), channel=channel, author=random.choice(authors)))
+	return messages
+
+
+def run_one(name: str) -> dict:
+	import config
+	config.event_loop = name
+	config.terminal_loglevel = -1
+	config.file_loglevel = -1
+	config.concurrent_message_handlers = True
+
+	import eventloop
+	from client import client
+
+	if eventloop.implementation != name:
+		return {"loop": name, "available": False}
+
+	for n in range(3):
+		@client.command(trigger=f"bench{n}")
+		async def bench_command(command: str, message):
+			await message.channel.send(f"reply to {command}")
+
+	@client.message()
+	async def counter(message):
+		pass
+
+	@client.message(group="ordered")
+	async def first(message):
+		await asyncio.sleep(0)
+
+	@client.message(group="ordered")
+	async def second(message):
+		message.content.lower().split(" ")
+
+	messages = build_messages(client.default_prefix)
+	client.active = True
+	lateness = []
+
+	async def settle():
+		while len(asyncio.all_tasks()) > 1:  # handler fan-out tasks still finishing
+			await asyncio.sleep(0)
+
+	async def throughput():
+		queue = asyncio.Queue()
+		for message in messages:
+			queue.put_nowait(message)
+
+		async def worker():
+			while not queue.empty():
+				await client.on_message(queue.get_nowait())
+
+		start = time.perf_counter()
+		await asyncio.gather(*[worker() for _ in range(concurrency)])
+		await settle()
+		return time.perf_counter() - start
+
+	async def frames():
+		loop = asyncio.get_event_loop()
+		next_tick = loop.time() + frame_interval
+		end = loop.time() + steady_duration
+		while next_tick < end:
+			await asyncio.sleep(max(0.0, next_tick - loop.time()))
+			lateness.append(loop.time() - next_tick)
+			next_tick += frame_interval
+
+	async def steady():
+		loop = asyncio.get_event_loop()
+		ticker = asyncio.ensure_future(frames())
+		batch = max(1, int(steady_rate * 0.01))
+		index = 0
+		while not ticker.done():
+			for _ in range(batch):
+				loop.create_task(client.on_message(messages[index % len(messages)]))
+				index += 1
+			await asyncio.sleep(0.01)
+		await settle()
+
+	elapsed = client.loop.run_until_complete(throughput())
+	client.loop.run_until_complete(steady())
+	lateness_ms = sorted(x * 1000 for x in lateness)
+	return {
+		"loop": name,
+		"available": True,
+		"messages_per_second": message_count / elapsed,
+		"frames": len(lateness_ms),
+		"jitter_mean_ms": statistics.mean(lateness_ms),
+		"jitter_p99_ms": lateness_ms[int(len(lateness_ms) * 0.99) - 1],
+		"jitter_max_ms": lateness_ms[-1],
+	}
+
+
+def main():
+	print(f"throughput: {message_count} messages, {concurrency} in flight; jitter: {frame_interval*1000:.0f} ms timer for "
+		f"{steady_duration:.0f}s with {steady_rate} messages/sec coming in")
+	print(f"{'loop':<10} {'msgs/sec':>10} {'frames':>8} {'late mean (ms)':>15} {'late p99 (ms)':>14} {'late max (ms)':>14}")
+	for name in loops:
+		result = subprocess.run([sys.executable, os.path.abspath(__file__), "--loop", name], cwd=root, capture_output=True, text=True)
+		if result.returncode != 0:
+			print(f"{name:<10} failed:\n{result.stderr}")
+			continue
+		data = json.loads(result.stdout.strip().splitlines()[-1])
+		if not data["available"]:
+			print(f"{name:<10} not installed, skipped")
+			continue
+		print(f"{name:<10} {data['messages_per_second']:>10.0f} {data['frames']:>8} {data['jitter_mean_ms']:>15.3f} "
+			f"{data['jitter_p99_ms']:>14.3f} {data['jitter_max_ms']:>14.3f}")
+
+
+if __name__ == "__main__":
+	if "--loop" in sys.argv:
+		print(json.dumps(run_one(sys.argv[sys.argv.index("--loop") + 1])))
+	else:
+		main()
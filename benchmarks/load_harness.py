@@ -0,0 +1,344 @@
+# Synthetic load harness for the whole message pipeline, without a gateway connection.
+#
+# Builds the real FrameworkClient with every module in main.py's enabled_modules imported, swaps the network out for
+# in-memory stand-ins (fake guilds, channels, users and attachments whose sends and reactions are just counted, and a
+# stub for discord.py's HTTP client in case anything gets past those), and pushes a generated stream of messages through
+# FrameworkClient.on_message: chat, commands behind each kind of prefix (configured, mention, bpid, guild-specific),
+# unknown commands, mentions of the bot, custom emoji, attachments, and a share of DMs. Then reports:
+# - messages per second with `concurrency` messages in flight, or with --rate, how late each message was handled when
+#   they come in at a steady rate
+# - per-handler cost from client.metrics (calls, mean and p99 wall time, CPU time per call)
+# - allocations, from a second, smaller run with tracemalloc on (which slows everything down, so it's kept out of the
+#   timed run): memory retained per message, broken down by the file that allocated it, and garbage collector runs
+#   (young generation collections happen every 700 net container allocations, so they track allocation churn)
+#
+# Run from the repository root with:  python benchmarks/load_harness.py [--help for the options]
+# Modules that can't be imported here (missing libraries or keys) are listed and left out. Commands that talk to other
+# services are left out of the default command mix, pass --commands to choose your own.
+
+import argparse
+import ast
+import asyncio
+import gc
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+default_commands = ["ping", "p", "beef", "chicken", "about", "a", "help", "morse", "unmorse", "thiccbeef", "notacommand"]
+chat_lines = [
+	"just chatting about beef",
+	"has anyone seen the new satellite pass times",
+	"uwu",
+	"arbys shut down",
+	"lol",
+	"what's the band like on 20m today <:ntoskrnl_irl:486325601750351882>",
+	"<:pog:123456789012345678> <:pog:123456789012345678>",
+	"this is a longer message that goes on for a while, like people tend to do when they're explaining something " * 3,
+]
+attachment_names = ["photo.png", "clip.mp4", "notes.txt", "setup.sh", "log.zip"]
+
+
+class FakeTyping:
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, *args):
+		return False
+
+
+class FakeChannel:
+	def __init__(self, id: int, guild=None):
+		self.id = id
+		self.guild = guild
+		self.name = f"channel-{id}"
+		self.mention = f"<#{id}>"
+		self.sent = 0
+
+	async def send(self, content=None, *, embed=None, file=None, files=None, delete_after=None, **kwargs):
+		self.sent += 1
+		return FakeMessage(random.getrandbits(62), "" if content is None else str(content), self.guild, self, fake_self, [])
+
+	async def trigger_typing(self):
+		pass
+
+	def typing(self):
+		return FakeTyping()
+
+	def permissions_for(self, member):
+		return types.SimpleNamespace(send_messages=True, embed_links=True, attach_files=True, add_reactions=True, manage_messages=True)
+
+
+class FakeAttachment:
+	def __init__(self, id: int, filename: str, size: int):
+		self.id = id
+		self.filename = filename
+		self.size = size
+		self.url = f"https://cdn.example.invalid/attachments/{id}/{filename}"
+		self.proxy_url = self.url
+
+	async def save(self, fp, **kwargs):
+		data = b"\0" * self.size
+		if hasattr(fp, "write"):
+			fp.write(data)
+		else:
+			with open(fp, "wb") as f:
+				f.write(data)
+		return self.size
+
+	async def read(self, **kwargs):
+		return b"\0" * self.size
+
+
+class FakeMessage:
+	reactions_added = 0
+
+	def __init__(self, id: int, content: str, guild, channel, author, attachments):
+		self.id = id
+		self.content = content
+		self.clean_content = content
+		self.guild = guild
+		self.channel = channel
+		self.author = author
+		self.attachments = attachments
+		self.embeds = []
+		self.mentions = []
+		self.reactions = []
+		self.pinned = False
+		self.created_at = time.time()
+		self.jump_url = f"https://discord.com/channels/{getattr(guild, 'id', '@me')}/{channel.id}/{id}"
+
+	async def add_reaction(self, emoji):
+		FakeMessage.reactions_added += 1
+
+	async def remove_reaction(self, emoji, member):
+		pass
+
+	async def delete(self, **kwargs):
+		pass
+
+	async def edit(self, **kwargs):
+		pass
+
+
+def fake_user(id: int, bot: bool = False):
+	return types.SimpleNamespace(id=id, bot=bot, name=f"user{id}", display_name=f"user{id}", discriminator=f"{id % 10000:04d}",
+								mention=f"<@{id}>", roles=[], avatar_url="", created_at=None, guild_permissions=None)
+
+
+fake_self = fake_user(476571656375238657, bot=True)
+
+
+def read_enabled_modules():
+	# main.py connects to Discord when imported, so pull the module list out of its source instead
+	with open(os.path.join(root, "main.py"), encoding="utf-8") as f:
+		tree = ast.parse(f.read())
+	for node in tree.body:
+		if isinstance(node, ast.Assign) and any(getattr(x, "id", None) == "enabled_modules" for x in node.targets):
+			return ast.literal_eval(node.value)
+	return []
+
+
+def setup(args):
+	import config
+	config.terminal_loglevel = -1
+	config.file_loglevel = -1
+	config.log_messages = args.log_messages
+	config.lazy_modules = False
+	config.concurrent_message_handlers = not args.sequential_handlers
+	config.outbound_rate = (1000000, 1.0)  # sends cost nothing here, so don't pace them like Discord's channel limit would
+
+	from client import client
+	import loader
+
+	failed = {}
+	for name in args.modules.split(",") if args.modules else read_enabled_modules():
+		try:
+			loader.activate(name)
+		except Exception as e:
+			failed[name] = f"{type(e).__name__}: {e}"
+
+	requests = []
+
+	async def request(route, *args, **kwargs):
+		# Counts the request and answers with the least discord.py will accept. The only REST calls the default command
+		# mix makes directly are user lookups (about), everything else goes through the fake channels and messages.
+		requests.append(f"{route.method} {route.path}")
+		if route.method == "GET" and route.path.startswith("/users/"):
+			user_id = route.url.rstrip("/").rsplit("/", 1)[-1]
+			return {"id": user_id, "username": f"user{user_id}", "discriminator": "0001", "avatar": None}
+		return {}
+
+	client.http.request = request
+	client._connection.user = fake_self
+	client.prefixes.append(f"<@{fake_self.id}> ")
+	client.prefixes.append(f"<@!{fake_self.id}> ")
+	client.prefixes.append(f"bpid{os.getpid()} ")
+	client.rebuild_prefixes()
+	client.active = True
+	return client, failed, requests
+
+
+def build_messages(client, args, count: int):
+	rng = random.Random(args.seed)
+	guilds = [types.SimpleNamespace(id=1000 + x, name=f"guild{x}", emojis=[], me=fake_self, members=[], roles=[]) for x in range(args.guilds)]
+	guilds.append(types.SimpleNamespace(id=364480908528451584, name="home", emojis=[], me=fake_self, members=[], roles=[]))
+	# one guild that the guild-filtered handlers (chat_cleaner, uwu) are registered for
+	channels = [FakeChannel(5000 + x, rng.choice(guilds)) for x in range(args.guilds * 3)]
+	users = [fake_user(9000 + x) for x in range(args.users)]
+	dm_channels = [FakeChannel(7000 + x) for x in range(len(users))]
+	guild_prefix_guild = guilds[0]
+	client.set_guild_prefixes(guild_prefix_guild.id, ["arbys "])
+	prefixes = [client.default_prefix, *config_prefixes(client), f"<@{fake_self.id}> ", f"<@!{fake_self.id}> ", f"bpid{os.getpid()} "]
+	commands = args.commands.split(",") if args.commands else default_commands
+
+	messages = []
+	for i in range(count):
+		author = rng.choice(users)
+		if rng.random() < args.dm:
+			channel, guild = dm_channels[author.id - 9000], None
+		else:
+			channel = rng.choice(channels)
+			guild = channel.guild
+		roll = rng.random()
+		if roll < args.commands_share:
+			used_prefix = "arbys " if guild is guild_prefix_guild and rng.random() < 0.3 else rng.choice(prefixes)
+			content = f"{used_prefix}{rng.choice(commands)}{rng.choice(['', ' some arguments', ' sos'])}"
+		elif roll < args.commands_share + args.mentions:
+			content = f"hey <@!{fake_self.id}> what's up"
+		else:
+			content = rng.choice(chat_lines)
+		attachments = []
+		if rng.random() < args.attachments:
+			attachments = [FakeAttachment(i, rng.choice(attachment_names), rng.randint(1000, 100000))]
+		messages.append(FakeMessage(i, content, guild, channel, author, attachments))
+	return messages
+
+
+def config_prefixes(client):
+	return [x for x in client.prefixes if not x.startswith("<@") and not x.startswith("bpid")]
+
+
+async def settle():
+	# waits for the handler tasks messages fanned out to
+	while len(asyncio.all_tasks()) > 1:
+		await asyncio.sleep(0)
+
+
+async def run_throughput(client, messages, concurrency: int) -> float:
+	queue = list(reversed(messages))
+
+	async def worker():
+		while queue:
+			await client.on_message(queue.pop())
+
+	start = time.perf_counter()
+	await asyncio.gather(*[worker() for _ in range(concurrency)])
+	await settle()
+	return time.perf_counter() - start
+
+
+async def run_steady(client, messages, rate: float):
+	# Feeds messages in at `rate` per second, returning how long each on_message call took from when it was due
+	loop = asyncio.get_event_loop()
+	delays = []
+
+	async def handle(message, due):
+		await client.on_message(message)
+		delays.append(loop.time() - due)
+
+	start = loop.time()
+	for index, message in enumerate(messages):
+		due = start + index / rate
+		if due > loop.time():
+			await asyncio.sleep(due - loop.time())
+		loop.create_task(handle(message, due))
+	await settle()
+	return loop.time() - start, sorted(delays)
+
+
+def handler_report(client, top: int):
+	lines = [f"{'handler':<48} {'calls':>8} {'mean ms':>9} {'p99 ms':>9} {'cpu us/call':>12} {'errors':>7}"]
+	for (kind, module, name), timing in client.metrics.top_handlers(top):
+		calls = timing.wall.count
+		lines.append(f"{f'{kind} {module}.{name}':<48} {calls:>8} {timing.wall.mean*1000:>9.3f} {timing.wall.percentile(99)*1000:>9.3f} "
+					f"{timing.cpu_total / max(calls, 1) * 1000000:>12.1f} {timing.errors:>7}")
+	return "\n".join(lines)
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Pushes fake messages through the bot's message pipeline and reports what it costs")
+	parser.add_argument("--messages", type=int, default=20000, help="messages in the timed run")
+	parser.add_argument("--concurrency", type=int, default=50, help="messages in flight at once in the timed run")
+	parser.add_argument("--rate", type=float, default=None, help="feed messages at this many per second instead of as fast as possible")
+	parser.add_argument("--commands-share", type=float, default=0.3, help="share of messages that are commands")
+	parser.add_argument("--commands", default=None, help=f"comma separated commands to use (default: {','.join(default_commands)})")
+	parser.add_argument("--mentions", type=float, default=0.05, help="share of messages that mention the bot without a command")
+	parser.add_argument("--attachments", type=float, default=0.02, help="share of messages with an attachment")
+	parser.add_argument("--dm", type=float, default=0.1, help="share of messages sent as DMs")
+	parser.add_argument("--guilds", type=int, default=20)
+	parser.add_argument("--users", type=int, default=500)
+	parser.add_argument("--modules", default=None, help="comma separated modules to load (default: main.py's enabled_modules)")
+	parser.add_argument("--log-messages", action="store_true", help="leave config.log_messages on (logging itself is off either way)")
+	parser.add_argument("--sequential-handlers", action="store_true", help="run message handlers one after the other, not concurrently")
+	parser.add_argument("--allocation-messages", type=int, default=2000, help="messages in the tracemalloc run (0 to skip it)")
+	parser.add_argument("--top", type=int, default=20, help="handlers to list")
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+
+	workdir = tempfile.mkdtemp(prefix="load_harness_")
+	os.chdir(workdir)  # modules that write files (attachments, logs) write them here
+	os.makedirs("attachments", exist_ok=True)
+
+	client, failed, requests = setup(args)
+	for name, reason in failed.items():
+		print(f"module {name} not loaded: {reason}")
+	print(f"{len(client._message_handlers)} message handlers, {len(client._command_lookup)} command triggers, "
+		f"{args.messages} messages ({args.commands_share:.0%} commands, {args.dm:.0%} DMs, {args.attachments:.0%} with attachments)")
+
+	messages = build_messages(client, args, args.messages)
+	gc_before = [x["collections"] for x in gc.get_stats()]
+	if args.rate:
+		elapsed, delays = client.loop.run_until_complete(run_steady(client, messages, args.rate))
+		print(f"\nsteady run: {len(messages) / elapsed:.0f} msgs/sec (asked for {args.rate:.0f}), on_message finished "
+			f"{statistics.median(delays)*1000:.2f} ms after it was due at p50, {delays[int(len(delays) * 0.99) - 1]*1000:.2f} ms at p99")
+	else:
+		elapsed = client.loop.run_until_complete(run_throughput(client, messages, args.concurrency))
+		print(f"\nthroughput: {len(messages) / elapsed:.0f} msgs/sec ({elapsed:.2f}s, {args.concurrency} in flight)")
+	gc_runs = [x["collections"] - y for x, y in zip(gc.get_stats(), gc_before)]
+	sends = sum(x.sent for x in {x.channel for x in messages})
+	print(f"{client.command_count} commands run, {client.rejected_command_count} refused by rate limits, {sends} messages sent, "
+		f"{FakeMessage.reactions_added} reactions, {len(requests)} other REST requests")
+	print(f"garbage collections per 1000 messages: " + ", ".join(f"gen{x} {y * 1000 / len(messages):.1f}" for x, y in enumerate(gc_runs)))
+	print(f"\nper handler, by CPU time:\n{handler_report(client, args.top)}")
+
+	if args.allocation_messages:
+		args.seed += 1
+		messages = build_messages(client, args, args.allocation_messages)
+		gc.collect()
+		tracemalloc.start()
+		before = tracemalloc.take_snapshot()
+		client.loop.run_until_complete(run_throughput(client, messages, args.concurrency))
+		after = tracemalloc.take_snapshot()
+		current, peak = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+		filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<unknown>")]
+		stats = after.filter_traces(filters).compare_to(before.filter_traces(filters), "filename")
+		grown = sum(x.size_diff for x in stats)
+		blocks = sum(x.count_diff for x in stats)
+		print(f"\nallocations ({len(messages)} messages with tracemalloc on): {grown / len(messages):.0f} bytes and "
+			f"{blocks / len(messages):.1f} blocks retained per message, peak {peak / 1024 / 1024:.1f} MiB traced")
+		for stat in stats[:10]:
+			filename = os.path.relpath(stat.traceback[0].filename, root) if stat.traceback[0].filename.startswith(root) else stat.traceback[0].filename
+			print(f"  {filename}: {stat.size_diff / len(messages):+.0f} bytes/msg, {stat.count_diff / len(messages):+.2f} blocks/msg")
+
+
+if __name__ == "__main__":
+	main()
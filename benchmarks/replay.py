@@ -0,0 +1,183 @@
+# Replays a gateway event recording (see recorder.py) into the bot, to reproduce real load offline.
+#
+# Builds the real FrameworkClient with the modules from main.py's enabled_modules, like load_harness.py, but instead of
+# calling on_message with fake messages it hands each recorded event to discord.py's own parser for it, the same way the
+# gateway connection does. So discord.py builds the guilds, channels, members and messages from the recorded data and
+# dispatches on_message, on_reaction_add, on_member_join and so on exactly as it would live. The recording has to start
+# with READY and the guilds' GUILD_CREATEs for that to work, which recordings made from startup do.
+#
+# The bot's ready handlers aren't run (they'd start servers and talk to other services), only the part of on_ready that
+# sets up the message cache and the mention prefixes. REST requests are answered by a stub that counts them and returns
+# the least discord.py will accept: sent messages come back as messages from the bot, user lookups as a user, anything
+# else as an empty object.
+#
+# Events are fed at the pace they were recorded (--speed 1), at a multiple of it, or as fast as the bot keeps up with
+# (--speed 0). Then reports events per second, how far behind the recording's timing the bot fell, the cost of
+# discord.py's parsing per event type, REST requests by route, and the per-handler cost from client.metrics.
+#
+# Run from the repository root with:  python benchmarks/replay.py recordings/events-....rec [--help for the options]
+
+import argparse
+import asyncio
+import datetime
+import itertools
+import os
+import statistics
+import tempfile
+import time
+
+import load_harness  # also puts the repository root on the path
+
+
+def setup(args):
+	import config
+	config.terminal_loglevel = -1
+	config.file_loglevel = -1
+	config.log_messages = args.log_messages
+	config.lazy_modules = False
+	config.record_file = None  # don't record the replay
+	if args.unpaced_sends:
+		config.outbound_rate = (1000000, 1.0)
+
+	from client import client
+	import cache
+	import discord
+	import loader
+
+	failed = {}
+	for name in args.modules.split(",") if args.modules else load_harness.read_enabled_modules():
+		try:
+			loader.activate(name)
+		except Exception as e:
+			failed[name] = f"{type(e).__name__}: {e}"
+
+	cache.apply_intents(client)
+	requests = {}
+	ids = itertools.count()
+
+	def snowflake():
+		return str(discord.utils.time_snowflake(datetime.datetime.utcnow()) + next(ids) % 4096)
+
+	def bot_user():
+		user = client.user
+		return {"id": str(user.id), "username": user.name, "discriminator": user.discriminator, "avatar": None, "bot": True}
+
+	async def request(route, *args, **kwargs):
+		key = f"{route.method} {route.path}"
+		requests[key] = requests.get(key, 0) + 1
+		last = route.url.rstrip("/").rsplit("/", 1)[-1]
+		if (route.method == "POST" and route.path == "/channels/{channel_id}/messages") or route.path == "/channels/{channel_id}/messages/{message_id}":
+			payload = kwargs.get("json", None) or {}
+			embed = payload.get("embed", None)
+			return {"id": snowflake() if route.method == "POST" else last, "channel_id": str(route.channel_id), "author": bot_user(),
+					"content": payload.get("content", None) or "", "attachments": [], "embeds": [embed] if embed else [], "mentions": [],
+					"mention_roles": [], "mention_everyone": False, "pinned": False, "tts": False, "type": 0,
+					"timestamp": datetime.datetime.utcnow().isoformat() + "+00:00", "edited_timestamp": None}
+		if route.method == "GET" and route.path == "/users/{user_id}":
+			return {"id": last, "username": f"user{last}", "discriminator": "0001", "avatar": None}
+		return {}
+
+	client.http.request = request
+	return client, failed, requests
+
+
+def ready(client) -> None:
+	# What on_ready would do here, less the ready handlers and the presence update
+	import cache
+	import config
+	state = client._connection
+	if state._ready_task is not None:
+		state._ready_task.cancel()  # waits for the guilds and then dispatches on_ready, which isn't wanted here
+	cache.install(client)
+	client.prefixes.append(f"<@{client.user.id}> ")
+	client.prefixes.append(f"<@!{client.user.id}> ")
+	if not config.no_bpid_prefix:
+		client.prefixes.append(f"bpid{os.getpid()} ")
+	client.rebuild_prefixes()
+	if client._no_boot_prefixes:
+		client.default_prefix = f"<@{client.user.id}> "
+	client.active = True
+
+
+async def replay(client, frames, speed: float):
+	loop = asyncio.get_event_loop()
+	parsers = client._connection.parsers
+	counts = {}
+	parse_times = {}
+	skipped = {}
+	lateness = []
+	start = loop.time()
+	for offset, event, data in frames:
+		if speed:
+			due = start + offset / speed
+			if due > loop.time():
+				await asyncio.sleep(due - loop.time())
+			lateness.append(loop.time() - due)
+		else:
+			await asyncio.sleep(0)  # lets the handlers the last event started get going
+		parser = parsers.get(event, None)
+		if parser is None:
+			skipped[event] = skipped.get(event, 0) + 1
+			continue
+		if event != "READY" and client.user is None:
+			skipped[event] = skipped.get(event, 0) + 1  # recordings that didn't start at READY
+			continue
+		before = time.perf_counter()
+		parser(data)
+		parse_times.setdefault(event, []).append(time.perf_counter() - before)
+		counts[event] = counts.get(event, 0) + 1
+		if event == "READY":
+			ready(client)
+	fed = loop.time() - start
+	await load_harness.settle()
+	return counts, parse_times, skipped, sorted(lateness), fed, loop.time() - start
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Replays a recording of gateway events into the bot and reports what it costs")
+	parser.add_argument("recording", help="file recorded with config.record_file set")
+	parser.add_argument("--speed", type=float, default=1.0, help="multiple of the recorded pace to replay at, 0 for as fast as possible")
+	parser.add_argument("--limit", type=int, default=None, help="stop after this many events")
+	parser.add_argument("--modules", default=None, help="comma separated modules to load (default: main.py's enabled_modules)")
+	parser.add_argument("--unpaced-sends", action="store_true", help="don't pace sends to Discord's per channel rate limit")
+	parser.add_argument("--log-messages", action="store_true", help="leave config.log_messages on (logging itself is off either way)")
+	parser.add_argument("--top", type=int, default=20, help="handlers to list")
+	args = parser.parse_args()
+	recording = os.path.abspath(args.recording)
+
+	workdir = tempfile.mkdtemp(prefix="replay_")
+	os.chdir(workdir)  # modules that write files (attachments, logs) write them here
+	os.makedirs("attachments", exist_ok=True)
+
+	import recorder
+	started, frames = recorder.read(recording)
+	if args.limit is not None:
+		frames = itertools.islice(frames, args.limit)
+
+	client, failed, requests = setup(args)
+	for name, reason in failed.items():
+		print(f"module {name} not loaded: {reason}")
+	print(f"{len(client._message_handlers)} message handlers, {len(client._command_lookup)} command triggers, "
+		f"replaying a recording started {started.strftime('%Y-%m-%d %H:%M:%S')} UTC at {f'{args.speed:g}x' if args.speed else 'full speed'}")
+
+	counts, parse_times, skipped, lateness, fed, elapsed = client.loop.run_until_complete(replay(client, frames, args.speed))
+	total = sum(counts.values())
+	print(f"\n{total} events in {elapsed:.2f}s ({total / max(fed, 1e-9):.0f} events/sec fed, {elapsed - fed:.2f}s for the handlers to finish)")
+	if lateness:
+		print(f"fell behind the recording by {statistics.median(lateness)*1000:.2f} ms at p50, {lateness[int(len(lateness) * 0.99) - 1]*1000:.2f} ms "
+			f"at p99, {lateness[-1]*1000:.2f} ms at worst")
+	for event, number in skipped.items():
+		print(f"skipped {number} {event} events")
+	print(f"{client.command_count} commands run, {client.rejected_command_count} refused by rate limits")
+
+	print(f"\n{'event':<28} {'count':>8} {'parse us mean':>14} {'parse us max':>13}")
+	for event, times in sorted(parse_times.items(), key=lambda x: -sum(x[1])):
+		print(f"{event:<28} {len(times):>8} {statistics.mean(times)*1000000:>14.1f} {max(times)*1000000:>13.1f}")
+	print(f"\nREST requests ({sum(requests.values())}):")
+	for route, number in sorted(requests.items(), key=lambda x: -x[1]):
+		print(f"  {route}: {number}")
+	print(f"\nper handler, by CPU time:\n{load_harness.handler_report(client, args.top)}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,352 @@
+# Local stand-in for Discord's REST API, for measuring how many requests each command makes and what they cost.
+#
+# Most of a command's latency is REST round trips: `time` sends three messages and deletes two, `info` looks the user up
+# and posts up to three embeds, `markov` pages through up to 3000 messages of history 100 at a time. This serves the
+# endpoints the bot uses from an aiohttp server on localhost (in its own thread with its own event loop, so it doesn't
+# compete with the bot's), with discord.http.Route.BASE pointed at it, so discord.py makes the real requests, with its
+# real rate limit handling, against a server that:
+# - answers after --latency ms, give or take --jitter ms
+# - answers a --rate-limit-share of requests with a 429 telling discord.py to retry after --retry-after ms
+# - makes up channel history (--history messages deep per channel), users, and the messages the bot sends
+#
+# Then runs a suite of commands against the real FrameworkClient, one at a time, each --repeat times from a different
+# user, and reports per command: wall time from on_message until everything it started has finished, REST calls made,
+# HTTP round trips (which include the retries after 429s), the time spent waiting on REST, and which routes were called.
+#
+# Run from the repository root with:  python benchmarks/rest_standin.py [--help for the options]
+# The suite is default_suite below, or a file with one command per line given with --suite. Commands are written
+# without a prefix, and {bot}, {user}, {channel} and {guild} are replaced with the IDs of the stand-in's objects.
+
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+import load_harness  # also puts the repository root on the path
+import replay
+
+default_suite = [
+	"ping",
+	"time",
+	"about",
+	"help",
+	"info",
+	"info <@!{user}>",
+	"info {channel}",
+	"markov",
+	"markov <@!{user}>",
+	"beef",
+	"morse sos",
+	"notacommand",
+]
+
+# route segment -> name of the ID that follows it, so concrete paths can be reported as discord.py's route templates
+id_names = {"channels": "channel_id", "messages": "message_id", "users": "user_id", "guilds": "guild_id", "members": "member_id",
+			"roles": "role_id", "webhooks": "webhook_id"}
+
+
+def template(path: str) -> str:
+	parts = path.split("/")
+	for index in range(1, len(parts)):
+		if parts[index - 1] == "reactions" and parts[index] != "@me":
+			parts[index] = "{emoji}"
+		elif parts[index].isdigit():
+			parts[index] = "{" + id_names.get(parts[index - 1], "id") + "}"
+	return "/".join(parts)
+
+
+def snowflake(when: datetime.datetime, sequence: int = 0) -> str:
+	return str(((int(when.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000) - 1420070400000) << 22) + sequence % 4096)
+
+
+def timestamp(when: datetime.datetime) -> str:
+	return when.isoformat() + "+00:00"
+
+
+class StandIn:
+	def __init__(self, args):
+		self.latency = args.latency / 1000
+		self.jitter = args.jitter / 1000
+		self.rate_limit_share = args.rate_limit_share
+		self.retry_after = args.retry_after
+		self.history = args.history
+		self.rng = random.Random(args.seed)
+		self.bot = {"id": "476571656375238657", "username": "standin-bot", "discriminator": "0001", "avatar": None, "bot": True}
+		self.users = [{"id": str(9000 + x), "username": f"user{x}", "discriminator": f"{x:04d}", "avatar": None} for x in range(args.users)]
+		self.guild_id = "1000"
+		self.channel_id = "5000"
+		self.started = datetime.datetime.utcnow()
+		self.sequence = itertools.count()
+		self.round_trips = []  # (method, route template, status) of every request served
+		self.url = None
+		self._loop = None
+		self._runner = None
+
+	def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+		# Starts serving in a thread of its own, returning the base URL to point discord.py at
+		ready = threading.Event()
+
+		def serve():
+			from aiohttp import web
+			self._loop = asyncio.new_event_loop()
+			asyncio.set_event_loop(self._loop)
+			app = web.Application()
+			app.router.add_route("*", "/api/{version}/{path:.*}", self.handle)
+			self._runner = web.AppRunner(app, access_log=None)
+			self._loop.run_until_complete(self._runner.setup())
+			site = web.TCPSite(self._runner, host, port)
+			self._loop.run_until_complete(site.start())
+			bound = site._server.sockets[0].getsockname()
+			self.url = f"http://{bound[0]}:{bound[1]}/api/v7"
+			ready.set()
+			self._loop.run_forever()
+
+		threading.Thread(target=serve, name="rest standin", daemon=True).start()
+		ready.wait()
+		return self.url
+
+	def stop(self) -> None:
+		future = asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop)
+		future.result()
+		self._loop.call_soon_threadsafe(self._loop.stop)
+
+	async def handle(self, request):
+		from aiohttp import web
+		path = "/" + request.match_info["path"]
+		route = template(path)
+		await asyncio.sleep(max(0.0, self.rng.gauss(self.latency, self.jitter)))
+		if self.rng.random() < self.rate_limit_share:
+			self.round_trips.append((request.method, route, 429))
+			# discord.py takes a 429 without a Via header to be Cloudflare banning it rather than a rate limit
+			return self.json({"message": "You are being rate limited.", "retry_after": self.retry_after, "global": False}, 429,
+							{"Via": "1.1 google", "Retry-After": str(max(1, self.retry_after // 1000))})
+		body = await self.body(request)
+		status, data = self.respond(request.method, route, path.split("/"), request.query, body)
+		self.round_trips.append((request.method, route, status))
+		if data is None:
+			return web.Response(status=status)
+		return self.json(data, status)
+
+	@staticmethod
+	def json(data, status: int, headers: dict = None):
+		# discord.py only decodes bodies whose content type is exactly application/json, so no charset like aiohttp's
+		# json_response adds
+		from aiohttp import web
+		return web.Response(body=json.dumps(data).encode("utf-8"), status=status, headers={"Content-Type": "application/json", **(headers or {})})
+
+	@staticmethod
+	async def body(request) -> dict:
+		if request.content_type == "application/json":
+			return await request.json()
+		if request.content_type.startswith("multipart/"):
+			form = await request.post()
+			body = json.loads(form.get("payload_json", "{}"))
+			body["attachments"] = [x.filename for key, x in form.items() if key != "payload_json" and hasattr(x, "filename")]
+			return body
+		return {}
+
+	def message(self, channel_id: str, author: dict, content: str, id: str = None, when: datetime.datetime = None, embeds: list = None,
+				attachments: list = None) -> dict:
+		when = when or datetime.datetime.utcnow()
+		return {"id": id or snowflake(when, next(self.sequence)), "channel_id": channel_id, "guild_id": self.guild_id, "author": author,
+				"content": content, "attachments": attachments or [], "embeds": embeds or [], "mentions": [], "mention_roles": [],
+				"mention_everyone": False, "pinned": False, "tts": False, "type": 0, "timestamp": timestamp(when), "edited_timestamp": None}
+
+	def user(self, user_id: str) -> dict:
+		# Any ID is a user, made up if it isn't one of the stand-in's own, so lookups like `about`'s are measured on their
+		# normal path rather than on a 404
+		for user in self.users:
+			if user["id"] == user_id:
+				return user
+		if user_id == self.bot["id"]:
+			return self.bot
+		return {"id": user_id, "username": f"user{user_id}", "discriminator": "0001", "avatar": None}
+
+	def respond(self, method: str, route: str, parts: list, query, body: dict):
+		if route == "/users/@me" and method == "GET":
+			return 200, self.bot
+		if route == "/users/{user_id}" and method == "GET":
+			return 200, self.user(parts[2])
+		if route == "/users/@me/channels" and method == "POST":
+			return 200, {"id": str(7000 + int(body["recipient_id"]) % 1000), "type": 1, "recipients": [self.user(str(body["recipient_id"]))]}
+		if route == "/channels/{channel_id}" and method == "GET":
+			return 200, {"id": parts[2], "type": 0, "guild_id": self.guild_id, "name": f"channel-{parts[2]}", "position": 0, "permission_overwrites": []}
+		if route == "/channels/{channel_id}/messages" and method == "POST":
+			embed = body.get("embed", None)
+			attachments = [{"id": snowflake(datetime.datetime.utcnow(), next(self.sequence)), "filename": x, "size": 0, "url": f"{self.url}/{x}",
+							"proxy_url": f"{self.url}/{x}"} for x in body.get("attachments", [])]
+			return 200, self.message(parts[2], self.bot, body.get("content", None) or "", embeds=[embed] if embed else [], attachments=attachments)
+		if route == "/channels/{channel_id}/messages" and method == "GET":
+			return 200, self.history_page(parts[2], int(query.get("limit", 50)), query.get("before", None))
+		if route == "/channels/{channel_id}/messages/{message_id}":
+			if method == "DELETE":
+				return 204, None
+			return 200, self.message(parts[2], self.bot if method == "PATCH" else self.rng.choice(self.users), body.get("content", None) or "",
+									id=parts[4])
+		if "/reactions" in route or route == "/channels/{channel_id}/typing":
+			return 204, None
+		if route == "/guilds/{guild_id}/members/{member_id}" and method == "GET":
+			return 200, {"user": self.user(parts[4]), "roles": [], "joined_at": timestamp(self.started), "deaf": False, "mute": False}
+		return 200, {}
+
+	def history_page(self, channel_id: str, limit: int, before: str = None) -> list:
+		# Messages one a minute going back from when the stand-in started, newest first, self.history of them in all
+		newest = 0 if before is None else (self.started - self.created(before)) // datetime.timedelta(minutes=1) + 1
+		messages = []
+		for index in range(max(newest, 0), min(newest + limit, self.history)):
+			when = self.started - datetime.timedelta(minutes=index)
+			messages.append(self.message(channel_id, self.users[index % len(self.users)], self.rng.choice(load_harness.chat_lines),
+										id=snowflake(when), when=when))
+		return messages
+
+	@staticmethod
+	def created(id: str) -> datetime.datetime:
+		return datetime.datetime.utcfromtimestamp(((int(id) >> 22) + 1420070400000) / 1000)
+
+	def guild(self) -> dict:
+		# GUILD_CREATE payload for the guild the commands are run in
+		member = lambda user: {"user": user, "roles": [], "joined_at": timestamp(self.started), "deaf": False, "mute": False}
+		return {"id": self.guild_id, "name": "standin", "owner_id": self.users[0]["id"], "region": "us-east", "icon": None,
+				"roles": [{"id": self.guild_id, "name": "@everyone", "permissions": "104324673", "position": 0, "color": 0, "hoist": False,
+							"managed": False, "mentionable": False}],
+				"channels": [{"id": self.channel_id, "type": 0, "name": "general", "position": 0, "permission_overwrites": [], "topic": None}],
+				"members": [member(self.bot)] + [member(x) for x in self.users], "member_count": len(self.users) + 1, "presences": [],
+				"voice_states": [], "emojis": [], "features": [], "verification_level": 0, "default_message_notifications": 0,
+				"explicit_content_filter": 0, "mfa_level": 0, "large": False, "unavailable": False}
+
+
+def setup(args, standin: StandIn):
+	import config
+	config.terminal_loglevel = -1
+	config.file_loglevel = -1
+	config.lazy_modules = False
+	config.record_file = None
+
+	from client import client
+	import cache
+	import discord
+	import loader
+
+	failed = {}
+	for name in args.modules.split(",") if args.modules else load_harness.read_enabled_modules():
+		try:
+			loader.activate(name)
+		except Exception as e:
+			failed[name] = f"{type(e).__name__}: {e}"
+
+	discord.http.Route.BASE = standin.start(port=args.port)
+	cache.apply_intents(client)
+	state = client._connection
+	data = client.loop.run_until_complete(client.http.static_login("standin", bot=True))
+	state.user = discord.ClientUser(state=state, data=data)
+	state.parsers["GUILD_CREATE"](standin.guild())
+	replay.ready(client)
+
+	calls = []  # (route, seconds, error) of every REST call discord.py made, however many round trips it took
+	request = client.http.request
+
+	async def timed_request(route, *args, **kwargs):
+		start = time.perf_counter()
+		error = None
+		try:
+			return await request(route, *args, **kwargs)
+		except Exception as e:
+			error = type(e).__name__
+			raise
+		finally:
+			calls.append((f"{route.method} {route.path}", time.perf_counter() - start, error))
+
+	client.http.request = timed_request
+	return client, failed, calls
+
+
+async def run_command(client, standin: StandIn, calls: list, text: str, author: dict) -> dict:
+	prefix = client.default_prefix
+	state = client._connection
+	channel = client.get_channel(int(standin.channel_id))
+	data = standin.message(standin.channel_id, author, prefix + text)
+	data["member"] = {"roles": [], "joined_at": timestamp(standin.started), "deaf": False, "mute": False}
+	message = state.create_message(channel=channel, data=data)
+	del calls[:]
+	trips = len(standin.round_trips)
+	refused = client.rejected_command_count
+	start = time.perf_counter()
+	await client.on_message(message)
+	await load_harness.settle()
+	wall = time.perf_counter() - start
+	served = standin.round_trips[trips:]
+	return {"wall": wall, "calls": list(calls), "round_trips": len(served), "limited": sum(1 for x in served if x[2] == 429),
+			"refused": client.rejected_command_count > refused}
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Runs commands against a local stand-in for Discord's REST API and reports what each one costs in requests")
+	parser.add_argument("--suite", default=None, help="file with one command per line (default: the suite in this script)")
+	parser.add_argument("--repeat", type=int, default=3, help="runs of each command, each from a different user")
+	parser.add_argument("--latency", type=float, default=50.0, help="ms the stand-in takes to answer")
+	parser.add_argument("--jitter", type=float, default=10.0, help="standard deviation of the latency, ms")
+	parser.add_argument("--rate-limit-share", type=float, default=0.0, help="share of requests answered with a 429")
+	parser.add_argument("--retry-after", type=int, default=250, help="ms the 429s ask discord.py to wait")
+	parser.add_argument("--history", type=int, default=5000, help="messages of history in each channel")
+	parser.add_argument("--users", type=int, default=20)
+	parser.add_argument("--modules", default=None, help="comma separated modules to load (default: main.py's enabled_modules)")
+	parser.add_argument("--port", type=int, default=0, help="port for the stand-in (default: any free one)")
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+
+	suite = default_suite
+	if args.suite:
+		with open(args.suite, encoding="utf-8") as f:
+			suite = [x.strip() for x in f if x.strip() and not x.startswith("#")]
+
+	workdir = tempfile.mkdtemp(prefix="rest_standin_")
+	os.chdir(workdir)  # modules that write files (attachments, logs) write them here
+	os.makedirs("attachments", exist_ok=True)
+
+	standin = StandIn(args)
+	client, failed, calls = setup(args, standin)
+	for name, reason in failed.items():
+		print(f"module {name} not loaded: {reason}")
+	print(f"stand-in at {standin.url}: {args.latency:g} ms latency (±{args.jitter:g}), {args.rate_limit_share:.0%} of requests rate limited "
+		f"for {args.retry_after} ms, {args.history} messages of history per channel")
+
+	names = {"bot": standin.bot["id"], "user": standin.users[1]["id"], "channel": standin.channel_id, "guild": standin.guild_id}
+	results = {}
+	for text in suite:
+		command = text.format(**names)
+		for run in range(args.repeat):
+			author = standin.users[(run + 2) % len(standin.users)]
+			results.setdefault(text, []).append(client.loop.run_until_complete(run_command(client, standin, calls, command, author)))
+
+	print(f"\n{'command':<24} {'runs':>5} {'wall ms':>9} {'max ms':>9} {'calls':>6} {'trips':>6} {'429s':>5} {'REST ms':>9} {'errors':>7}")
+	for text, runs in results.items():
+		counted = [x for x in runs if not x["refused"]] or runs
+		note = f"  ({len(runs) - len(counted)} refused by the command's rate limit)" if len(counted) < len(runs) else ""
+		print(f"{text[:24]:<24} {len(counted):>5} {statistics.mean(x['wall'] for x in counted)*1000:>9.1f} {max(x['wall'] for x in counted)*1000:>9.1f} "
+			f"{statistics.mean(len(x['calls']) for x in counted):>6.1f} {statistics.mean(x['round_trips'] for x in counted):>6.1f} "
+			f"{statistics.mean(x['limited'] for x in counted):>5.1f} {statistics.mean(sum(y[1] for y in x['calls']) for x in counted)*1000:>9.1f} "
+			f"{statistics.mean(sum(1 for y in x['calls'] if y[2]) for x in counted):>7.1f}{note}")
+
+	print("\nREST calls per run, by route:")
+	for text, runs in results.items():
+		counted = [x for x in runs if not x["refused"]] or runs
+		routes = {}
+		for run in counted:
+			for route, seconds, error in run["calls"]:
+				routes[route] = routes.get(route, 0) + 1
+		if routes:
+			print(f"  {text}: " + ", ".join(f"{route} x{number / len(counted):g}" for route, number in sorted(routes.items(), key=lambda x: -x[1])))
+
+	client.loop.run_until_complete(client.http.close())
+	standin.stop()
+
+
+if __name__ == "__main__":
+	main()
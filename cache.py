@@ -0,0 +1,237 @@
+# Cache policy: how many messages are kept per guild/channel, and which gateway intents (and so which member and presence
+# caches) the bot asks Discord for.
+#
+# discord.py keeps the last max_messages messages for the whole bot in one deque, so one busy guild can push everything
+# from the quieter guilds out of the cache, and with 50,000 full message objects in it that deque is most of the bot's
+# memory. QuotaMessageCache replaces that deque with one that also has a quota per guild (or per channel, for channels
+# that need their own), configured in config.py. discord.py makes itself a fresh deque on every full reconnect and when
+# the bot leaves a guild, so ConnectionState's clear() and GUILD_DELETE parser are wrapped to put the same quota cache back
+# each time, and its message lookup to use the cache's index, reading state._messages at the time of the call.
+#
+# discord.py also caches members and presences for every guild by default, and those only matter to a few commands. With
+# config.gateway_intents set to "auto" the bot only subscribes to the events its registered handlers actually need, which
+# also turns off the member and presence caches unless config.cache_members/cache_presences ask for them. Privileged
+# intents (members, presences) are never turned on by "auto" alone, since logging in with one that isn't enabled for the
+# bot in the developer portal fails outright: handlers that need one get a warning instead, and the intent has to be
+# asked for explicitly.
+
+from collections import OrderedDict, deque
+from typing import Dict, Iterator, List, Tuple, Union
+
+import config
+import discord
+import log
+
+
+always_intents = ["guilds", "guild_messages", "dm_messages", "emojis", "voice_states"]
+# guilds and messages are needed for the bot to work at all, emojis and voice states are cheap and used by emoji_stats
+# and music
+handler_intents = {
+	"_reaction_add_handlers": ["guild_reactions", "dm_reactions"],
+	"_reaction_remove_handlers": ["guild_reactions", "dm_reactions"],
+	"_member_join_handlers": ["members"],
+	"_member_remove_handlers": ["members"],
+}
+# client attribute holding a kind of handler -> intents that have to be on if there are any handlers of that kind
+privileged_intents = ["members", "presences"]
+# intents that have to be enabled in the developer portal before the bot can ask for them
+
+
+class QuotaMessageCache:
+	# Drop-in for the deque discord.py keeps cached messages in. Messages are kept in arrival order the same way, but each
+	# scope (a channel with its own quota, otherwise the message's guild, with all DMs sharing one scope) can only hold so
+	# many of them, on top of the overall limit. Messages are also indexed by ID so finding one doesn't mean scanning the
+	# whole cache.
+
+	def __init__(self, maxlen: Union[int, None], guild_quota: Union[int, None] = None, guild_quotas: Dict[int, int] = None,
+					channel_quotas: Dict[int, int] = None):
+		self.maxlen = maxlen
+		self.guild_quota = guild_quota
+		self.guild_quotas = guild_quotas if guild_quotas is not None else {}
+		self.channel_quotas = channel_quotas if channel_quotas is not None else {}
+		self.evicted = 0  # messages dropped because their scope was over its quota
+		self._messages: "OrderedDict[int, discord.Message]" = OrderedDict()
+		self._scopes: Dict[Union[int, None], "deque[int]"] = {}
+		# channel or guild ID (None for DMs) -> IDs of the cached messages in it, oldest first
+
+	def scope(self, message: discord.Message) -> Tuple[Union[int, None], Union[int, None]]:
+		# Returns the scope a message is counted against and that scope's quota (None for no quota)
+		channel_id = message.channel.id
+		if channel_id in self.channel_quotas:
+			return channel_id, self.channel_quotas[channel_id]
+		guild = getattr(message, "guild", None)
+		if guild is None:
+			return None, self.guild_quota
+		return guild.id, self.guild_quotas.get(guild.id, self.guild_quota)
+
+	def append(self, message: discord.Message) -> None:
+		key, quota = self.scope(message)
+		if quota == 0 or message.id in self._messages:
+			return
+		scoped = self._scopes.get(key, None)
+		if scoped is None:
+			scoped = self._scopes[key] = deque()
+		scoped.append(message.id)
+		self._messages[message.id] = message
+
+		if quota is not None and len(scoped) > quota:
+			self._messages.pop(scoped.popleft(), None)
+			self.evicted += 1
+		if self.maxlen is not None and len(self._messages) > self.maxlen:
+			_, oldest = self._messages.popitem(last=False)
+			self._forget(oldest)
+
+	def remove(self, message: discord.Message) -> None:
+		try:
+			del self._messages[message.id]
+		except KeyError:
+			raise ValueError("message is not in the cache") from None
+		self._forget(message)
+
+	def _forget(self, message: discord.Message) -> None:
+		key, _ = self.scope(message)
+		scoped = self._scopes.get(key, None)
+		if scoped is not None:
+			if scoped and scoped[0] == message.id:
+				scoped.popleft()  # the usual case, it's the oldest message overall so it's the oldest in its scope too
+			else:
+				try:
+					scoped.remove(message.id)
+				except ValueError:
+					pass
+			if not scoped:
+				del self._scopes[key]
+
+	def get(self, message_id: int) -> Union[discord.Message, None]:
+		return self._messages.get(message_id, None)
+
+	def clear(self) -> None:
+		self._messages.clear()
+		self._scopes.clear()
+
+	def usage(self) -> List[Tuple[Union[int, None], int]]:
+		# (scope, cached messages) for every scope, biggest first
+		return sorted(((x, len(y)) for x, y in self._scopes.items()), key=lambda x: x[1], reverse=True)
+
+	def __len__(self) -> int:
+		return len(self._messages)
+
+	def __iter__(self) -> Iterator[discord.Message]:
+		return iter(self._messages.values())
+
+	def __reversed__(self) -> Iterator[discord.Message]:
+		return reversed(self._messages.values())
+
+	def __getitem__(self, index):
+		# only here for client.cached_messages, which wraps the cache in a sequence
+		return list(self._messages.values())[index]
+
+	def __contains__(self, message: discord.Message) -> bool:
+		return message.id in self._messages
+
+
+def install(client: discord.Client) -> Union[QuotaMessageCache, None]:
+	# Swaps discord.py's message deque for a QuotaMessageCache, keeping whatever is already cached. Once it's in, the
+	# wrappers below keep it in place through reconnects and guild removals.
+	state = client._connection
+	if state._messages is None or isinstance(state._messages, QuotaMessageCache):
+		return state._messages
+	cache = QuotaMessageCache(state.max_messages, config.message_cache_guild_quota, config.message_cache_guild_quotas,
+								config.message_cache_channel_quotas)
+	_refill(state, cache)
+	log.debug(f"installed quota message cache ({len(cache)} messages carried over)")
+	return cache
+
+
+def _refill(state, cache: QuotaMessageCache) -> None:
+	# Moves whatever discord.py put in state._messages into cache, and makes cache the state's message cache again
+	if state._messages is cache:
+		return
+	cache.clear()
+	for message in state._messages or ():
+		cache.append(message)
+	state._messages = cache
+
+
+def _wrap_connection_state() -> None:
+	# Wraps the ConnectionState methods that replace or scan the message cache. This happens when this module is imported,
+	# before the client is created, because the state looks its parsers up once, when it's made. States that haven't had a
+	# QuotaMessageCache installed behave exactly as before.
+	state_class = discord.state.ConnectionState
+	stock_clear = state_class.clear
+	stock_guild_delete = state_class.parse_guild_delete
+	stock_get_message = state_class._get_message
+
+	def clear(self):
+		cache = getattr(self, "_messages", None)
+		stock_clear(self)
+		if isinstance(cache, QuotaMessageCache) and self._messages is not None:
+			_refill(self, cache)  # emptied, since the deque discord.py just made is
+
+	def parse_guild_delete(self, data):
+		cache = self._messages
+		stock_guild_delete(self, data)
+		if isinstance(cache, QuotaMessageCache) and self._messages is not cache:
+			_refill(self, cache)  # the messages from every other guild, which discord.py copied into a new deque
+
+	def _get_message(self, msg_id):
+		if isinstance(self._messages, QuotaMessageCache):
+			return self._messages.get(msg_id)  # the stock version scans the whole cache
+		return stock_get_message(self, msg_id)
+
+	state_class.clear = clear
+	state_class.parse_guild_delete = parse_guild_delete
+	state_class._get_message = _get_message
+
+
+_wrap_connection_state()
+
+
+def compute_intents(client: discord.Client) -> "discord.Intents":
+	intents = discord.Intents.none()
+	for name in always_intents + config.extra_intents:
+		setattr(intents, name, True)
+	if config.cache_members:
+		intents.members = True
+	if config.cache_presences:
+		intents.presences = True
+	wanted: Dict[str, List[str]] = {}  # privileged intent that's off -> handlers that need it
+	for attribute, names in handler_intents.items():
+		for name in names:
+			if name not in privileged_intents:
+				if getattr(client, attribute):
+					setattr(intents, name, True)
+			elif not getattr(intents, name):
+				for func in getattr(client, attribute):
+					handler = f"{func.__module__}.{func.__name__}()"
+					if handler not in wanted.setdefault(name, []):
+						wanted[name].append(handler)
+	for name, handlers in wanted.items():
+		if handlers:
+			log.warning(f"{', '.join(handlers)} won't get any events: they need the privileged {name} intent, which gateway_intents = "
+						f"\"auto\" leaves off. Enable it for the bot in the developer portal and add \"{name}\" to config.extra_intents")
+	return intents
+
+
+def apply_intents(client: discord.Client) -> None:
+	# Sets the gateway intents and member cache from config.gateway_intents. This has to happen after every module has been
+	# loaded (so in run()) and goes through discord.py's connection state, since the client was created long before then.
+	if getattr(discord, "Intents", None) is None:
+		log.warning("This version of discord.py doesn't support gateway intents (1.5 or newer is needed), using the default caches")
+		return
+	if config.gateway_intents == "auto":
+		intents = compute_intents(client)
+	else:
+		intents = discord.Intents.none()
+		for name in config.gateway_intents:
+			setattr(intents, name, True)
+
+	flags = discord.MemberCacheFlags.from_intents(intents)
+	if not config.cache_members:
+		flags.joined = False  # members can still be looked up on demand with guild.fetch_member()
+	state = client._connection
+	state._intents = intents
+	state.member_cache_flags = flags
+	state._chunk_guilds = intents.members and config.cache_members
+	log.info(f"Gateway intents: {', '.join(x for x, y in intents if y)} (member cache: {'on' if config.cache_members else 'off'}, "
+			f"presence cache: {'on' if intents.presences else 'off'})")
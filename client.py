@@ -1,25 +1,52 @@
-from exceptions import UserBotError, HandlerError
-from typing import List, Callable, Dict, Union
+from exceptions import UserBotError, HandlerError, QueueFullError
+from typing import List, Callable, Dict, Set, Tuple, Union
 
 import asyncio
+import background
+import cache
 import config
 import datetime
 import discord
+import errorreport
+import eventloop
 import log
+import loopmonitor
+import metrics
 import os
+import outbound
 import prefix
+import ratelimit
+import recorder
+import shards
 import sys
+import taskwatch
 import time
 import traceback
+import tracing
+import workers
 
 
 class FrameworkClient(discord.Client):
 	__version__ = "0.5.2.1"
 
-	_background_tasks: List[Callable[[], None]] = []
 	_ready_handlers: List[Callable[[], None]] = []
 	_shutdown_handlers: List[Callable[[], None]] = []
+	_lifecycle_groups: Dict[Callable[[], None], int] = {}
+	# Ready/shutdown handler -> group. Groups run in ascending order, handlers within a group run concurrently.
 	_message_handlers: List[Callable[[discord.Message], None]] = []
+	_message_handler_groups: Dict[Callable[[discord.Message], None], str] = {}
+	# Message handler -> ordering group. When message handlers run concurrently, handlers sharing a group still run one
+	# after another in the order they were registered. Handlers without a group run on their own.
+	_message_handler_timeouts: Dict[Callable[[discord.Message], None], float] = {}
+	# Message handler -> time budget in seconds, for handlers that asked for something other than the configured default.
+	_unfiltered_message_handlers: List[Callable[[discord.Message], None]] = []
+	_guild_message_handlers: Dict[int, List[Callable[[discord.Message], None]]] = {}
+	_channel_message_handlers: Dict[int, List[Callable[[discord.Message], None]]] = {}
+	# Message handlers indexed by the guilds/channels they were registered for, so a message is only given to handlers
+	# that want it. _message_handlers above still holds every handler in registration order.
+	_message_handler_checks: Dict[Callable[[discord.Message], None], Callable[[discord.Message], bool]] = {}
+	# Message handler -> predicate for the filters that can't be indexed (author, bots, ourselves)
+	_message_handler_order: Dict[Callable[[discord.Message], None], int] = {}
 	_member_join_handlers: List[Callable[[discord.Member], None]] = []
 	_member_remove_handlers: List[Callable[[discord.Member], None]] = []
 	_reaction_add_handlers: List[Callable[[discord.Reaction, Union[discord.User, discord.Member]], None]] = []
@@ -48,10 +75,21 @@ class FrameworkClient(discord.Client):
 	bot_name = config.bot_name
 
 	prefixes: List[str] = []
+	guild_prefixes: Dict[int, List[str]] = {}
+	# Guild ID -> extra prefixes accepted in that guild on top of the global ones. Use set_guild_prefixes() to change these
+	# at runtime so the matchers get rebuilt.
 	default_prefix: str = None
 	log_all_messages: bool = config.log_messages
 	message_count: int = 0
 	command_count: int = 0
+	rejected_command_count: int = 0
+	# commands refused by rate limits before they got to run
+	handler_timeouts: Dict[str, int] = {}
+	# "module.handler" -> number of times that message handler has blown its time budget
+	skipped_handler_count: int = 0
+	# number of message handler invocations avoided because the handler's filters didn't match the message
+	lifecycle_timings: Dict[str, float] = {}
+	# "phase module.handler" -> seconds that ready/shutdown handler took the last time it ran
 	first_execution: float = None
 	first_execution_dt: datetime.datetime = None
 
@@ -59,7 +97,35 @@ class FrameworkClient(discord.Client):
 		super().__init__(*args, **kwargs)
 		self._has_been_readied: bool = False
 		self.active: bool = False
+		self._handler_tasks: Set[asyncio.Task] = set()
+		# message handler fan-outs still running. The event loop only keeps weak references to tasks, so they're held here
+		# to keep them from being garbage collected halfway through
 		self.prefixes = [x.lower() for x in config.prefixes]
+		self.guild_prefixes = {guild: [x.lower() for x in prefixes] for guild, prefixes in config.guild_prefixes.items()}
+		self._prefix_matcher: prefix.PrefixMatcher = None
+		self._guild_prefix_matchers: Dict[int, prefix.PrefixMatcher] = {}
+		self.rebuild_prefixes()
+		self.workers = workers.WorkerScheduler(config.command_cost_classes)
+		self.watchdog = taskwatch.Watchdog(config.task_budget, config.task_budgets)
+		self.metrics = metrics.Registry(self.watchdog)
+		self.loop_monitor = None
+		if config.loop_monitor_threshold is not None:
+			self.loop_monitor = loopmonitor.LoopMonitor(config.loop_monitor_threshold, config.loop_monitor_interval, config.loop_monitor_window)
+		self.background_jobs = background.BackgroundScheduler(self.metrics.measure)
+		self.outbound = outbound.OutboundQueue(config.outbound_rate)
+		self.errors = errorreport.ErrorReporter(config.error_dedupe_window)
+		self.background_jobs.add(background.Job(self.errors.flush, config.error_report_interval))
+		self.background_jobs.add(background.Job(self.watchdog.check, config.task_watchdog_interval))
+		if shards.connection is not None:
+			self.background_jobs.add(background.Job(self._report_shard_counters, config.shard_report_interval, delay=1.0))
+		if config.tracing:
+			tracing.enable(self)
+		self.recorder = None
+		if config.record_file is not None:
+			path = config.record_file.format(time=datetime.datetime.utcnow().strftime("%Y%m%d-%H%M%S"), shard=shards.shard_id or 0)
+			self.recorder = recorder.Recorder(path, config.record_events, config.record_redact, lambda: self.prefixes)
+			self.recorder.install(self)
+			self.background_jobs.add(background.Job(self.recorder.flush, config.record_flush_interval))
 		try:
 			self.default_prefix = self.prefixes[0]
 			self._no_boot_prefixes = False
@@ -99,7 +165,8 @@ class FrameworkClient(discord.Client):
 
 		log.debug("all functions good to run (are coroutines)")
 
-		log.info(f"Bot started at {str(self.first_execution_dt)} ({self.first_execution})")
+		cache.apply_intents(self)
+		log.info(f"Bot started at {str(self.first_execution_dt)} ({self.first_execution}) on the {eventloop.implementation} event loop")
 		super().run(*args, **kwargs)
 
 	# ==========
@@ -107,6 +174,7 @@ class FrameworkClient(discord.Client):
 	# ==========
 
 	async def on_ready(self):
+		cache.install(self)
 		if self._has_been_readied:
 			await self.change_presence(activity=discord.Game(name=self.boot_playing_msg), status=discord.Status.online)
 			log.info("Bot reconnected to Discord")
@@ -117,6 +185,7 @@ class FrameworkClient(discord.Client):
 		self.prefixes.append(f"<@!{self.user.id}> ")
 		if not config.no_bpid_prefix:
 			self.prefixes.append(f"bpid{os.getpid()} ")  # Add our own Bot Process ID to differentiate between instances
+		self.rebuild_prefixes()
 
 		if self._no_boot_prefixes:
 			# we need to add our own then
@@ -125,75 +194,164 @@ class FrameworkClient(discord.Client):
 		else:
 			self.boot_playing_msg = f"{self.default_prefix}help"
 
-		for func in self._ready_handlers:
-			try:
-				await func()
-			except Exception as e:
-				log.warning("Ignoring exception in ready coroutine (see stack trace below)", include_exception=True)
+		await self._run_lifecycle("ready", self._ready_handlers, config.ready_deadline)
 		await self.change_presence(activity=discord.Game(name=self.boot_playing_msg), status=discord.Status.online)
+		self.background_jobs.start(self.loop)
+		if self.loop_monitor is not None:
+			self.loop_monitor.start(self.loop)
 		self.active = True
 		self._has_been_readied = True
 		log.info(f"Bot is ready to go! We are @{client.user.name}#{client.user.discriminator} (id: {client.user.id})")
+		if shards.shard_count is not None:
+			log.info(f"Running as shard {shards.shard_id} of {shards.shard_count}, with {len(self.guilds)} servers")
 		log.info(f"Bot process ID is {os.getpid()}. If no_bpid_prefix is disabled this specific instance can be addressed with bpid{os.getpid()}.")
 
 	async def on_shutdown(self):
 		log.debug(f"entering shutdown handler, here's goodbye from on_shutdown()")
-		for func in self._shutdown_handlers:
-			try:
-				await func()
-			except Exception as e:
-				log.warning("Ignoring exception in shutdown coroutine (see stack trace below)", include_exception=True)
-			await asyncio.sleep(0.1)
+		await self._run_lifecycle("shutdown", self._shutdown_handlers, config.shutdown_deadline)
+		self.background_jobs.stop()
+		if self.loop_monitor is not None:
+			self.loop_monitor.stop()
+		if self.recorder is not None:
+			await self.recorder.close()
 		await client.logout()
 		sys.exit(0)
 
+	async def _run_lifecycle(self, phase: str, handlers: List[Callable[[], None]], deadline: Union[float, None]):
+		# Runs ready or shutdown handlers group by group, with every handler in a group running at the same time. The whole
+		# phase has to be done within `deadline` seconds: handlers still running after that are cancelled and any groups
+		# that haven't started yet are skipped, so one hung handler can't hold up startup or shutdown forever.
+		start = time.perf_counter()
+		end = None if deadline is None else self.loop.time() + deadline
+		groups = sorted(set(self._lifecycle_groups.get(x, 0) for x in handlers))
+		for index, group in enumerate(groups):
+			tasks = {self.loop.create_task(self._run_lifecycle_handler(phase, x)): x for x in handlers if self._lifecycle_groups.get(x, 0) == group}
+			_, pending = await asyncio.wait(tasks.keys(), timeout=None if end is None else max(0.0, end - self.loop.time()))
+			if pending:
+				for task in pending:
+					task.cancel()
+					log.warning(f"{phase.capitalize()} handler {tasks[task].__module__}.{tasks[task].__name__}() was still running at the {deadline}s {phase} deadline, cancelled it")
+				await asyncio.wait(pending, timeout=1.0)
+				skipped = [f"{x.__module__}.{x.__name__}()" for x in handlers if self._lifecycle_groups.get(x, 0) in groups[index+1:]]
+				if skipped:
+					log.warning(f"Skipped {phase} handlers that were waiting for the ones above: {', '.join(skipped)}")
+				break
+		log.info(f"{phase.capitalize()} handlers finished in {(time.perf_counter() - start)*1000:.1f} ms ({len(handlers)} handlers in {len(groups)} groups)")
+
+	async def _run_lifecycle_handler(self, phase: str, func: Callable[[], None]):
+		start = time.perf_counter()
+		try:
+			await self.metrics.measure(phase, func)
+		except asyncio.CancelledError:
+			raise
+		except Exception:
+			log.warning(f"Ignoring exception in {phase} coroutine {func.__name__}() (see stack trace below)", include_exception=True)
+		duration = time.perf_counter() - start
+		self.lifecycle_timings[f"{phase} {func.__module__}.{func.__name__}"] = duration
+		log.debug(f"{phase} handler {func.__module__}.{func.__name__}() took {duration*1000:.1f} ms")
+
 	async def on_message(self, message: discord.Message):
 
 		self.message_count += 1
 
-		if self.active:
-			for func in self._message_handlers:
-				try:
-					await func(message)
-				except Exception:
-					log.warning("Ignoring exception in message coroutine (see stack trace below)", include_exception=True)
-		is_cmd, this_prefix = prefix.check_bot_prefix(message.content, self.prefixes)
-		if is_cmd:
-			command = message.content[len(this_prefix):]
-			known_cmd, run_by = prefix.check_command_prefix(command, list(self._command_lookup.keys()))
-			if (self.active is False) and (run_by != "_exec"):
-				return
-			if not known_cmd:
-				# unknown command branch
-				await message.channel.send(self.unknown_command)
-				return
-			await self._command_lookup[run_by](command, message)
+		# While tracing is on, everything done for this message is traced under this span (see tracing.py)
+		with tracing.span("message", id=message.id, channel=message.channel.id, guild=getattr(message.guild, "id", None)):
+			if self.active:
+				handlers = self._select_message_handlers(message)
+				if config.concurrent_message_handlers:
+					# Handlers get their own task so neither a slow handler nor the handlers as a whole hold up the others or
+					# the command dispatch below.
+					if handlers:
+						task = self.loop.create_task(self._fan_out_message(message, handlers))
+						self._handler_tasks.add(task)
+						task.add_done_callback(self._handler_tasks.discard)
+				else:
+					for func in handlers:
+						try:
+							await self.metrics.measure("message", func, message)
+						except Exception:
+							log.warning("Ignoring exception in message coroutine (see stack trace below)", include_exception=True)
+			is_cmd, this_prefix = self.match_prefix(message)
+			if is_cmd:
+				command = message.content[len(this_prefix):]
+				# The first word is pulled out once and resolved with a single dict lookup. Aliases are already keys in
+				# _command_lookup, and alias_lookup folds them back into the trigger they were registered under.
+				token = prefix.get_command_token(command)
+				handler = self._command_lookup.get(token)
+				run_by = self.alias_lookup.get(token, token)
+				if (self.active is False) and (run_by != "_exec"):
+					return
+				if handler is None:
+					# unknown command branch
+					await message.channel.send(self.unknown_command)
+					return
+				await handler(command, message)
+
+	def _select_message_handlers(self, message: discord.Message) -> List[Callable[[discord.Message], None]]:
+		# Handlers without a guild/channel filter, plus the ones indexed under this message's guild and channel, in the
+		# order they were registered. Then the remaining filters get checked on what's left.
+		candidates = self._unfiltered_message_handlers
+		by_guild = self._guild_message_handlers.get(getattr(message.guild, "id", None), None)
+		by_channel = self._channel_message_handlers.get(message.channel.id, None)
+		if by_guild or by_channel:
+			candidates = sorted(candidates + (by_guild or []) + (by_channel or []), key=self._message_handler_order.__getitem__)
+		if self._message_handler_checks:
+			candidates = [x for x in candidates if x not in self._message_handler_checks or self._message_handler_checks[x](message)]
+		self.skipped_handler_count += len(self._message_handlers) - len(candidates)
+		return candidates
+
+	async def _fan_out_message(self, message: discord.Message, handlers: List[Callable[[discord.Message], None]]):
+		# Split the handlers into chains: one chain per ordering group, and one chain each for ungrouped handlers. Chains
+		# run concurrently, handlers within a chain run in registration order.
+		chains: Dict[Union[str, Callable], List[Callable[[discord.Message], None]]] = {}
+		for func in handlers:
+			group = self._message_handler_groups.get(func, None)
+			chains.setdefault(func if group is None else group, []).append(func)
+		await asyncio.gather(*[self._run_handler_chain(chain, message) for chain in chains.values()])
+
+	async def _run_handler_chain(self, chain: List[Callable[[discord.Message], None]], message: discord.Message):
+		for func in chain:
+			await self._run_message_handler(func, message)
+
+	async def _run_message_handler(self, func: Callable[[discord.Message], None], message: discord.Message):
+		timeout = self._message_handler_timeouts.get(func, config.message_handler_timeout)
+		try:
+			if timeout is None:
+				await self.metrics.measure("message", func, message)
+			else:
+				await asyncio.wait_for(self.metrics.measure("message", func, message), timeout=timeout)
+		except asyncio.TimeoutError:
+			name = f"{func.__module__}.{func.__name__}"
+			self.handler_timeouts[name] = self.handler_timeouts.get(name, 0) + 1
+			log.warning(f"Message handler {name}() went over its {timeout} second budget and was cancelled (message id: {message.id}, {self.handler_timeouts[name]} times so far)")
+		except Exception:
+			log.warning("Ignoring exception in message coroutine (see stack trace below)", include_exception=True)
 
 	async def on_reaction_add(self, reaction: discord.Reaction, source: Union[discord.User, discord.Member]):
 		for func in self._reaction_add_handlers:
 			try:
-				await func(reaction, source)
+				await self.metrics.measure("reaction", func, reaction, source)
 			except Exception:
 				log.warning("Ignoring exception in reaction_add coroutine (see stack trace below)", include_exception=True)
 
 	async def on_reaction_remove(self, reaction: discord.Reaction, source: Union[discord.User, discord.Member]):
 		for func in self._reaction_remove_handlers:
 			try:
-				await func(reaction, source)
+				await self.metrics.measure("reaction", func, reaction, source)
 			except Exception:
 				log.warning("Ignoring exception in reaction_remove coroutine (see stack trace below)", include_exception=True)
 
 	async def on_member_join(self, member: discord.Member):
 		for func in self._member_join_handlers:
 			try:
-				await func(member)
+				await self.metrics.measure("member", func, member)
 			except Exception:
 				log.warning("Ignoring exception in member_join coroutine (see stack trace below)", include_exception=True)
 
 	async def on_member_remove(self, member: discord.Member):
 		for func in self._member_remove_handlers:
 			try:
-				await func(member)
+				await self.metrics.measure("member", func, member)
 			except Exception:
 				log.warning("Ignoring exception in member_leave coroutine (see stack trace below)", include_exception=True)
 
@@ -201,30 +359,34 @@ class FrameworkClient(discord.Client):
 	# Decorators
 	# ==========
 
-	def background(self, period: int):
+	def background(self, period: float, mode: str = "fixed_rate", jitter: float = 0.0, misfire: str = "skip", delay: float = 0.0):
+		# Registers a periodic job with the background scheduler, first run `delay` seconds after the bot is ready.
+		# mode is "fixed_rate" (runs every period seconds on a fixed schedule) or "fixed_delay" (waits period seconds after
+		# each run finishes). misfire decides what happens to runs that were missed: "skip" them or "catch_up" on them.
+		# See background.py for the details.
 		def inside(func: Callable[[], None]):
-			nonlocal period
-
-			async def modified_function():
-				await self.wait_until_ready()
-				while not self.is_closed():
-					try:
-						await func()
-					except Exception:
-						log.error(f"Error processing background task {func.__name__}():", include_exception=True)
-					await asyncio.sleep(period)
-
-			self._background_tasks.append(self.loop.create_task(modified_function()))
-			modified_function.__name__ = func.__name__
-			modified_function.__module__ = func.__module__
-			log.debug(f"registered new background task {func.__name__}() with period {period} seconds")
-			return modified_function
+			job = background.Job(func, period, mode=mode, jitter=jitter, misfire=misfire, delay=delay)
+			self.background_jobs.add(job)
+			log.debug(f"registered new background task {func.__name__}() with period {period} seconds ({mode}, misfire policy {misfire})")
+			return func
 		return inside
 
-	def command(self, trigger: str, aliases: List[str] = None):
+	def command(self, trigger: str, aliases: List[str] = None, cost: str = "light", priority: int = 0,
+				user_rate: Tuple[int, float] = None, guild_rate: Tuple[int, float] = None, command_rate: Tuple[int, float] = None):
+		# cost is the command's cost class. Commands in a class listed in config.command_cost_classes are run through the
+		# worker scheduler, so only so many of them run at once and the rest wait in a queue (lower priority values go
+		# first in priority queues). "light" commands run straight away, and "admin" commands can never be queued.
+		# user_rate, guild_rate, and command_rate are (count, seconds) token bucket limits applied per user, per guild (or
+		# DM channel), and across everyone. A refused command gets a single ❌ reaction, and further refusals by the same
+		# bucket are ignored silently until it has a token again.
 		if aliases is None:
 			aliases = []
 
+		user_buckets = ratelimit.store_for(user_rate)
+		guild_buckets = ratelimit.store_for(guild_rate)
+		command_bucket = ratelimit.TokenBucket(*command_rate) if command_rate is not None else None
+		rate_limited = (user_rate, guild_rate, command_rate) != (None, None, None)
+
 		self.cmd_aliases[trigger] = aliases
 		for alias in aliases:
 			self.alias_lookup[alias] = trigger
@@ -233,26 +395,44 @@ class FrameworkClient(discord.Client):
 			nonlocal aliases
 
 			async def new_cmd(command: str, message: discord.Message) -> None:
+				if rate_limited:
+					buckets = []
+					if user_buckets is not None:
+						buckets.append(user_buckets.get(message.author.id))
+					if guild_buckets is not None:
+						buckets.append(guild_buckets.get(message.guild.id if message.guild is not None else message.channel.id))
+					if command_bucket is not None:
+						buckets.append(command_bucket)
+					refused_by = ratelimit.admit(buckets)
+					if refused_by is not None:
+						self.rejected_command_count += 1
+						if not refused_by.notified:
+							refused_by.notified = True
+							try:
+								await message.add_reaction("❌")
+							except discord.HTTPException:
+								pass
+						return
 				try:
 					self.command_count += 1
-					# The following line is the gateway back into external code
-					await func(command, message)
-				except Exception:
-					timestamp = datetime.datetime.utcnow().__str__()
-					stackdump = traceback.format_exc()
-					embed = discord.Embed(title="Internal error", description=f"There was an error processing the command. Here's the stack trace, if necessary (this is also recorded in the log):\n```{stackdump}```", colour=0xf00000)
-					embed = embed.set_footer(text="Error occurred at " + timestamp)
-					await message.channel.send(embed=embed)
-					log.error(f"Error processing command: {message.content}", include_exception=True)
-
-			# now add the trigger plus aliases to the command dict
-			self._command_lookup[trigger] = new_cmd
+					async with self.work_slot(cost, message, priority):
+						# The following line is the gateway back into external code
+						await self.metrics.measure("command", func, command, message)
+				except QueueFullError:
+					await message.channel.send(f"{message.author.mention} The bot is too busy to run that right now, try again in a bit.")
+					log.info(f"Refused command (queue full): {message.content}")
+				except Exception as e:
+					await self.report_command_error(e, message)
+
+			# now add the trigger plus aliases to the command dict. Keys are lowercase since the dispatcher lowercases the
+			# first word of the command before looking it up.
+			self._command_lookup[trigger.lower()] = new_cmd
 			for alias in aliases:  # name shadows but we don't care tbh it's only a tempvar
-				self._command_lookup[alias] = new_cmd
+				self._command_lookup[alias.lower()] = new_cmd
 			new_cmd.__name__ = func.__name__
 			new_cmd.__module__ = func.__module__
 
-			log.debug(f"registered new command handler {func.__name__}() with trigger '{trigger}' and aliases: {aliases}")
+			log.debug(f"registered new command handler {func.__name__}() with trigger '{trigger}', cost class {cost} and aliases: {aliases}")
 			return new_cmd
 		return inner_decorator
 
@@ -266,15 +446,47 @@ class FrameworkClient(discord.Client):
 		log.debug(f"registered new member_remove handler {func.__name__}()")
 		return func
 
-	def message(self, receive_self: bool = True):
+	def message(self, receive_self: bool = True, guilds: List[int] = None, channels: List[int] = None,
+				authors: List[int] = None, ignore_bots: bool = False, group: str = None, timeout: float = None):
+		# guilds and channels restrict the handler to messages sent in those guilds/channels, and are indexed so that the
+		# handler isn't even looked at for other messages. authors, ignore_bots, and receive_self are checked per message.
+		# group and timeout only matter when config.concurrent_message_handlers is on. Handlers registered with the same
+		# group are run one after another instead of concurrently, and timeout overrides config.message_handler_timeout.
 		def inner_decorator(func: Callable[[discord.Message], None]):
-			async def wrapped_handler(message: discord.Message):
-				if not receive_self and message.author.id == client.user.id:
-					return
-				await func(message)
+			self._message_handler_order[func] = len(self._message_handlers)
 			self._message_handlers.append(func)
-			log.debug(f"registered new message handler {func.__name__}()")
-			return wrapped_handler
+
+			# channels are more specific than guilds (a channel is only in one guild) so they win if both are given
+			if channels:
+				for channel_id in channels:
+					self._channel_message_handlers.setdefault(channel_id, []).append(func)
+			elif guilds:
+				for guild_id in guilds:
+					self._guild_message_handlers.setdefault(guild_id, []).append(func)
+			else:
+				self._unfiltered_message_handlers.append(func)
+
+			author_ids = set(authors) if authors else None
+			guild_ids = set(guilds) if (guilds and channels) else None
+			if author_ids or ignore_bots or not receive_self or guild_ids:
+				def check(message: discord.Message) -> bool:
+					if not receive_self and message.author.id == self.user.id:
+						return False
+					if ignore_bots and message.author.bot:
+						return False
+					if author_ids and message.author.id not in author_ids:
+						return False
+					if guild_ids and getattr(message.guild, "id", None) not in guild_ids:
+						return False
+					return True
+				self._message_handler_checks[func] = check
+
+			if group is not None:
+				self._message_handler_groups[func] = group
+			if timeout is not None:
+				self._message_handler_timeouts[func] = timeout
+			log.debug(f"registered new message handler {func.__name__}(){f' in ordering group {group}' if group is not None else ''}")
+			return func
 		return inner_decorator
 
 	def reaction_add(self, func: Callable[[], None]):
@@ -287,20 +499,128 @@ class FrameworkClient(discord.Client):
 		log.debug(f"registered new reaction remove handler {func.__name__}()")
 		return func
 
-	def ready(self, func: Callable[[], None]):
-		self._ready_handlers.append(func)
-		log.debug(f"registered new ready handler {func.__name__}()")
-		return func
-
-	def shutdown(self, func: Callable[[], None]):
-		self._shutdown_handlers.append(func)
-		log.debug(f"registered new shutdown handler {func.__name__}()")
-		return func
+	def ready(self, func: Callable[[], None] = None, group: int = 0):
+		# Can be used bare (@client.ready) or with a group (@client.ready(group=1)). Handlers in the same group run
+		# concurrently and groups run in ascending order, so a handler that needs another one to have finished first should
+		# go in a later group than it.
+		def inner_decorator(func: Callable[[], None]):
+			self._ready_handlers.append(func)
+			self._lifecycle_groups[func] = group
+			log.debug(f"registered new ready handler {func.__name__}() in group {group}")
+			return func
+		return inner_decorator if func is None else inner_decorator(func)
+
+	def shutdown(self, func: Callable[[], None] = None, group: int = 0):
+		# Same as ready() above, groups included
+		def inner_decorator(func: Callable[[], None]):
+			self._shutdown_handlers.append(func)
+			self._lifecycle_groups[func] = group
+			log.debug(f"registered new shutdown handler {func.__name__}() in group {group}")
+			return func
+		return inner_decorator if func is None else inner_decorator(func)
 
 	# ==========
 	# Other Functions
 	# ==========
 
+	async def send(self, channel: discord.abc.Messageable, content: str = None, embed: discord.Embed = None, merge: bool = False,
+					wait: bool = True, **kwargs) -> Union[discord.Message, None]:
+		# Sends a message through the channel's outbound queue instead of straight away (see outbound.py). Returns the message
+		# it was sent in. With merge=True it may be merged with other merge=True messages queued right before or after it,
+		# which is for bursts of output from one command like debug lines, not for replies. With wait=False this returns as
+		# soon as the message is queued, and any error sending it is only logged.
+		return await self.outbound.send(channel, content, embed, merge, wait, **kwargs)
+
+	async def report_command_error(self, exception: Exception, message: discord.Message) -> None:
+		# Called from inside the except block of a failed command. The first time an error happens (see errorreport.py) the
+		# stack trace is posted and logged, repeats just point back to that.
+		record, first = self.errors.record(exception, message.content)
+		timestamp = datetime.datetime.utcnow().__str__()
+		if first:
+			stackdump = traceback.format_exc()
+			embed = discord.Embed(title="Internal error", description=f"There was an error processing the command. Here's the stack trace, if necessary (this is also recorded in the log):\n```{stackdump}```", colour=0xf00000)
+			embed = embed.set_footer(text=f"Error {record.ref} occurred at {timestamp}")
+			log.error(f"Error processing command: {message.content} (error {record.ref})", include_exception=True)
+			sent = await message.channel.send(embed=embed)
+			record.jump_url = getattr(sent, "jump_url", None)
+		else:
+			minutes = max(1, round((time.monotonic() - record.window_start) / 60))
+			await self.send(message.channel, f"Internal error processing the command: error `{record.ref}` ({record.summary}) again, {record.window_count} times in the last {minutes} minute(s). "
+											f"The stack trace was posted {f'here: <{record.jump_url}>' if record.jump_url is not None else 'the first time'}.")
+
+	def work_slot(self, cost: str, message: discord.Message, priority: int = 0):
+		# Async context manager holding a worker slot in the given cost class while the work for a message is done. If the
+		# work has to wait, the user is told their place in the queue, and that notice is removed once the work starts.
+		# Modules can use this directly for expensive parts of otherwise cheap commands, eg.
+		#     async with client.work_slot("heavy", message):
+		notice = None
+
+		async def queued(position: int):
+			nonlocal notice
+			try:
+				notice = await message.channel.send(f"{message.author.mention} Queued behind other {cost} commands (position {position}), it'll run as soon as there's room.")
+			except discord.HTTPException:
+				pass
+
+		async def started():
+			if notice is not None:
+				try:
+					await notice.delete()
+				except discord.HTTPException:
+					pass
+
+		return self.workers.slot(cost, priority, queued, started)
+
+	def shard_counters(self) -> Dict[str, Union[int, float]]:
+		# What this process reports to the shard supervisor (see shards.py)
+		return {
+			"shard": shards.shard_id,
+			"pid": os.getpid(),
+			"guilds": len(self.guilds),
+			"messages": self.message_count,
+			"commands": self.command_count,
+			"rejected_commands": self.rejected_command_count,
+			"voice_clients": len(self.voice_clients),
+			"uptime": time.perf_counter() - self.first_execution,
+		}
+
+	async def _report_shard_counters(self):
+		shards.exchange(self.shard_counters())
+
+	def match_prefix(self, message: discord.Message) -> Tuple[bool, Union[str, None]]:
+		# Checks a message against the global prefixes plus any prefixes for the guild it was sent in. Returns the same
+		# (is_prefixed, prefix) pair as prefix.check_bot_prefix().
+		guild = getattr(message.guild, "id", None)
+		matcher = self._guild_prefix_matchers.get(guild, self._prefix_matcher)
+		return matcher.match(message.content)
+
+	def rebuild_prefixes(self) -> None:
+		# Recompiles the prefix matchers. This needs to be called whenever self.prefixes or self.guild_prefixes is changed
+		# directly; add_prefix(), remove_prefix(), and set_guild_prefixes() already call it.
+		self._prefix_matcher = prefix.PrefixMatcher(self.prefixes)
+		self._guild_prefix_matchers = {guild: prefix.PrefixMatcher(self.prefixes + extra) for guild, extra in self.guild_prefixes.items() if extra}
+		log.debug(f"rebuilt prefix matchers ({len(self._prefix_matcher)} global prefixes, {len(self._guild_prefix_matchers)} guilds with custom prefixes)")
+
+	def add_prefix(self, new_prefix: str) -> None:
+		if new_prefix.lower() not in self.prefixes:
+			self.prefixes.append(new_prefix.lower())
+			self.rebuild_prefixes()
+
+	def remove_prefix(self, old_prefix: str) -> None:
+		if old_prefix.lower() in self.prefixes:
+			self.prefixes.remove(old_prefix.lower())
+			self.rebuild_prefixes()
+
+	def set_guild_prefixes(self, guild_id: int, prefixes: List[str]) -> None:
+		# Replaces the custom prefixes for one guild. An empty list removes the guild's custom prefixes entirely.
+		if prefixes:
+			self.guild_prefixes[guild_id] = [x.lower() for x in prefixes]
+			self._guild_prefix_matchers[guild_id] = prefix.PrefixMatcher(self.prefixes + self.guild_prefixes[guild_id])
+		else:
+			self.guild_prefixes.pop(guild_id, None)
+			self._guild_prefix_matchers.pop(guild_id, None)
+		log.debug(f"set custom prefixes for guild {guild_id}: {prefixes}")
+
 	def basic_help(self, title: str, desc: str, include_prefix: bool = True):
 		# check first that nothing's blank
 		if title.strip() == "" or desc.strip() == "":
@@ -323,4 +643,4 @@ class FrameworkClient(discord.Client):
 		log.debug(f"registered new long_help entry for command {cmd}")
 
 
-client = FrameworkClient(status=discord.Status(config.boot_status), max_messages=config.message_cache_size)
+client = FrameworkClient(loop=eventloop.install(config.event_loop), status=discord.Status(config.boot_status), max_messages=config.message_cache_size, **shards.client_kwargs())
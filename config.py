@@ -20,6 +20,11 @@ logfile_encoding = "UTF-8"  # UTF-8 recommended because emojis
 # log every single message that runs through the bot. For high-traffic bots this should be False (default: True)
 log_messages = True
 
+# Event loop implementation: "asyncio" for the standard one, "uvloop" for uvloop, or "auto" to use uvloop if it's
+# installed. Falls back to the standard loop if uvloop isn't available. uvloop's loop methods can't be replaced, so on it
+# message traces (see tracing.py) have no spans for executor calls. (default: "asyncio")
+event_loop = "asyncio"
+
 # Bot's default online status when it logs in. Should usually be dnd to indicate it is online but still loading.
 # Valid values are "online", "idle", "dnd" (default) or "do_not_disturb", and "invisible".
 boot_status = "dnd"
@@ -32,12 +37,129 @@ prefixes = [
 	"c!",
 ]
 
+# Extra prefixes that only work in specific guilds, on top of the ones above. Maps guild ID to a list of prefixes, eg.
+# {364480908528451584: ["arbys "]}. These can also be changed at runtime with client.set_guild_prefixes().
+guild_prefixes = {}
+
 # A name for your bot
 bot_name = "Arby's"
 
+# Run message handlers concurrently in their own task instead of one after another before command dispatch. Each handler
+# gets message_handler_timeout seconds before it's cancelled and reported in the log (None for no limit). Handlers that
+# must run in order can share an ordering group with @client.message(group="name").
+concurrent_message_handlers = False
+message_handler_timeout = 30.0
+
+# Ready and shutdown handlers run concurrently (within the groups they were registered in), and each phase as a whole has
+# this many seconds to finish before the handlers still running are cancelled (None for no limit).
+ready_deadline = 60.0
+shutdown_deadline = 10.0
+
+# Event loop lag monitor (see loopmonitor.py). The loop's scheduling delay is sampled every loop_monitor_interval seconds,
+# and whenever the loop is stuck for longer than loop_monitor_threshold seconds the code responsible is found and logged.
+# The `lag` command lists the worst offenders over the last loop_monitor_window seconds. Set the threshold to None to
+# turn the monitor off.
+loop_monitor_threshold = 0.2
+loop_monitor_interval = 0.1
+loop_monitor_window = 3600
+
+# Per-message tracing (see tracing.py), for finding out where a slow message's time went. Costs a little on every message
+# while it's on, so it starts off unless `tracing` is True and is usually turned on with the trace command when needed.
+# The last trace_buffer_size spans are kept in memory and can be dumped in Chrome trace format.
+tracing = False
+trace_buffer_size = 100000
+
+# Watchdog for stuck commands, handlers and background jobs (see taskwatch.py). Anything still running after task_budget
+# seconds (None for no limit) has where it's stuck logged, checked every task_watchdog_interval seconds. task_budgets
+# overrides the budget for particular "module.function"s, None meaning no limit.
+task_budget = 120.0
+task_budgets = {
+	"music.command": None,  # plays the whole queue before returning
+}
+task_watchdog_interval = 10.0
+
+# Gateway event recorder (see recorder.py), for capturing real traffic to replay offline with benchmarks/replay.py. Off
+# while record_file is None; otherwise the path to record to, where {time} is replaced with when the bot started and
+# {shard} with the shard ID. Only the record_events event types are recorded, and the fields named in record_redact are
+# redacted before being written: "drop" them, "hash" them, or "shape" them (letters and digits blanked out, keeping the
+# length and any command prefix). The file is written out every record_flush_interval seconds.
+record_file = None  # e.g. "recordings/events-{time}-{shard}.rec"
+record_events = ["READY", "GUILD_CREATE", "GUILD_DELETE", "CHANNEL_CREATE", "CHANNEL_DELETE",
+				"MESSAGE_CREATE", "MESSAGE_UPDATE", "MESSAGE_DELETE",
+				"MESSAGE_REACTION_ADD", "MESSAGE_REACTION_REMOVE", "GUILD_MEMBER_ADD", "GUILD_MEMBER_REMOVE"]
+record_redact = {
+	"content": "shape",
+	"filename": "shape",
+	"username": "hash",
+	"global_name": "hash",
+	"nick": "hash",
+	"email": "drop",
+	"avatar": "drop",
+	"url": "drop",
+	"proxy_url": "drop",
+}
+record_flush_interval = 10.0
+
+# Command cost classes that go through the worker scheduler. Commands registered with @client.command(cost="heavy") only
+# run `limit` at a time, the rest wait in a queue that's either "fifo" or "priority" ordered and holds up to `max_queued`
+# commands (None for no limit). Classes not listed here run without limits; "admin" commands can never be queued.
+command_cost_classes = {
+	"heavy": {"limit": 1, "mode": "fifo", "max_queued": 10},
+}
+
+# Only import modules that just add commands the first time one of their commands is used, based on what's recorded in
+# modules/manifest.json. Modules that handle events are always imported at startup. (default: True)
+lazy_modules = True
+
+# Settings for running the bot as several shard processes with `python supervisor.py`. shard_processes is how many shards
+# to run (None for one per CPU core), and they're started shard_identify_interval seconds apart. Each shard reports its
+# counters to the supervisor every shard_report_interval seconds. Shards that crash are restarted after
+# shard_restart_delay seconds, doubling for every crash in a row up to shard_restart_max_delay.
+shard_processes = None
+shard_identify_interval = 5.5
+shard_report_interval = 10.0
+shard_restart_delay = 1.0
+shard_restart_max_delay = 300.0
+
+# Messages sent with client.send() go through a queue per channel that sends at most outbound_rate[0] messages every
+# outbound_rate[1] seconds, which is Discord's limit for posting in one channel. Plain text sent with merge=True (debug
+# and profiling output) is merged into as few messages as possible while it waits. See outbound.py.
+outbound_rate = (5, 5.0)
+
+# Errors in commands are grouped by exception type and stack trace. The first time an error happens it's posted and
+# logged in full, but if it happens again within error_dedupe_window seconds only a short reference to it is posted, and
+# the repeats are written to the log as a count every error_report_interval seconds rather than a stack trace each time.
+error_dedupe_window = 600.0
+error_report_interval = 60.0
+
 # Size of the bot's internal message cache. It may be sometimes useful to use the cache so
 # an option is given here to make it bigger. The default cache size in discord.py is 5000
-message_cache_size = 50000
+message_cache_size = 40000
+
+# Per-guild limits within the message cache above, so one busy guild can't push every other guild's messages out of it.
+# Each guild keeps at most message_cache_guild_quota messages (None for no limit) unless it has its own quota in
+# message_cache_guild_quotas, and channels listed in message_cache_channel_quotas get a quota of their own separate from
+# their guild's. A quota of 0 turns off caching there. DMs all count as one guild. See cache.py.
+# The quota cache indexes messages by ID, which costs about 0.2 KiB per cached message on top of the message itself, so
+# the cache holds 40000 messages rather than the 50000 it held as a plain deque: that's about the same memory at most
+# (benchmarks/cache_policy.py: 30 MiB full against 32 MiB), in exchange for lookups by ID instead of scans and every
+# quiet guild keeping its recent messages. With 1000 per guild it's usually not full either, since the busy guilds
+# that used to fill it are capped. Raise the quota for guilds that need more history cached in message_cache_guild_quotas.
+message_cache_guild_quota = 1000
+message_cache_guild_quotas = {}
+message_cache_channel_quotas = {}
+
+# Gateway intents, which decide what events Discord sends the bot and so what discord.py can cache. "auto" asks for what
+# the registered handlers need, or give a list of discord.Intents flag names to use exactly those. extra_intents are added
+# on top of "auto", for events modules wait for with client.wait_for() rather than a handler (the kill command waits for a
+# reaction). The member and presence caches are the biggest after messages, and only info and markov use them (both fall
+# back to less detail without them). "auto" never asks for the privileged members and presences intents, since logging in
+# fails if they aren't enabled for the bot in the developer portal: handlers that need them (join_leave_msgs' member
+# join/leave messages) are logged at startup, and once the intent is enabled in the portal add it to extra_intents.
+gateway_intents = "auto"
+extra_intents = ["guild_reactions"]
+cache_members = False
+cache_presences = False
 
 
 # ================
@@ -46,3 +168,18 @@ message_cache_size = 50000
 
 # Used in modules/exit.py
 shutdown_user = 288438228959363073
+
+# Used in modules/prometheus.py: port to serve metrics for Prometheus on (None to turn it off), and the address to listen
+# on, which should stay localhost unless the port is firewalled off
+metrics_port = None
+metrics_host = "127.0.0.1"
+
+# Used in modules/profile.py: how long the profile command samples for by default and at most (seconds), and the default
+# time between samples. Sampling more often gives more detail but the sampling thread competes with the bot for the GIL.
+profiler_duration = 10.0
+profiler_max_duration = 300.0
+profiler_interval = 0.005
+
+# Used in modules/memory.py: frames of traceback tracemalloc keeps per allocation when started without a number. 1 groups
+# growth by the line that allocated it, more groups it by the whole call path but costs more memory and time.
+memory_trace_frames = 1
@@ -0,0 +1,76 @@
+# Deduplicated error reporting for commands.
+#
+# When something a command depends on breaks, every single use of the command fails the same way, and posting plus
+# logging the full stack trace every time doubles the bot's traffic for no new information. Errors are fingerprinted by
+# exception type and the stack they were raised from (file, function, and line of each frame, not the message, which
+# often has IDs or values in it that differ every time). The first occurrence of an error is reported in full; repeats
+# within config.error_dedupe_window seconds only get a short reference back to it, and are counted instead of logged, with
+# the counts written to the log every config.error_report_interval seconds.
+
+from typing import Dict, Tuple
+
+import hashlib
+import log
+import os
+import time
+import traceback
+
+
+class ErrorRecord:
+	def __init__(self, fingerprint: str, summary: str):
+		self.fingerprint = fingerprint
+		self.ref = fingerprint[:8]  # short enough to quote, long enough to grep the log for
+		self.summary = summary
+		self.count = 0  # every occurrence ever
+		self.window_start: float = None  # monotonic time of the occurrence that was reported in full
+		self.window_count = 0  # occurrences since then, including that one
+		self.unlogged = 0  # repeats not written to the log yet
+		self.last_seen: float = None
+		self.last_context: str = None
+		self.jump_url: str = None  # link to where it was posted in full, if it was
+
+
+def fingerprint(exception: BaseException) -> Tuple[str, str]:
+	# Returns the fingerprint of an exception and a one line summary of it
+	frames = traceback.extract_tb(exception.__traceback__)
+	key = type(exception).__module__ + "." + type(exception).__qualname__ + "".join(f"|{x.filename}:{x.name}:{x.lineno}" for x in frames)
+	where = f" in {frames[-1].name}() ({os.path.basename(frames[-1].filename)}:{frames[-1].lineno})" if frames else ""
+	return hashlib.sha1(key.encode("utf-8")).hexdigest(), f"{type(exception).__name__}{where}"
+
+
+class ErrorReporter:
+	def __init__(self, window: float):
+		self.window = window
+		self.records: Dict[str, ErrorRecord] = {}
+		self.suppressed = 0  # repeats that only got a short reference
+
+	def record(self, exception: BaseException, context: str) -> Tuple[ErrorRecord, bool]:
+		# Records an occurrence of an exception. Returns its record and whether it should be reported in full.
+		key, summary = fingerprint(exception)
+		now = time.monotonic()
+		record = self.records.get(key, None)
+		if record is None:
+			record = self.records[key] = ErrorRecord(key, summary)
+		record.count += 1
+		record.last_seen = now
+		record.last_context = context
+		if record.window_start is None or now - record.window_start > self.window:
+			record.window_start = now
+			record.window_count = 1
+			record.jump_url = None
+			return record, True
+		record.window_count += 1
+		record.unlogged += 1
+		self.suppressed += 1
+		return record, False
+
+	async def flush(self) -> None:
+		# Writes the counts of repeated errors to the log, and forgets errors that haven't happened in a while
+		now = time.monotonic()
+		for key, record in list(self.records.items()):
+			if record.unlogged:
+				log.warning(f"Error {record.ref} ({record.summary}) happened {record.unlogged} more time(s) since it was last logged, "
+							f"{record.count} in total. Last time was while processing: {record.last_context}")
+				record.unlogged = 0
+			elif now - record.last_seen > self.window:
+				del self.records[key]
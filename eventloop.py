@@ -0,0 +1,46 @@
+# Picks the event loop implementation the bot runs on, from config.event_loop:
+# - "asyncio" is the standard library loop, and the default
+# - "uvloop" is the libuv based drop-in replacement (pip install uvloop, not available on Windows), which is noticeably
+#   faster at the things the bot spends its time on: socket I/O, timers, and lots of short tasks. Its loops don't allow
+#   run_in_executor to be replaced, so tracing.py can't give executor calls their own spans on it
+# - "auto" uses uvloop when it's installed and the standard loop otherwise
+# If the chosen loop can't be used the bot falls back to the standard one rather than refusing to start.
+#
+# This has to run before the client is created, since discord.py's client holds on to the loop it was created with.
+# benchmarks/event_loop.py compares the two on the bot's own dispatch code.
+
+import asyncio
+import log
+
+implementation: str = None
+# name of the loop implementation actually in use, once install() has run
+
+
+def _uvloop_policy():
+	try:
+		import uvloop
+	except ImportError:
+		return None
+	return uvloop.EventLoopPolicy()
+
+
+def install(name: str) -> asyncio.AbstractEventLoop:
+	# Sets up the event loop policy for `name` and returns a new loop from it, which is also made the current loop
+	global implementation
+	if name not in ["asyncio", "uvloop", "auto"]:
+		log.warning(f"Unknown event loop {name} in config (should be asyncio, uvloop or auto), using the standard asyncio loop")
+		name = "asyncio"
+
+	implementation = "asyncio"
+	if name in ["uvloop", "auto"]:
+		policy = _uvloop_policy()
+		if policy is not None:
+			asyncio.set_event_loop_policy(policy)
+			implementation = "uvloop"
+		elif name == "uvloop":
+			log.warning("uvloop was asked for in config but it isn't installed (or isn't supported here), using the standard asyncio loop")
+
+	loop = asyncio.new_event_loop()
+	asyncio.set_event_loop(loop)
+	log.debug(f"using the {implementation} event loop ({type(loop).__module__}.{type(loop).__name__})")
+	return loop
@@ -14,3 +14,8 @@ class UserBotError(BaseFrameworkError):
 class HandlerError(BaseFrameworkError):
 	"""Raised when there is a problem with a handler function."""
 	pass
+
+
+class QueueFullError(BaseFrameworkError):
+	"""Raised when a command can't be queued because its cost class's queue is full."""
+	pass
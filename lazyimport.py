@@ -0,0 +1,107 @@
+# Deferred imports for heavy third party libraries, and the startup timing report.
+#
+# Some modules have to be imported at startup because they handle events, but the big libraries they use (youtube_dl,
+# matplotlib, ...) are only needed once someone actually runs the command that uses them. lazy_import() hands back a
+# stand-in module that does the real import the first time anything is looked up on it:
+#
+#     youtube_dl = lazyimport.lazy_import("youtube_dl")
+#     ...
+#     with youtube_dl.YoutubeDL(...) as session:  # youtube_dl gets imported here
+#
+# This module should be the first thing main.py imports, so that it can time the rest of startup.
+
+from typing import Dict, List, Tuple
+
+import importlib
+import importlib.util
+import log
+import sys
+import time
+import types
+
+
+process_start = time.perf_counter()
+
+import_times: Dict[str, float] = {}
+# library name -> seconds it took to import, for libraries imported through lazy_import()
+_marks: List[Tuple[str, float]] = []
+
+
+class LazyModule(types.ModuleType):
+	def __init__(self, name: str):
+		super().__init__(name)
+		self.__dict__["_lazy_target"] = None
+
+	def _lazy_load(self) -> types.ModuleType:
+		target = self.__dict__["_lazy_target"]
+		if target is None:
+			name = self.__name__
+			start = time.perf_counter()
+			target = importlib.import_module(name)
+			import_times[name] = time.perf_counter() - start
+			self.__dict__["_lazy_target"] = target
+			log.debug(f"deferred import of {name} took {import_times[name]*1000:.1f} ms")
+		return target
+
+	def __getattr__(self, item: str):
+		# only called for attributes that aren't found normally, ie. everything from the real module
+		return getattr(self._lazy_load(), item)
+
+	def __dir__(self):
+		return dir(self._lazy_load())
+
+	@property
+	def loaded(self) -> bool:
+		return self.__dict__["_lazy_target"] is not None
+
+
+def lazy_import(name: str) -> types.ModuleType:
+	# Returns the real module if something has already imported it, otherwise a LazyModule for it
+	if name in sys.modules:
+		return sys.modules[name]
+	return LazyModule(name)
+
+
+def available(name: str) -> bool:
+	# Checks whether a library can be imported without importing it (for optional dependencies)
+	try:
+		return importlib.util.find_spec(name) is not None
+	except (ImportError, ValueError):
+		return False
+
+
+def mark(phase: str) -> None:
+	# Records the end of a startup phase for the startup report
+	_marks.append((phase, time.perf_counter()))
+
+
+def max_rss() -> float:
+	# Peak resident memory of the process in MiB, or None where the resource module isn't available (Windows)
+	try:
+		import resource
+	except ImportError:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB everywhere else
+
+
+def startup_report(module_times: Dict[str, float]) -> str:
+	# Breaks down the time from process start (well, from this module being imported) to now by startup phase, module
+	# import, and any deferred library that ended up being imported during startup anyway.
+	now = time.perf_counter()
+	lines = [f"Startup report: {now - process_start:.3f} s from process start to ready"]
+	previous = process_start
+	for phase, moment in _marks:
+		lines.append(f"  {phase}: {(moment - previous)*1000:.1f} ms")
+		previous = moment
+	if module_times:
+		slowest = sorted(module_times.items(), key=lambda x: x[1], reverse=True)
+		lines.append(f"  module imports ({sum(module_times.values())*1000:.1f} ms total): " + ", ".join(f"{x} {y*1000:.1f} ms" for x, y in slowest[:10]))
+	if import_times:
+		lines.append("  deferred libraries imported before ready: " + ", ".join(f"{x} {y*1000:.1f} ms" for x, y in import_times.items()))
+	else:
+		lines.append("  deferred libraries imported before ready: none")
+	rss = max_rss()
+	if rss is not None:
+		lines.append(f"  peak resident memory: {rss:.1f} MiB")
+	return "\n".join(lines)
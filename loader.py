@@ -0,0 +1,190 @@
+# Loads the bot's modules.
+#
+# Most modules only add commands, and most commands don't get used every time the bot is running, so there's no point
+# paying for importing them (and their dependencies) at startup. modules/manifest.json records what each module
+# registers: modules that only have commands get lightweight stub commands (plus their basic help entries) at startup,
+# and the real module is imported the first time one of its commands is run. Modules that hook into events (messages,
+# reactions, ready/shutdown, background jobs, ...) need to see every event so they're always imported straight away.
+#
+# After adding a module or changing the commands, help, or event hooks of one, regenerate the manifest with:
+#     python loader.py --generate
+
+from client import client
+from typing import Dict, List
+
+import config
+import discord
+import importlib
+import json
+import lazyimport
+import log
+import os
+import sys
+import time
+
+
+manifest_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modules", "manifest.json")
+
+import_times: Dict[str, float] = {}
+# module name -> seconds it took to import
+lazy_commands: Dict[str, str] = {}
+# trigger or alias -> name of the module it belongs to, for modules that haven't been imported yet
+
+_event_registries = {
+	"ready": lambda: client._ready_handlers,
+	"shutdown": lambda: client._shutdown_handlers,
+	"message": lambda: client._message_handlers,
+	"member_join": lambda: client._member_join_handlers,
+	"member_remove": lambda: client._member_remove_handlers,
+	"reaction_add": lambda: client._reaction_add_handlers,
+	"reaction_remove": lambda: client._reaction_remove_handlers,
+	"background": lambda: client.background_jobs.jobs,
+}
+
+
+def read_manifest() -> Dict[str, dict]:
+	try:
+		with open(manifest_file, "r", encoding="utf-8") as fp:
+			return json.load(fp)
+	except FileNotFoundError:
+		log.warning("No module manifest found, loading every module at startup (run `python loader.py --generate` to make one)")
+	except ValueError:
+		log.error("Module manifest is corrupt, loading every module at startup", include_exception=True)
+	return {}
+
+
+def load_modules(names: List[str]) -> None:
+	manifest = read_manifest() if config.lazy_modules else {}
+	start = time.perf_counter()
+	deferred = 0
+	for name in names:
+		entry = manifest.get(name, None)
+		if entry is not None and not entry["events"]:
+			register_stubs(name, entry)
+			deferred += 1
+		else:
+			activate(name)
+	total = time.perf_counter() - start
+
+	slowest = sorted(import_times.items(), key=lambda x: x[1], reverse=True)[:5]
+	log.info(f"Loaded {len(names) - deferred} modules in {total*1000:.1f} ms, {deferred} more deferred until first use. "
+			f"Slowest imports: {', '.join(f'{x} ({y*1000:.1f} ms)' for x, y in slowest)}")
+
+
+def activate(name: str):
+	# Imports a module for real (if it isn't already) and records how long that took
+	full_name = f"modules.{name}"
+	if full_name in sys.modules:
+		return sys.modules[full_name]
+	start = time.perf_counter()
+	module = importlib.import_module(full_name)
+	import_times[name] = time.perf_counter() - start
+	for trigger in [x for x, y in lazy_commands.items() if y == name]:
+		del lazy_commands[trigger]
+	if client.active:
+		log.info(f"Loaded module {name} on first use in {import_times[name]*1000:.1f} ms")
+	else:
+		log.debug(f"loaded module {name} in {import_times[name]*1000:.1f} ms")
+	return module
+
+
+def ensure_loaded(command: str) -> None:
+	# Makes sure the module providing a command (by trigger or alias) is imported, for things like help that need more
+	# than the stub registers
+	name = lazy_commands.get(command.lower(), None)
+	if name is not None:
+		activate(name)
+
+
+def register_stubs(name: str, entry: dict) -> None:
+	for trigger, aliases in entry["commands"].items():
+		stub = _make_stub(name, trigger)
+		client.cmd_aliases[trigger] = aliases
+		client._command_lookup[trigger.lower()] = stub
+		lazy_commands[trigger.lower()] = name
+		for alias in aliases:
+			client.alias_lookup[alias] = trigger
+			client._command_lookup[alias.lower()] = stub
+			lazy_commands[alias.lower()] = name
+	for title, desc, include_prefix in entry["basic_help"]:
+		client.basic_help(title=title, desc=desc.format(bot_name=client.bot_name), include_prefix=include_prefix)
+	log.debug(f"registered lazy stubs for module {name}: {list(entry['commands'].keys())}")
+
+
+def _make_stub(name: str, trigger: str):
+	async def stub(command: str, message: discord.Message):
+		try:
+			activate(name)
+		except Exception:
+			log.error(f"Could not load module {name} for command {trigger}", include_exception=True)
+			await message.channel.send(f"Internal error: the `{trigger}` command could not be loaded (this has been recorded in the log)")
+			return
+		real = client._command_lookup.get(trigger.lower(), None)
+		if real is None or real is stub:
+			log.error(f"Module {name} did not register the command {trigger} listed in the module manifest (regenerate it with `python loader.py --generate`)")
+			await message.channel.send(client.unknown_command)
+			return
+		await real(command, message)
+
+	stub.__name__ = f"lazy_{trigger}"
+	stub.__module__ = f"modules.{name}"
+	return stub
+
+
+@client.ready
+async def log_startup_report():
+	lazyimport.mark("logging in and connecting to Discord")
+	log.info(lazyimport.startup_report(import_times))
+
+
+def _snapshot() -> dict:
+	return {
+		"commands": dict(client.cmd_aliases),
+		"basic_help": dict(client._basic_help),
+		"events": {x: len(y()) for x, y in _event_registries.items()},
+	}
+
+
+def generate() -> Dict[str, dict]:
+	# Imports every module one by one and records what each one registered with the client
+	manifest = {}
+	directory = os.path.dirname(manifest_file)
+	for filename in sorted(os.listdir(directory)):
+		if not filename.endswith(".py") or filename.startswith("__"):
+			continue
+		name = filename[:-3]
+		before = _snapshot()
+		importlib.import_module(f"modules.{name}")
+		after = _snapshot()
+
+		basic_help = []
+		for title, desc in after["basic_help"].items():
+			if title in before["basic_help"]:
+				continue
+			include_prefix = title.startswith(client.default_prefix)
+			if include_prefix:
+				title = title[len(client.default_prefix):]
+			desc = desc.replace("{", "{{").replace("}", "}}").replace(client.bot_name, "{bot_name}")
+			basic_help.append([title, desc, include_prefix])
+
+		manifest[name] = {
+			"commands": {x: y for x, y in after["commands"].items() if x not in before["commands"]},
+			"basic_help": basic_help,
+			"events": [x for x in _event_registries.keys() if after["events"][x] > before["events"][x]],
+		}
+
+	with open(manifest_file, "w", encoding="utf-8") as fp:
+		json.dump(manifest, fp, indent="\t", ensure_ascii=False)
+		fp.write("\n")
+	return manifest
+
+
+if __name__ == "__main__":
+	# modules that `import loader` (help) should get this module rather than a second copy of it, which would register
+	# its ready handler again and make them look like they handle events
+	sys.modules.setdefault("loader", sys.modules[__name__])
+	if "--generate" in sys.argv:
+		result = generate()
+		print(f"Wrote {manifest_file}: {len(result)} modules, {len([x for x in result.values() if not x['events']])} can be loaded lazily")
+	else:
+		print("Usage: python loader.py --generate")
@@ -0,0 +1,149 @@
+# Event loop lag monitor.
+#
+# Anything that blocks the event loop (a synchronous HTTP request, a subprocess waited on with communicate(), a psutil
+# call with an interval, ...) stalls every other part of the bot, heartbeats included. The monitor has two halves:
+# - a task on the loop that sleeps for `interval` over and over and records how late it wakes up, which is the loop's
+#   scheduling delay, into a histogram
+# - a watchdog thread that notices when that task hasn't run for longer than `threshold`, meaning something is hogging the
+#   loop right now, grabs the loop thread's stack with sys._current_frames(), and attributes the stall to the innermost
+#   frame that's in the bot's own code (so the module function that made the blocking call, not the library it called)
+# Stalls are logged, at most once a minute per culprit with a count of the ones in between, and kept in a rolling list so
+# the worst offenders can be looked at with the `lag` command.
+
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+
+import asyncio
+import log
+import metrics
+import os
+import ratelimit
+import sys
+import threading
+import time
+import traceback
+
+
+root = os.path.dirname(os.path.abspath(__file__))
+ignored_files = [os.path.join(root, x) for x in ["client.py", "metrics.py", "background.py", "workers.py", "loopmonitor.py"]]
+# framework files that show up in every stack, a stall is never their fault
+
+
+class Stall:
+	__slots__ = ("started", "duration", "module", "function", "line", "blocked_in")
+
+	def __init__(self, started: float, module: str, function: str, line: int, blocked_in: str):
+		self.started = started  # wall clock
+		self.duration: float = None  # seconds, filled in once the loop gets going again
+		self.module = module
+		self.function = function
+		self.line = line
+		self.blocked_in = blocked_in  # innermost frame, usually library code
+
+
+def attribute(frame) -> Tuple[str, str, int, str]:
+	# Finds the innermost frame that's in the bot's own code. Returns its module, function and line number, plus a
+	# description of the innermost frame of all.
+	stack = traceback.extract_stack(frame)
+	innermost = stack[-1] if stack else None
+	blocked_in = f"{os.path.basename(innermost.filename)}:{innermost.lineno} in {innermost.name}()" if innermost is not None else "unknown"
+	for entry in reversed(stack):
+		filename = os.path.abspath(entry.filename)
+		if filename.startswith(root + os.sep) and filename not in ignored_files:
+			module = os.path.relpath(filename, root)[:-3].replace(os.sep, ".")
+			return module, entry.name, entry.lineno, blocked_in
+	return "unknown", innermost.name if innermost is not None else "unknown", 0, blocked_in
+
+
+class LoopMonitor:
+	def __init__(self, threshold: float, interval: float, window: float):
+		self.threshold = threshold
+		self.interval = interval
+		self.window = window  # seconds of stalls kept for the top list
+		self.lag = metrics.Histogram()
+		self.last_lag = 0.0
+		self.stalls: Deque[Stall] = deque(maxlen=2000)
+		self.stall_count = 0
+		self._log_buckets = ratelimit.BucketStore(1, 60.0)
+		self._unlogged: Dict[Tuple[str, str], int] = {}
+		self._last_tick = time.monotonic()
+		self._loop_thread: int = None
+		self._task: asyncio.Task = None
+		self._thread: threading.Thread = None
+		self._running = False
+		self._lock = threading.Lock()
+
+	def start(self, loop: asyncio.AbstractEventLoop) -> None:
+		if self._task is not None:
+			return
+		self._loop_thread = threading.get_ident()
+		self._last_tick = time.monotonic()
+		self._running = True
+		self._task = loop.create_task(self._sample())
+		self._thread = threading.Thread(target=self._watch, name="Loop_Watchdog", daemon=True)
+		self._thread.start()
+		log.debug(f"loop monitor started (threshold {self.threshold}s, sampling every {self.interval}s)")
+
+	def stop(self) -> None:
+		self._running = False
+		if self._task is not None:
+			self._task.cancel()
+			self._task = None
+
+	async def _sample(self) -> None:
+		while True:
+			expected = time.monotonic() + self.interval
+			await asyncio.sleep(self.interval)
+			now = time.monotonic()
+			self.last_lag = max(0.0, now - expected)
+			self.lag.observe(self.last_lag)
+			self._last_tick = now
+
+	def _watch(self) -> None:
+		# Runs in its own thread
+		current: Stall = None
+		current_tick = None
+		while self._running:
+			time.sleep(self.threshold / 4)
+			tick = self._last_tick
+			overdue = time.monotonic() - (tick + self.interval)
+			if current is not None:
+				if tick != current_tick:
+					# the loop's running again, the sampler woke up at the end of the stall
+					current.duration = max(self.threshold, tick - (current_tick + self.interval))
+					self._finish(current)
+					current = None
+				continue
+			if overdue > self.threshold:
+				frame = sys._current_frames().get(self._loop_thread, None)
+				if frame is None:
+					continue
+				module, function, line, blocked_in = attribute(frame)
+				current = Stall(time.time() - overdue, module, function, line, blocked_in)
+				current_tick = tick
+
+	def _finish(self, stall: Stall) -> None:
+		with self._lock:
+			self.stalls.append(stall)
+			self.stall_count += 1
+		key = (stall.module, stall.function)
+		if self._log_buckets.get(key).consume():
+			repeats = self._unlogged.pop(key, 0)
+			log.warning(f"Event loop blocked for {stall.duration*1000:.0f} ms by {stall.module}.{stall.function}() (line {stall.line}, "
+						f"blocked in {stall.blocked_in}){f', plus {repeats} more time(s) since the last warning' if repeats else ''}")
+		else:
+			self._unlogged[key] = self._unlogged.get(key, 0) + 1
+
+	def top(self, count: int = 10) -> List[Tuple[Tuple[str, str], int, float, float]]:
+		# Worst offenders over the window: ((module, function), stalls, total seconds blocked, longest stall)
+		cutoff = time.time() - self.window
+		totals: Dict[Tuple[str, str], List] = {}
+		with self._lock:
+			recent = [x for x in self.stalls if x.started >= cutoff]
+		for stall in recent:
+			entry = totals.setdefault((stall.module, stall.function), [0, 0.0, 0.0])
+			entry[0] += 1
+			entry[1] += stall.duration
+			entry[2] = max(entry[2], stall.duration)
+		result = sorted(totals.items(), key=lambda x: x[1][1], reverse=True)[:count]
+		return [(x, y[0], y[1], y[2]) for x, y in result]
@@ -1,49 +1,67 @@
+import lazyimport  # needs to be first so that it can time the rest of startup
+
 from client import client
 from key import token
 
+import loader
+
+lazyimport.mark("framework imports")
+
+
+# To load new modules, add the name of your file to the list below, then run `python loader.py --generate` to update the
+# module manifest so it can be loaded on first use (see loader.py)
+
+enabled_modules = [
+	"about",
+	"ares",
+	"beef",
+	"call",
+	"chicken",
+	"cond",
+	"cqdx",
+	"emoji_stats",
+	"exec",
+	"exit",
+	"fivenine",
+	"ham",
+	"help",
+	"htm",
+	"info",
+	"jobs",
+	"join_leave_msgs",
+	"lag",
+	"logstat",
+	"markov",
+	"mc",
+	"memory",
+	"message_log",
+	"morse",
+	"music",
+	"n2yo",
+	"nou",
+	"ntp",
+	"phonehand",
+	"ping",
+	"pingreact",
+	"profile",
+	"prometheus",
+	"relay",
+	"roles",
+	"spaceman",
+	"stats",
+	"tasks",
+	"thiccbeef",
+	"thiccom",
+	"thiccseal",
+	"time",
+	"trace",
+	"tubez",
+	"units",
+	"unmorse",
+	"uwu",
+]
 
-# To load new modules, copy/paste the line below, uncommented, with X filled in for the name of your file
-# from modules import X
-
-from modules import about
-from modules import ares
-from modules import beef
-from modules import call
-from modules import chicken
-from modules import cond
-from modules import cqdx
-from modules import emoji_stats
-from modules import exec
-from modules import exit
-from modules import fivenine
-from modules import ham
-from modules import help
-from modules import htm
-from modules import info
-from modules import join_leave_msgs
-from modules import logstat
-from modules import markov
-from modules import mc
-from modules import message_log
-from modules import morse
-from modules import music
-from modules import n2yo
-from modules import nou
-from modules import ntp
-from modules import phonehand
-from modules import ping
-from modules import pingreact
-from modules import relay
-from modules import roles
-from modules import spaceman
-from modules import stats
-from modules import thiccbeef
-from modules import thiccom
-from modules import thiccseal
-from modules import time
-from modules import tubez
-from modules import units
-from modules import unmorse
-from modules import uwu
+loader.load_modules(enabled_modules)
+lazyimport.mark("loading modules")
 
 client.run(token)
@@ -0,0 +1,208 @@
+# Memory usage tracking for finding leaks in the running bot.
+#
+# Two ways of looking at it:
+# - approximate sizes of the structures the bot is known to grow: the message cache, discord.py's user/member/guild
+#   caches, the framework's handler tables, metrics and error records, and every container (dict, list, deque, set,
+#   Counter) held in a global of a loaded module, which covers the music queues, emoji_stats' counter, n2yo's request
+#   history and whatever modules add later. Sizes are sys.getsizeof() followed down through containers and plain objects,
+#   but not into objects everything else shares (guilds, channels, users, modules, classes, functions), and large
+#   containers are sized from a sample of their items, so it's quick enough to run on the event loop thread
+# - tracemalloc, started and stopped on demand since it slows down every allocation while it runs. Snapshots are kept so
+#   the growth between them can be listed by the line that allocated it.
+
+from collections import deque
+from typing import Any, List, Tuple
+
+import os
+import random
+import sys
+import tracemalloc
+import types
+
+
+shared_types: Tuple[type, ...] = None
+# objects an approximate size doesn't descend into, filled in on first use since they come from discord.py
+
+baseline: tracemalloc.Snapshot = None
+# first snapshot after tracemalloc was started, what diffs are taken against by default
+last: tracemalloc.Snapshot = None
+# most recent snapshot
+snapshot_filters = [
+	tracemalloc.Filter(False, tracemalloc.__file__),
+	tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+	tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+	tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def _shared_types() -> Tuple[type, ...]:
+	global shared_types
+	if shared_types is None:
+		import discord
+		found = [types.ModuleType, type, types.FunctionType, types.BuiltinFunctionType, types.MethodType, types.CodeType,
+				types.FrameType, discord.Client, discord.Guild, discord.abc.GuildChannel, discord.abc.User]
+		state = getattr(getattr(discord, "state", None), "ConnectionState", None)
+		if state is not None:
+			found.append(state)
+		shared_types = tuple(found)
+	return shared_types
+
+
+def _references(obj) -> List[Any]:
+	# What an object's size includes besides itself: container contents, or the attributes of a plain object
+	if isinstance(obj, dict):
+		return [x for pair in obj.items() for x in pair]
+	if isinstance(obj, (list, tuple, set, frozenset, deque)):
+		return list(obj)
+	if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+		return []
+	found = []
+	attributes = getattr(obj, "__dict__", None)
+	if isinstance(attributes, dict):
+		found.append(attributes)
+	for cls in type(obj).__mro__:
+		for slot in cls.__dict__.get("__slots__", ()):
+			if isinstance(slot, str) and hasattr(obj, slot):
+				found.append(getattr(obj, slot))
+	return found
+
+
+def approximate_size(obj, sample: int = 200, seen: set = None, depth: int = 0) -> int:
+	# Bytes taken by obj and everything it holds that isn't shared with the rest of the bot. Containers with more than
+	# `sample` items are measured from `sample` of them picked at random and scaled up.
+	if seen is None:
+		seen = set()
+	if id(obj) in seen or isinstance(obj, _shared_types()):
+		return 0
+	return _own_size(obj, sample, seen, depth)
+
+
+def _own_size(obj, sample: int, seen: set, depth: int) -> int:
+	# approximate_size() without the check for shared objects, so the discord.py caches can be measured by their contents
+	seen.add(id(obj))
+	try:
+		size = sys.getsizeof(obj)
+	except TypeError:
+		return 0
+	if depth > 50:
+		return size
+	try:
+		references = _references(obj)
+	except Exception:  # something changed size while we looked at it, or a property that raises
+		return size
+	if len(references) > sample:
+		picked = random.sample(references, sample)
+		return size + int(sum(approximate_size(x, sample, seen, depth + 1) for x in picked) * len(references) / sample)
+	return size + sum(approximate_size(x, sample, seen, depth + 1) for x in references)
+
+
+def _items_size(items: list, sample: int, seen: set) -> int:
+	# Size of a list of objects that would otherwise count as shared (guilds, users, members)
+	picked = random.sample(items, sample) if len(items) > sample else items
+	total = sum(_own_size(x, sample, seen, 1) for x in picked if id(x) not in seen)
+	return sys.getsizeof(items) + (int(total * len(items) / len(picked)) if picked else 0)
+
+
+def _length(obj) -> int:
+	try:
+		return len(obj)
+	except TypeError:
+		return None
+
+
+def known_structures(client, sample: int = 200) -> List[Tuple[str, int, int]]:
+	# (name, number of entries or None, approximate bytes) for the framework's structures and module globals, biggest
+	# first. Anything reachable from more than one of them is counted towards the first.
+	seen = set()
+	result = []
+	state = client._connection
+	members = [x for guild in client.guilds for x in getattr(guild, "_members", {}).values()]
+	for name, items in [("discord.py guilds", list(getattr(state, "_guilds", {}).values())),
+						("discord.py members (all guilds)", members),
+						("discord.py users", list(getattr(state, "_users", {}).values())),
+						("discord.py private channels", list(getattr(state, "_private_channels", {}).values()))]:
+		result.append((name, len(items), _items_size(items, sample, seen)))
+
+	found: List[Tuple[str, Any]] = []
+	if getattr(state, "_messages", None) is not None:
+		found.append(("message cache", state._messages))
+	if getattr(state, "_emojis", None) is not None:
+		found.append(("discord.py emojis", state._emojis))
+	for name in ["_message_handlers", "_guild_message_handlers", "_channel_message_handlers", "_message_handler_checks",
+				"_reaction_add_handlers", "_reaction_remove_handlers", "_member_join_handlers", "_member_remove_handlers",
+				"_command_lookup", "_basic_help", "_long_help", "alias_lookup", "handler_timeouts"]:
+		value = getattr(client, name, None)
+		if value is not None:
+			found.append((f"client.{name}", value))
+	found.append(("metrics (client.metrics)", client.metrics.handlers))
+	found.append(("error reports (client.errors)", client.errors.records))
+	if client.loop_monitor is not None:
+		found.append(("loop stalls (client.loop_monitor)", client.loop_monitor.stalls))
+	found.append(("outbound queues (client.outbound)", client.outbound.queues))
+	for module_name, module in list(sys.modules.items()):
+		if not module_name.startswith("modules.") or not isinstance(module, types.ModuleType):
+			continue
+		for name, value in list(vars(module).items()):
+			if not name.startswith("__") and isinstance(value, (dict, list, set, deque)) and value:
+				found.append((f"{module_name[len('modules.'):]}.{name}", value))
+
+	result.extend((name, _length(value), approximate_size(value, sample, seen)) for name, value in found)
+	return sorted(result, key=lambda x: x[2], reverse=True)
+
+
+def rss() -> float:
+	# Current resident memory of the process in MiB, or None where it can't be found without psutil
+	try:
+		with open("/proc/self/statm") as f:
+			return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+	except (OSError, ValueError, AttributeError):
+		pass
+	try:
+		import psutil
+	except ImportError:
+		return None
+	return psutil.Process().memory_info().rss / 1024 / 1024
+
+
+def start(frames: int) -> None:
+	global baseline, last
+	tracemalloc.start(frames)
+	baseline = None
+	last = None
+
+
+def stop() -> None:
+	global baseline, last
+	tracemalloc.stop()
+	baseline = None
+	last = None
+
+
+def snapshot() -> Tuple[tracemalloc.Snapshot, tracemalloc.Snapshot]:
+	# Takes a snapshot, returning it and the one before it (None for the first)
+	global baseline, last
+	taken = tracemalloc.take_snapshot().filter_traces(snapshot_filters)
+	previous = last
+	last = taken
+	if baseline is None:
+		baseline = taken
+	return taken, previous
+
+
+def diff(new: tracemalloc.Snapshot, old: tracemalloc.Snapshot, key_type: str = "lineno") -> List[tracemalloc.StatisticDiff]:
+	# Growth from old to new by allocating line (or "traceback"), biggest first
+	return new.compare_to(old, key_type)
+
+
+def describe(stat: tracemalloc.StatisticDiff) -> str:
+	frame = stat.traceback[0]
+	return f"{frame.filename}:{frame.lineno}: {stat.size_diff / 1024:+.1f} KiB ({stat.count_diff:+d} blocks), now {stat.size / 1024:.1f} KiB in {stat.count} blocks"
+
+
+def size_text(size: int) -> str:
+	for unit in ["B", "KiB", "MiB"]:
+		if abs(size) < 1024:
+			return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+		size /= 1024
+	return f"{size:.1f} GiB"
+
@@ -0,0 +1,166 @@
+# Latency and CPU accounting for everything the bot runs on behalf of modules.
+#
+# Every command, message handler, reaction/member handler and background job goes through Registry.measure(), which
+# records how long it took (wall clock) and how much CPU time it used into fixed-bucket histograms, both for the handler
+# itself and for the module it belongs to. The stats command shows them with `stats --handlers`.
+#
+# Wall clock time is easy, but CPU time isn't: time.thread_time() is for the whole thread, and the event loop thread
+# runs everything interleaved. So the coroutine is driven through _Timed, which reads thread_time() around each step of
+# the coroutine (everything it does between two awaits that actually suspend), and only adds up those steps. Time spent
+# in other coroutines while this one is suspended isn't counted. Nested measurements (a handler that runs another
+# measured handler) count the inner one's CPU time towards both.
+#
+# measure() also opens a trace span for the handler when tracing is on (see tracing.py), and registers it with the
+# watchdog for stuck tasks while it runs (see taskwatch.py).
+
+from bisect import bisect_left
+from contextlib import nullcontext
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+import time
+import tracing
+
+
+bucket_bounds = [
+	0.00005, 0.0001, 0.0002, 0.0005,
+	0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+	1.0, 2.0, 5.0, 10.0, 20.0, 60.0,
+]
+# upper bounds of the histogram buckets in seconds, there's one more bucket after these for anything slower
+
+
+class Histogram:
+	__slots__ = ("counts", "count", "total", "max")
+
+	def __init__(self):
+		self.counts = [0] * (len(bucket_bounds) + 1)
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+
+	def observe(self, value: float) -> None:
+		self.counts[bisect_left(bucket_bounds, value)] += 1
+		self.count += 1
+		self.total += value
+		if value > self.max:
+			self.max = value
+
+	def percentile(self, p: float) -> float:
+		# Estimated from the buckets, interpolating linearly inside the bucket the percentile falls in
+		if self.count == 0:
+			return 0.0
+		target = p / 100 * self.count
+		seen = 0
+		for index, count in enumerate(self.counts):
+			if count and seen + count >= target:
+				lower = bucket_bounds[index - 1] if index > 0 else 0.0
+				upper = bucket_bounds[index] if index < len(bucket_bounds) else self.max
+				return min(self.max, lower + (upper - lower) * (target - seen) / count)
+			seen += count
+		return self.max
+
+	@property
+	def mean(self) -> float:
+		return self.total / self.count if self.count else 0.0
+
+
+class Timing:
+	# Histograms for one handler or module
+	__slots__ = ("wall", "cpu_total", "errors")
+
+	def __init__(self):
+		self.wall = Histogram()
+		self.cpu_total = 0.0
+		self.errors = 0
+
+
+class _Timed:
+	# Awaitable that runs a coroutine one step at a time, adding up the thread CPU time of each step
+	__slots__ = ("coro", "cpu")
+
+	def __init__(self, coro):
+		self.coro = coro
+		self.cpu = 0.0
+
+	def __await__(self):
+		coro = self.coro
+		value = None
+		error = None
+		while True:
+			start = time.thread_time()
+			try:
+				if error is not None:
+					yielded = coro.throw(error)
+				else:
+					yielded = coro.send(value)
+			except StopIteration as stop:
+				self.cpu += time.thread_time() - start
+				return stop.value
+			except BaseException:
+				self.cpu += time.thread_time() - start
+				raise
+			self.cpu += time.thread_time() - start
+			value = None
+			error = None
+			try:
+				value = yield yielded
+			except BaseException as e:  # cancellation (or anything else thrown into us) goes on to the coroutine
+				error = e
+
+
+def handler_name(func: Callable) -> Tuple[str, str]:
+	# (module, handler) names for a function, with the "modules." prefix dropped since every module has it
+	module = func.__module__
+	if module.startswith("modules."):
+		module = module[len("modules."):]
+	return module, func.__name__
+
+
+class Registry:
+	def __init__(self, watchdog=None):
+		self.watchdog = watchdog  # taskwatch.Watchdog
+		self.handlers: Dict[Tuple[str, str, str], Timing] = {}
+		# (kind, module, handler) -> timings, kind being command, message, reaction, member or background
+		self.modules: Dict[str, Timing] = {}
+		self.started_cpu = time.process_time()
+
+	def record(self, kind: str, module: str, name: str, wall: float, cpu: float, failed: bool = False) -> None:
+		handler = self.handlers.get((kind, module, name), None)
+		if handler is None:
+			handler = self.handlers[(kind, module, name)] = Timing()
+		total = self.modules.get(module, None)
+		if total is None:
+			total = self.modules[module] = Timing()
+		for timing in [handler, total]:
+			timing.wall.observe(wall)
+			timing.cpu_total += cpu
+			if failed:
+				timing.errors += 1
+
+	async def measure(self, kind: str, func: Callable[..., Awaitable], *args):
+		# Runs func(*args) and records how long it took. Exceptions are counted and passed on.
+		module, name = handler_name(func)
+		timed = _Timed(func(*args))
+		start = time.perf_counter()
+		failed = True
+		watching = self.watchdog.track(kind, module, name, timed.coro) if self.watchdog is not None else nullcontext()
+		try:
+			with watching, tracing.span(f"{module}.{name}", kind=kind):
+				result = await timed
+			failed = False
+			return result
+		finally:
+			self.record(kind, module, name, time.perf_counter() - start, timed.cpu, failed)
+
+	def process_cpu(self) -> float:
+		# CPU time used by the whole process (every thread) since the registry was created
+		return time.process_time() - self.started_cpu
+
+	def top_modules(self, count: int = None) -> List[Tuple[str, Timing]]:
+		# Modules by CPU time used, most first
+		result = sorted(self.modules.items(), key=lambda x: x[1].cpu_total, reverse=True)
+		return result if count is None else result[:count]
+
+	def top_handlers(self, count: int = None) -> List[Tuple[Tuple[str, str, str], Timing]]:
+		result = sorted(self.handlers.items(), key=lambda x: x[1].cpu_total, reverse=True)
+		return result if count is None else result[:count]
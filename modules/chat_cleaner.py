@@ -3,11 +3,8 @@ import discord
 import log
 
 
-@client.message()
+@client.message(guilds=[364480908528451584])
 async def message_checker(message: discord.Message):
-	if message.guild.id != 364480908528451584:
-		return
-
 	faulty_attachments = []
 
 	# attachment check
@@ -8,7 +8,7 @@ import modules
 import time
 
 
-@client.command(trigger="_exec", aliases=[])
+@client.command(trigger="_exec", aliases=[], cost="admin")
 async def command(command: str, message: discord.Message):
 	if message.author.id != 288438228959363073:
 		try:
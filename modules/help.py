@@ -2,6 +2,7 @@ from client import client
 
 import datetime
 import discord
+import loader
 
 
 @client.command(trigger="help", aliases=[])
@@ -19,6 +20,7 @@ async def help_command(command: str, message: discord.Message):
 	if command.lower().startswith("help "):  # a trailing space means there's text after it (Discord strips whitespace)
 
 		sub_help = command.lower()[5:]
+		loader.ensure_loaded(sub_help)  # long help is only registered once the command's module has been imported
 		sub_help = client._long_help.get(sub_help, client._long_help.get(client.alias_lookup.get(sub_help, None)))
 
 		if sub_help is None:
@@ -1,7 +1,6 @@
 from client import client
 from modules import __common__
 
-import asyncio
 import datetime
 import discord
 
@@ -162,17 +161,14 @@ async def command(command: str, message: discord.Message):
 		channel_embed = channel_embed.add_field(name="Members Currently In Channel", value=in_vc)
 
 	if isUser:
-		await message.channel.send(embed=user_embed)
-		await asyncio.sleep(0.05)
+		await client.send(message.channel, embed=user_embed)
 
 	if isServer:
-		await message.channel.send(embed=server_embed)
-		await asyncio.sleep(0.05)
+		await client.send(message.channel, embed=server_embed)
 
 	if isTextChannel or isVoiceChannel:
 		channel_embed = channel_embed.set_footer(text=datetime.datetime.utcnow().__str__())
-		await message.channel.send(embed=channel_embed)
-		await asyncio.sleep(0.05)
+		await client.send(message.channel, embed=channel_embed)
 
 	if not (isUser or isServer or (isTextChannel or isVoiceChannel)):  # if not a user, server, or channel:
 		await message.channel.send(f"Unknown user, server, or channel with ID {parts[1]}. I might not be able to 'see' that object.")
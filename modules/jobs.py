@@ -0,0 +1,51 @@
+from client import client
+from datetime import datetime
+from modules import __common__
+
+import discord
+
+
+cmd_name = "jobs"
+
+client.basic_help(title=cmd_name, desc="lists the bot's background jobs and when they run next")
+
+detailed_help = {
+	"Usage": f"{client.default_prefix}{cmd_name}",
+	"Description": "Shows every periodic background job with its schedule, when it will run next, how long it took last time, and how many runs overran or were missed. Restricted to bot admins.",
+}
+client.long_help(cmd=cmd_name, mapping=detailed_help)
+
+
+def format_seconds(value) -> str:
+	if value is None:
+		return "n/a"
+	if value < 1:
+		return f"{value*1000:.1f} ms"
+	return f"{value:.3f} s"
+
+
+@client.command(trigger=cmd_name, aliases=["background"])
+async def list_jobs(command: str, message: discord.Message):
+	if not __common__.check_permission(message.author):
+		await message.add_reaction("❌")
+		return
+
+	scheduler = client.background_jobs
+	embed = discord.Embed(title="Background jobs", description=f"{len(scheduler.jobs)} registered" if scheduler.jobs else "No background jobs registered", colour=0x404040)
+	for job in scheduler.jobs[:25]:  # embeds max out at 25 fields
+		next_run = scheduler.next_run_in(job)
+		if job.running and next_run is None:
+			next_run = "running now"
+		elif next_run is None:
+			next_run = "not scheduled"
+		else:
+			next_run = f"in {format_seconds(max(0.0, next_run))}"
+		last_started = datetime.utcfromtimestamp(job.last_started).__str__() if job.last_started is not None else "never"
+		embed = embed.add_field(name=f"{job.name}()",
+								value=f"Every {job.period}s ({job.mode}, misfire: {job.misfire}{f', jitter {job.jitter}s' if job.jitter else ''})\n"
+									f"Next run: {next_run}\n"
+									f"Last run: {last_started} UTC, took {format_seconds(job.last_duration)} (max {format_seconds(job.max_duration)})\n"
+									f"Runs: {job.runs}, failed: {job.failures}, overran: {job.overruns}, missed: {job.missed}",
+								inline=False)
+	embed = embed.set_footer(text=datetime.utcnow().__str__())
+	await message.channel.send(embed=embed)
@@ -0,0 +1,49 @@
+from client import client
+from datetime import datetime
+from modules import __common__
+
+import discord
+
+
+cmd_name = "lag"
+
+client.basic_help(title=cmd_name, desc="shows how responsive the bot's event loop is and what's been blocking it")
+
+detailed_help = {
+	"Usage": f"{client.default_prefix}{cmd_name}",
+	"Description": "Shows the event loop's scheduling delay (how late the bot gets around to things it was supposed to do), and the functions that blocked the event loop for the longest in total recently. Restricted to bot admins.",
+}
+client.long_help(cmd=cmd_name, mapping=detailed_help)
+
+
+@client.command(trigger=cmd_name, aliases=["loop"])
+async def loop_lag(command: str, message: discord.Message):
+	if not __common__.check_permission(message.author):
+		await message.add_reaction("❌")
+		return
+
+	monitor = client.loop_monitor
+	if monitor is None:
+		await message.channel.send("The event loop monitor is turned off (`loop_monitor_threshold` in config)")
+		return
+
+	lag = monitor.lag
+	embed = discord.Embed(title="Event loop lag", description=f"Sampled every {monitor.interval*1000:.0f} ms, stalls are anything over {monitor.threshold*1000:.0f} ms", colour=0x404040)
+	embed = embed.add_field(name="Scheduling delay",
+							value=f"Now: {monitor.last_lag*1000:.1f} ms\n"
+								f"p50: {lag.percentile(50)*1000:.1f} ms, p99: {lag.percentile(99)*1000:.1f} ms, max: {lag.max*1000:.1f} ms\n"
+								f"{lag.count} samples, {monitor.stall_count} stalls since startup",
+							inline=False)
+	top = monitor.top(10)
+	if top:
+		embed = embed.add_field(name=f"Worst offenders (last {monitor.window/60:.0f} minutes)",
+								value="\n".join(f"`{module}.{function}()`: {count} stalls, {total:.2f}s total, longest {longest*1000:.0f} ms"
+												for (module, function), count, total, longest in top),
+								inline=False)
+		latest = monitor.stalls[-1]
+		embed = embed.add_field(name="Latest stall",
+								value=f"{latest.duration*1000:.0f} ms in `{latest.module}.{latest.function}()` line {latest.line}, blocked in `{latest.blocked_in}` "
+									f"at {datetime.utcfromtimestamp(latest.started).__str__()} UTC",
+								inline=False)
+	embed = embed.set_footer(text=datetime.utcnow().__str__())
+	await message.channel.send(embed=embed)
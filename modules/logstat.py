@@ -6,17 +6,14 @@ from typing import List, Dict, Union
 import asyncio
 import datetime
 import discord
+import lazyimport
 import log
 import os
 import re  # wish me luck
 import time
 
-try:
-	from matplotlib import pyplot as plot
-except ImportError:
-	use_mpl = False
-else:
-	use_mpl = True
+use_mpl = lazyimport.available("matplotlib")
+plot = lazyimport.lazy_import("matplotlib.pyplot")
 
 detailed_help = {
 	"Usage": f"{client.default_prefix}logstat <days> <stat> [count]",
@@ -94,7 +91,54 @@ def match_user_id(string) -> Union[int, None]:
 		return None
 
 
-@client.command(trigger="logstat")
+def parse_lines(lines: List[str]) -> List[Dict]:
+	# Parses log lines into dicts, skipping the ones that aren't logged messages. This takes a while on a big log, so it
+	# gets run on the executor rather than on the event loop
+	parsed_logs: List[Dict] = []
+	for line in lines:
+		new_entry = {}
+
+		try:
+			new_entry["ts"] = datetime.datetime.strptime(line[:29], "[%Y-%m-%d %H:%M:%S.%f] ")
+		except:
+			continue  # if there's no timestamp, just move on
+
+		line_lvl = match_loglevel(line)
+		if line_lvl:
+			new_entry["lvl"] = line_lvl
+		else:
+			continue  # all lines we're interested in looking at should have a loglevel on them anyways
+
+		line_server_id = match_server_id(line)
+		if line_server_id:
+			new_entry["server_id"] = line_server_id
+		else:
+			continue
+
+		line_channel_id = match_channel_id(line)
+		if line_channel_id:
+			new_entry["channel_id"] = line_channel_id
+		else:
+			continue
+
+		line_message_id = match_message_id(line)
+		if line_message_id:
+			new_entry["message_id"] = line_message_id
+		else:
+			continue
+
+		line_user_id = match_user_id(line)
+		if line_user_id:
+			new_entry["user_id"] = line_user_id
+		else:
+			continue
+
+		# finally, we can add our parsed line into the list
+		parsed_logs.append(new_entry)
+	return parsed_logs
+
+
+@client.command(trigger="logstat", cost="heavy")
 async def logstat(command: str, message: discord.Message):
 	global use_mpl
 	if not __common__.check_permission(message.author):
@@ -143,59 +187,13 @@ async def logstat(command: str, message: discord.Message):
 					all_log_lines.extend(file.readlines())
 		end = time.perf_counter()
 		if profiling:
-			await message.channel.send(f"profiling: Processing time to load all log lines was {(end-start)*1000:.4f} ms")
-
-		parsed_logs: List[Dict] = []
+			await client.send(message.channel, f"profiling: Processing time to load all log lines was {(end-start)*1000:.4f} ms", merge=True, wait=False)
 
 		# we'll now loop through all the lines and parse them into dicts
-		i = 0
 		if profiling:
-			await message.channel.send(f"{len(all_log_lines)} lines to process")
+			await client.send(message.channel, f"{len(all_log_lines)} lines to process", merge=True, wait=False)
 		start = time.perf_counter()
-		for line in all_log_lines:
-			new_entry = {}
-
-			try:
-				new_entry["ts"] = datetime.datetime.strptime(line[:29], "[%Y-%m-%d %H:%M:%S.%f] ")
-			except:
-				continue  # if there's no timestamp, just move on
-
-			line_lvl = match_loglevel(line)
-			if line_lvl:
-				new_entry["lvl"] = line_lvl
-			else:
-				continue  # all lines we're interested in looking at should have a loglevel on them anyways
-
-			line_server_id = match_server_id(line)
-			if line_server_id:
-				new_entry["server_id"] = line_server_id
-			else:
-				continue
-
-			line_channel_id = match_channel_id(line)
-			if line_channel_id:
-				new_entry["channel_id"] = line_channel_id
-			else:
-				continue
-
-			line_message_id = match_message_id(line)
-			if line_message_id:
-				new_entry["message_id"] = line_message_id
-			else:
-				continue
-
-			line_user_id = match_user_id(line)
-			if line_user_id:
-				new_entry["user_id"] = line_user_id
-			else:
-				continue
-
-			# finally, we can add our parsed line into the list
-			parsed_logs.append(new_entry)
-
-			i += 1
-			if i % 10000 is 0:
-				await asyncio.sleep(0.01)
+		parsed_logs = await client.loop.run_in_executor(None, parse_lines, all_log_lines)
 
 		# i = 0
 		# split_workload = []
@@ -218,7 +216,7 @@ async def logstat(command: str, message: discord.Message):
 
 		end = time.perf_counter()
 		if profiling:
-			await message.channel.send(f"profiling: Processing time to parse all log lines: {(end-start)*1000:.4f} ms ({((end-start)*1_000_000)/len(all_log_lines):.3f} us/line)")
+			await client.send(message.channel, f"profiling: Processing time to parse all log lines: {(end-start)*1000:.4f} ms ({((end-start)*1_000_000)/len(all_log_lines):.3f} us/line)", merge=True)
 
 		await asyncio.sleep(0.1)
 
@@ -287,10 +285,10 @@ async def logstat(command: str, message: discord.Message):
 		elif parts[2] in ["active"]:
 			for entry in filtered_logs:
 				record[entry["user_id"]] += 1
-			await message.channel.send(f"In the past {int(parts[1])} days, there have been {len(record.most_common())} active unique users.")
+			await client.send(message.channel, f"In the past {int(parts[1])} days, there have been {len(record.most_common())} active unique users.")
 			return
 		else:
-			await message.channel.send("Unknown item to get records for. See help for help.")
+			await client.send(message.channel, "Unknown item to get records for. See help for help.")
 			return
 
 		if not use_mpl:
@@ -301,9 +299,9 @@ async def logstat(command: str, message: discord.Message):
 				data += f"`{'0' if i < 100 else ''}{'0' if i < 10 else ''}{str(i)}: {'0' if y < 10000 else ''}{'0' if y < 1000 else ''}{'0' if y < 100 else ''}{'0' if y < 10 else ''}{str(y)} messages:` {x}\n"
 			embed = discord.Embed(title=f"Logfile statistics for past {int(parts[1])} days", description=f"Here are the top {scoreboard} {item} in this server, sorted by number of messages.\nTotal messages: {len(record)}\n"+data)
 			try:
-				await message.channel.send(embed=embed)
+				await client.send(message.channel, embed=embed)
 			except:
-				await message.channel.send("Looks like that information was too long to post, sorry. It's been dumped to the log instead.")
+				await client.send(message.channel, "Looks like that information was too long to post, sorry. It's been dumped to the log instead.")
 				log.info(f"logstat command could not be output back (too many items). here's the data:\n{data}")
 
 		if use_mpl:
@@ -1,11 +1,13 @@
 from client import client
 from datetime import datetime
 from modules import __common__
-from typing import Tuple
+from typing import List, Tuple
 
 import asyncio
 import discord
-import markovify
+import lazyimport
+
+markovify = lazyimport.lazy_import("markovify")
 
 
 cmd_name = "markov"
@@ -24,6 +26,12 @@ forbidden_channels = [
 ]
 
 
+def make_sentence(input_messages: List[str], size: int, charlimit: int, attempts: int) -> str:
+	# Building the model takes long enough with thousands of messages to stall everything else, so this runs on the executor
+	model = markovify.NewlineText("\n".join(input_messages), state_size=size)
+	return model.make_short_sentence(max_chars=charlimit, tries=attempts)
+
+
 async def get_user_markov(user: int, message: discord.Message, size: int, charlimit: int, attempts: int) -> Tuple[int, str]:
 	input_messages = [x for x in client._connection._messages if x.author.id == user]
 	await asyncio.sleep(0.1)
@@ -44,10 +52,7 @@ async def get_user_markov(user: int, message: discord.Message, size: int, charli
 				continue
 
 	input_messages = [x.content for x in input_messages]
-	src_string = "\n".join(input_messages)
-	model = markovify.NewlineText(src_string, state_size=size)
-	await asyncio.sleep(0.1)
-	return len(input_messages), model.make_short_sentence(max_chars=charlimit, tries=attempts)
+	return len(input_messages), await client.loop.run_in_executor(None, make_sentence, input_messages, size, charlimit, attempts)
 
 
 async def get_channel_markov(channel: discord.TextChannel, size: int, charlimit: int, attempts: int) -> Tuple[int, str]:
@@ -57,12 +62,10 @@ async def get_channel_markov(channel: discord.TextChannel, size: int, charlimit:
 		return None, None  # we can't read the channel so this is noootttt going to work at all
 
 	input_messages = [x.content for x in input_messages]
-	src_string = "\n".join(input_messages)
-	model = markovify.NewlineText(src_string, state_size=size)
-	return len(input_messages), model.make_short_sentence(max_chars=charlimit, tries=attempts)
+	return len(input_messages), await client.loop.run_in_executor(None, make_sentence, input_messages, size, charlimit, attempts)
 
 
-@client.command(trigger=cmd_name)
+@client.command(trigger=cmd_name, cost="heavy")
 async def command(parts: str, message: discord.Message):
 	parts = parts.split(" ")
 
@@ -0,0 +1,117 @@
+from client import client
+from datetime import datetime
+from io import BytesIO
+from modules import __common__
+from typing import Tuple
+
+import config
+import discord
+import lazyimport
+import log
+import memtrace
+import tracemalloc
+
+
+cmd_name = "memory"
+
+client.basic_help(title=cmd_name, desc="shows what's using the bot's memory, and tracks allocations to find leaks")
+
+detailed_help = {
+	"Usage": f"{client.default_prefix}{cmd_name} [start [frames] | snap | diff | stop]",
+	"Arguments": "(nothing) - resident memory and approximate sizes of the bot's biggest structures\n"
+				f"`start` - start tracing allocations with tracemalloc, keeping `frames` frames per allocation (default {config.memory_trace_frames}). Slows the bot down until stopped.\n"
+				"`snap` - take a snapshot and show what grew since the previous one\n"
+				"`diff` - take a snapshot and show what grew since the first one\n"
+				"`stop` - stop tracing and drop the snapshots",
+	"Description": "Finds memory leaks without restarting the bot. Restricted to bot admins.",
+}
+client.long_help(cmd=cmd_name, mapping=detailed_help)
+
+
+def growth_report(new: tracemalloc.Snapshot, old: tracemalloc.Snapshot, since: str) -> Tuple[discord.Embed, discord.File]:
+	stats = memtrace.diff(new, old, "traceback" if tracemalloc.get_traceback_limit() > 1 else "lineno")
+	total = sum(x.size_diff for x in stats)
+	embed = discord.Embed(title="Memory growth", description=f"{memtrace.size_text(total)} net since {since}, by allocating line", colour=0x404040)
+	top = [memtrace.describe(x) for x in stats[:10]]
+	embed = embed.add_field(name="Biggest changes", value="```\n" + "\n".join(x[-100:] for x in top)[:1000] + "\n```" if top else "Nothing changed", inline=False)
+	embed = embed.set_footer(text=datetime.utcnow().__str__())
+	lines = []
+	for stat in stats[:100]:
+		lines.append(memtrace.describe(stat))
+		if len(stat.traceback) > 1:
+			lines.extend(f"    {x.strip()}" for x in stat.traceback.format())
+	report = discord.File(BytesIO("\n".join(lines).encode("utf-8")), filename=f"memory-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.txt")
+	return embed, report
+
+
+@client.command(trigger=cmd_name, aliases=["mem"], cost="admin")
+async def memory(command: str, message: discord.Message):
+	if not __common__.check_permission(message.author):
+		await message.add_reaction("❌")
+		return
+
+	parts = command.split(" ")
+	action = parts[1].lower() if len(parts) > 1 else None
+
+	if action == "start":
+		if tracemalloc.is_tracing():
+			await message.channel.send("Already tracing allocations")
+			return
+		try:
+			frames = int(parts[2]) if len(parts) > 2 else config.memory_trace_frames
+		except ValueError:
+			await message.channel.send("Invalid number of frames")
+			return
+		memtrace.start(max(1, frames))
+		log.info(f"tracemalloc started with {frames} frame(s) by {message.author.name}#{message.author.discriminator}")
+		await message.channel.send(f"Tracing allocations, keeping {frames} frame(s) each. Only allocations from now on are seen, so take a first `snap` to compare against.")
+		return
+
+	if action == "stop":
+		if not tracemalloc.is_tracing():
+			await message.channel.send("Not tracing allocations")
+			return
+		memtrace.stop()
+		log.info(f"tracemalloc stopped by {message.author.name}#{message.author.discriminator}")
+		await message.channel.send("Stopped tracing allocations")
+		return
+
+	if action in ["snap", "snapshot", "diff"]:
+		if not tracemalloc.is_tracing():
+			await message.channel.send(f"Not tracing allocations, start with `{client.default_prefix}{cmd_name} start`")
+			return
+		baseline = memtrace.baseline
+		async with message.channel.typing():
+			new, previous = await client.loop.run_in_executor(None, memtrace.snapshot)
+			old, since = (baseline, "the first snapshot") if action == "diff" else (previous, "the previous snapshot")
+			if old is None:
+				await message.channel.send(f"Took the first snapshot ({memtrace.size_text(sum(x.size for x in new.statistics('filename')))} traced), "
+											"run this again later to see what grew")
+				return
+			embed, report = await client.loop.run_in_executor(None, growth_report, new, old, since)
+		await message.channel.send(embed=embed, file=report)
+		return
+
+	if action is not None:
+		await message.channel.send(f"Unknown option `{action}`, see `{client.default_prefix}help {cmd_name}`")
+		return
+
+	async with message.channel.typing():
+		structures = memtrace.known_structures(client)
+		embed = discord.Embed(title="Memory usage", colour=0x404040)
+		rss = memtrace.rss()
+		peak = lazyimport.max_rss()
+		embed = embed.add_field(name="Process", value=f"Resident: {f'{rss:.1f} MiB' if rss is not None else 'unknown'}\n"
+														f"Peak resident: {f'{peak:.1f} MiB' if peak is not None else 'unknown'}")
+		if tracemalloc.is_tracing():
+			current, traced_peak = tracemalloc.get_traced_memory()
+			embed = embed.add_field(name="tracemalloc", value=f"Tracing {memtrace.size_text(current)} (peak {memtrace.size_text(traced_peak)}), "
+																f"using {memtrace.size_text(tracemalloc.get_tracemalloc_memory())} itself")
+		else:
+			embed = embed.add_field(name="tracemalloc", value="Not tracing")
+		embed = embed.add_field(name="Biggest structures (approximate)",
+								value="\n".join(f"`{name}`: {memtrace.size_text(size)}{f' ({length} entries)' if length is not None else ''}"
+												for name, length, size in structures[:15])[:1024],
+								inline=False)
+		embed = embed.set_footer(text=datetime.utcnow().__str__())
+	await message.channel.send(embed=embed)
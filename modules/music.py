@@ -1,20 +1,20 @@
 from client import client
 from collections import defaultdict
 from datetime import datetime
-from exceptions import BaseFrameworkError
+from exceptions import BaseFrameworkError, QueueFullError
 from typing import Union, Dict, List
 
 import asyncio
 import discord
 import json
 import key
+import lazyimport
 import log
 import os
 import random
 import socket
 import time
 import urllib
-import youtube_dl
 
 
 detailed_help = {
@@ -46,6 +46,8 @@ guild_now_playing_song: Dict[int, "Song"] = {}
 guild_volume: Dict[int, float] = defaultdict(lambda: float(1.0))
 active_clients: Dict[int, discord.VoiceClient] = {}
 
+youtube_dl = lazyimport.lazy_import("youtube_dl")  # only needed once someone adds a song
+
 
 class EmptySource(discord.AudioSource):
 	used = False
@@ -436,7 +438,12 @@ async def command(command: str, message: discord.Message):
 			url = command.replace("music add ", "", 1)
 
 			try:
-				song = Song(url=url, requester=message.author.mention)
+				async with client.work_slot("heavy", message):
+					# youtube_dl blocks for as long as the lookup takes, so it runs on the executor instead of the event loop
+					song = await client.loop.run_in_executor(None, lambda: Song(url=url, requester=message.author.mention))
+			except QueueFullError:
+				await message.channel.send("Too many songs are being looked up right now, try adding it again in a bit.")
+				return
 			except Exception:
 				await message.channel.send("Error getting song information: song not added to queue")
 				# log.warning("Unable to add song", include_exception=True)  disabled because it kinda spams the log a bit
@@ -635,14 +642,20 @@ async def command(command: str, message: discord.Message):
 			if (data['randomize'] or force_randomize) and not no_force_randomize:
 				random.shuffle(loaded_playlist)
 
-			playlist_objects = []
+			def load_playlist():
+				# the first few songs get looked up with youtube_dl, which blocks, so this runs on the executor
+				playlist_objects = []
+				i = 0
+				for song in loaded_playlist:
+					playlist_objects.append(Song(url=song,
+												requester=f"{message.author.mention} from playlist \"{parts[2]}.json\"",
+												noload=False if i < 3 else True))
+					i += 1
+				return playlist_objects
+
 			errored = False
-			i = 0
-			for song in loaded_playlist:
-				playlist_objects.append(Song(url=song,
-											requester=f"{message.author.mention} from playlist \"{parts[2]}.json\"",
-											noload=False if i < 3 else True))
-				i += 1
+			async with client.work_slot("heavy", message):
+				playlist_objects = await client.loop.run_in_executor(None, load_playlist)
 
 			current_queue = guild_queue[message.guild.id]
 			if current_queue is None:
@@ -694,5 +707,4 @@ async def music_capable_check():
 
 @client.shutdown
 async def exit_all_vcs():
-	for vc in client.voice_clients:
-		await vc.disconnect()
+	await asyncio.gather(*[vc.disconnect() for vc in client.voice_clients], return_exceptions=True)
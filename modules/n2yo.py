@@ -1,10 +1,10 @@
 from client import client
-from typing import List
 
 import aiohttp
 import datetime
 import discord
 import key
+import ratelimit
 
 
 client.basic_help(title="n2yo", desc="Shows information about amateur satellites.")
@@ -43,14 +43,19 @@ last_pass_req = []
 # max 600 req/1 hour
 # max 100 req/5 min
 
-req_history: List[datetime.datetime] = []
-
 fast_cooldown_max = 100  # This many requests in fast_cooldown_window amount of time will trigger the cooldown
 fast_cooldown_window = datetime.timedelta(minutes=5)
 
 slow_cooldown_max = 600  # N2YO.com specifies 1000/hr max but we'll say 600 to be safe
 slow_cooldown_window = datetime.timedelta(hours=1)
 
+# sliding windows rather than token buckets, which would let through up to twice these in a window
+api_buckets = [
+	ratelimit.SlidingWindow(5, 3),  # instantaneous cooldown
+	ratelimit.SlidingWindow(fast_cooldown_max, fast_cooldown_window.total_seconds()),
+	ratelimit.SlidingWindow(slow_cooldown_max, slow_cooldown_window.total_seconds()),
+]
+
 sat_id_embed = discord.Embed(title="Common satellite NORAD IDs",
 							description="This command requires satellites to be identified by their NORAD ID. Any ID "
 										f"can be used but here are some common ones.\n{sat_norad_ids}")
@@ -58,16 +63,7 @@ sat_id_embed = discord.Embed(title="Common satellite NORAD IDs",
 
 def check_cooldowns():
 	"""Return true if cooldowns check out."""
-	global req_history
-	now = datetime.datetime.utcnow()
-	if not len([x for x in req_history if now-x < datetime.timedelta(seconds=3)]) < 5:  # instantaneous cooldown
-		return False
-	if not len([x for x in req_history if now-x < fast_cooldown_window]) < fast_cooldown_max:
-		return False
-	if not len([x for x in req_history if now-x < slow_cooldown_window]) < slow_cooldown_max:
-		return False
-	req_history.append(now)
-	return True
+	return ratelimit.admit(api_buckets) is None
 
 
 def deg2hms(degrees):
@@ -133,7 +129,7 @@ async def process_command(command: str, message: discord.Message):
 	except (ValueError, IndexError):
 		pass
 
-	if debug: await message.channel.send(f"debug: running command with arguments `{parts}`")
+	if debug: await client.send(message.channel, f"debug: running command with arguments `{parts}`", merge=True, wait=False)
 
 
 	if len(parts) is 1:
@@ -142,13 +138,13 @@ async def process_command(command: str, message: discord.Message):
 		embed = embed.add_field(name="Get current satellite position", value=get_sat_pos)
 		embed = embed.add_field(name="Get upcoming passes", value=get_passes)
 		embed = embed.set_footer(text=datetime.datetime.utcnow().__str__())
-		await message.channel.send(embed=embed)
+		await client.send(message.channel, embed=embed)
 		return
 
 
 	if parts[1] == "sats":
-		if debug: await message.channel.send("debug: returning satellite info embed")
-		await message.channel.send(embed=sat_id_embed)
+		if debug: await client.send(message.channel, "debug: returning satellite info embed", merge=True, wait=False)
+		await client.send(message.channel, embed=sat_id_embed)
 		return
 
 	apicount = "--apicount" in parts
@@ -159,22 +155,22 @@ async def process_command(command: str, message: discord.Message):
 
 	if parts[1] in ["passinfo"]:
 		if not last_pass_req:
-			await message.channel.send("State error: `passes` command has not been run; no passes available to get details on")
+			await client.send(message.channel, "State error: `passes` command has not been run; no passes available to get details on")
 			return
 		try:
 			num = int(parts[2])
 		except ValueError:
-			await message.channel.send(f"Argument error: Invalid integer provided (got: {parts[2]})")
+			await client.send(message.channel, f"Argument error: Invalid integer provided (got: {parts[2]})")
 			return
 		except IndexError:
 			# no second number
-			await message.channel.send("Argument error: No pass specified")
+			await client.send(message.channel, "Argument error: No pass specified")
 			return
 
 		try:
 			target_pass = last_pass_req["passes"][num]
 		except IndexError:
-			await message.channel.send("State error: Index out of bounds")
+			await client.send(message.channel, "State error: Index out of bounds")
 			return
 
 		embed = discord.Embed(title="Satellite pass details", description=f"Information about satellite pass of {last_pass_req['info']['satname']} (id {last_pass_req['info']['satid']})")
@@ -191,14 +187,14 @@ async def process_command(command: str, message: discord.Message):
 								value=f"`Timestamp: {datetime.datetime.utcfromtimestamp(target_pass['endUTC']).__str__()} UTC`\n"
 										f"`Azimuth: {target_pass['endAz']} degrees`\n",
 								inline=False)
-		await message.channel.send(embed=embed)
+		await client.send(message.channel, embed=embed)
 		return
 
 	if not check_cooldowns():
-		await message.channel.send("Sorry, but the API limit has been reached. Please try again later, or go to the n2yo.com website.")
+		await client.send(message.channel, "Sorry, but the API limit has been reached. Please try again later, or go to the n2yo.com website.")
 		return
 
-	if debug: await message.channel.send("debug: cooldowns passed, continuing")
+	if debug: await client.send(message.channel, "debug: cooldowns passed, continuing", merge=True, wait=False)
 
 	if parts[1] in ["get_pos", "pos", "position"]:
 		try:
@@ -206,53 +202,53 @@ async def process_command(command: str, message: discord.Message):
 			parts.pop(parts.index("--alt"))
 		except IndexError:
 			# no following number
-			await message.channel.send("Argument error: Altitude argument provided but no altitude followed. Run `n2yo` without arguments for command help.")
+			await client.send(message.channel, "Argument error: Altitude argument provided but no altitude followed. Run `n2yo` without arguments for command help.")
 			return
 		except ValueError:
 			# --alt not provided at all. just use 100m as default?
-			if debug: await message.channel.send("debug: no --alt provided, defaulting to 100m")
+			if debug: await client.send(message.channel, "debug: no --alt provided, defaulting to 100m", merge=True, wait=False)
 			target_alt = 100
 		else:
 			try:
 				target_alt = int(target_alt)
-				if debug: await message.channel.send(f"debug: successfully obtained altitude argument, value {target_alt}")
+				if debug: await client.send(message.channel, f"debug: successfully obtained altitude argument, value {target_alt}", merge=True, wait=False)
 			except ValueError:
 				# invalid altitude
-				await message.channel.send(f"Argument error: Provided altitude could not be converted to integer. (got: {target_alt})")
+				await client.send(message.channel, f"Argument error: Provided altitude could not be converted to integer. (got: {target_alt})")
 				return
 
 		show_dx = "--dx" in parts
 		if show_dx:
 			parts.pop(parts.index("--dx"))
-			if debug: await message.channel.send("debug: using --dx argument, getting 2 positions instead and showing movement (dt=1)")
+			if debug: await client.send(message.channel, "debug: using --dx argument, getting 2 positions instead and showing movement (dt=1)", merge=True, wait=False)
 
 		if len(parts) < 4:
-			await message.channel.send("Argument error: Not enough arguments provided for specified operation. Run `n2yo` without arguments for command help.")
+			await client.send(message.channel, "Argument error: Not enough arguments provided for specified operation. Run `n2yo` without arguments for command help.")
 			return
 
 		# get our targeted satellite
 		target_sat = parts[2]
 		try: target_sat = int(target_sat)  # Literally only doing this so the folded code will look neat in PyCharm (it doesn't fold single lines >:( )
 		except ValueError:
-			await message.channel.send(f"Argument error: Target satellite could not be converted to integer. Run `n2yo` without arguments for command help. (got: {target_sat})")
+			await client.send(message.channel, f"Argument error: Target satellite could not be converted to integer. Run `n2yo` without arguments for command help. (got: {target_sat})")
 			return
 
 		# get our targeted grid
 		target_grid = parts[3]
 		if len(target_grid) is not 6:
-			await message.channel.send(f"Argument error: Provided grid not 6 characters long. Please use your 6 digit Maidenhead grid locator only. Run `n2yo` without arguments for command help. (got: {target_grid})")
+			await client.send(message.channel, f"Argument error: Provided grid not 6 characters long. Please use your 6 digit Maidenhead grid locator only. Run `n2yo` without arguments for command help. (got: {target_grid})")
 			return
 		if not (target_grid[:2].isalpha() and target_grid[2:4].isdigit() and target_grid[4:6].isalpha()):
-			await message.channel.send(f"Argument error: Provided grid not formatted correctly. Format must be 6 digit Maidenhead grid locator. (got: {target_grid})")
+			await client.send(message.channel, f"Argument error: Provided grid not formatted correctly. Format must be 6 digit Maidenhead grid locator. (got: {target_grid})")
 			return
 		target_lat, target_long = get_lat_long(target_grid)
-		if debug: await message.channel.send(f"debug: successfully got target coordinates {target_lat} {target_long}")
+		if debug: await client.send(message.channel, f"debug: successfully got target coordinates {target_lat} {target_long}", merge=True, wait=False)
 
 		async with message.channel.typing():
 			async with aiohttp.ClientSession() as connection:
 
 				target_url = f"{base}/positions/{target_sat}/{target_lat}/{target_long}/{target_alt}/{2 if show_dx else 1}/"
-				if debug: await message.channel.send(f"debug: calling api url `{target_url}`")
+				if debug: await client.send(message.channel, f"debug: calling api url `{target_url}`", merge=True, wait=False)
 				async with connection.get(target_url+api_key) as response:
 					info = await response.json()
 
@@ -302,81 +298,81 @@ async def process_command(command: str, message: discord.Message):
 			else:
 				embed = embed.set_footer(text=f"Information provided thanks to the N2YO.com API")
 
-		await message.channel.send(embed=embed)
+		await client.send(message.channel, embed=embed)
 		return
 
 	if parts[1] in ["passes"]:
 		# params: n2yo passes satid grid min_elevation --alt val --days x --apicount --debug
 		if len(parts) < 4:
-			await message.channel.send("Argument error: Not enough arguments provided for specified operation. Run `n2yo` without arguments for command help.")
+			await client.send(message.channel, "Argument error: Not enough arguments provided for specified operation. Run `n2yo` without arguments for command help.")
 			return
 
 		target_sat = parts[2]
 		try:
 			target_sat = int(target_sat)
 		except ValueError:
-			await message.channel.send(f"Argument error: Target satellite could not be converted to integer. Run `n2yo` without arguments for command help. (got: {target_sat})")
+			await client.send(message.channel, f"Argument error: Target satellite could not be converted to integer. Run `n2yo` without arguments for command help. (got: {target_sat})")
 			return
 
 		target_grid = parts[3]
 		if len(target_grid) is not 6:
-			await message.channel.send(f"Argument error: Provided grid not 6 characters long. Please use your 6 digit Maidenhead grid locator only. Run `n2yo` without arguments for command help. (got: {target_grid})")
+			await client.send(message.channel, f"Argument error: Provided grid not 6 characters long. Please use your 6 digit Maidenhead grid locator only. Run `n2yo` without arguments for command help. (got: {target_grid})")
 			return
 		if not target_grid[:2].isalpha() or not target_grid[2:4].isdigit() or not target_grid[4:6].isalpha():
-			await message.channel.send(f"Argument error: Provided grid not formatted correctly. Format must be 6 digit Maidenhead grid locator. (got: {target_grid})")
+			await client.send(message.channel, f"Argument error: Provided grid not formatted correctly. Format must be 6 digit Maidenhead grid locator. (got: {target_grid})")
 			return
 		target_lat, target_long = get_lat_long(target_grid)
 
-		if debug: await message.channel.send(f"debug: successfully got target coordinates {target_lat} {target_long}")
+		if debug: await client.send(message.channel, f"debug: successfully got target coordinates {target_lat} {target_long}", merge=True, wait=False)
 
 		target_elevation = parts[4]
 		try:
 			target_elevation = int(target_elevation)
 		except ValueError:
-			await message.channel.send(f"Argument error: Target elevation could not be converted to integer. Run `n2yo` without arguments for command help. (got: {target_elevation})")
+			await client.send(message.channel, f"Argument error: Target elevation could not be converted to integer. Run `n2yo` without arguments for command help. (got: {target_elevation})")
 			return
 
 		try:
 			target_alt = parts[parts.index("--alt")+1]
 		except IndexError:
 			# no following number
-			await message.channel.send("Argument error: Altitude argument provided but no altitude followed. Run `n2yo` without arguments for command help.")
+			await client.send(message.channel, "Argument error: Altitude argument provided but no altitude followed. Run `n2yo` without arguments for command help.")
 			return
 		except ValueError:
 			# --alt not provided at all. just use 100m as default?
-			if debug: await message.channel.send("debug: no --alt provided, defaulting to 100m")
+			if debug: await client.send(message.channel, "debug: no --alt provided, defaulting to 100m", merge=True, wait=False)
 			target_alt = 100
 		else:
 			try:
 				target_alt = int(target_alt)
-				if debug: await message.channel.send(f"debug: successfully obtained altitude argument, value {target_alt}")
+				if debug: await client.send(message.channel, f"debug: successfully obtained altitude argument, value {target_alt}", merge=True, wait=False)
 			except ValueError:
 				# invalid altitude
-				await message.channel.send(f"Argument error: Provided altitude could not be converted to integer. (got: {target_alt})")
+				await client.send(message.channel, f"Argument error: Provided altitude could not be converted to integer. (got: {target_alt})")
 				return
 
 		try:
 			target_days = parts[parts.index("--days")+1]
 		except IndexError:
 			# no number followed
-			await message.channel.send("Argument error: Days argument provided but no number followed. Run `n2yo` without arguments for command help.")
+			await client.send(message.channel, "Argument error: Days argument provided but no number followed. Run `n2yo` without arguments for command help.")
 			return
 		except ValueError:
-			if debug: await message.channel.send("debug: no --days provided, defaulting 3")
+			if debug: await client.send(message.channel, "debug: no --days provided, defaulting 3", merge=True, wait=False)
 			target_days = 3
 		else:
 			try:
 				target_days = int(target_days)
-				if debug: await message.channel.send(f"debug: successfully obtained --days argument, value {target_days}")
+				if debug: await client.send(message.channel, f"debug: successfully obtained --days argument, value {target_days}", merge=True, wait=False)
 			except ValueError:
-				await message.channel.send(f"Argument error: Provided future day count could not be converted to integer. (got: {target_days})")
+				await client.send(message.channel, f"Argument error: Provided future day count could not be converted to integer. (got: {target_days})")
 				return
 
 		async with message.channel.typing():
 			async with aiohttp.ClientSession() as connection:
 
 				target_url = f"{base}/radiopasses/{target_sat}/{target_lat}/{target_long}/{target_alt}/{target_days}/{target_elevation}/"
-				if debug: await message.channel.send(f"debug: calling api url `{target_url}`")
+				if debug: await client.send(message.channel, f"debug: calling api url `{target_url}`", merge=True, wait=False)
 				async with connection.get(target_url+api_key) as response:
 					info = await response.json()
 
@@ -395,4 +391,4 @@ async def process_command(command: str, message: discord.Message):
 			else:
 				embed = embed.set_footer(text=f"Information provided thanks to the N2YO.com API")
 
-		await message.channel.send(embed=embed)
+		await client.send(message.channel, embed=embed)
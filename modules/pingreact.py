@@ -1,12 +1,11 @@
 from client import client
 
 import discord
-import prefix
 
 
 @client.message()
 async def ping_reaction(message: discord.Message):
-	is_cmd, _ = prefix.check_bot_prefix(message.content, client.prefixes)
+	is_cmd, _ = client.match_prefix(message)
 	if not is_cmd:
 		if (f"<@!{client.user.id}>" in message.content) or (f"<@{client.user.id}>" in message.content):
 			try:
@@ -0,0 +1,67 @@
+from client import client
+from config import shutdown_user
+from datetime import datetime
+from io import BytesIO
+from profiler import SamplingProfiler
+
+import config
+import discord
+import log
+
+
+cmd_name = "profile"
+
+client.basic_help(title=cmd_name, desc="profiles the running bot for a while and posts the results")
+
+detailed_help = {
+	"Usage": f"{client.default_prefix}{cmd_name} [seconds] [interval ms]",
+	"Arguments": f"`seconds` - how long to profile for (default {config.profiler_duration:g}, at most {config.profiler_max_duration:g})\n"
+				f"`interval ms` - time between samples (default {config.profiler_interval*1000:g})",
+	"Description": "Samples what every thread in the bot (the event loop, voice players, executor threads) is running, then posts the "
+					"stacks collapsed for flamegraph.pl/speedscope, a pstats top list per thread, and a .prof file for snakeviz. "
+					"Restricted to the bot owner.",
+}
+client.long_help(cmd=cmd_name, mapping=detailed_help)
+
+running = False
+
+
+@client.command(trigger=cmd_name, aliases=["prof"], cost="admin")
+async def profile(command: str, message: discord.Message):
+	global running
+	if message.author.id != shutdown_user:
+		await message.add_reaction("❌")
+		return
+
+	parts = command.split(" ")
+	try:
+		duration = float(parts[1]) if len(parts) > 1 else config.profiler_duration
+		interval = float(parts[2]) / 1000 if len(parts) > 2 else config.profiler_interval
+	except ValueError:
+		await message.channel.send("Invalid number of seconds or sampling interval")
+		return
+	if not 0 < duration <= config.profiler_max_duration or not 0.0005 <= interval <= 1:
+		await message.channel.send(f"Profile for between 0 and {config.profiler_max_duration:g} seconds, sampling every 0.5 to 1000 ms")
+		return
+	if running:
+		await message.channel.send("Already profiling, wait for that to finish first")
+		return
+
+	running = True
+	try:
+		await message.channel.send(f"Profiling for {duration:g} seconds...")
+		log.info(f"Sampling profiler started for {duration}s by {message.author.name}#{message.author.discriminator}")
+		sampler = SamplingProfiler(interval)
+		await client.loop.run_in_executor(None, sampler.run, duration)
+		collapsed, top, prof = await client.loop.run_in_executor(None, lambda: (sampler.collapsed(), sampler.top(), sampler.dump_stats()))
+	finally:
+		running = False
+
+	stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+	threads = ", ".join(name for name, _ in sampler.threads())
+	await message.channel.send(f"{sampler.samples} samples over {sampler.duration:.1f}s, sampling took {sampler.overhead:.3f}s. Threads sampled: {threads}",
+								files=[
+									discord.File(BytesIO(collapsed.encode("utf-8")), filename=f"profile-{stamp}.collapsed.txt"),
+									discord.File(BytesIO(top.encode("utf-8")), filename=f"profile-{stamp}.top.txt"),
+									discord.File(BytesIO(prof), filename=f"profile-{stamp}.prof"),
+								])
@@ -0,0 +1,144 @@
+# Exports the bot's counters over HTTP in the Prometheus text exposition format, for scraping alongside everything else.
+#
+# Turned off unless config.metrics_port is set. The server only listens on config.metrics_host (localhost by default)
+# and answers GET /metrics, and nothing is computed until a scrape comes in, so it costs nothing while nobody's looking.
+# When running as several shard processes (supervisor.py) each shard listens on metrics_port plus its shard ID.
+
+from client import client
+from typing import Dict, List
+
+import asyncio
+import config
+import log
+import metrics
+import shards
+import sys
+import time
+
+
+server: asyncio.AbstractServer = None
+
+
+def escape(value) -> str:
+	return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def labels(**pairs) -> str:
+	return "{" + ",".join(f'{x}="{escape(y)}"' for x, y in pairs.items()) + "}" if pairs else ""
+
+
+class Exposition:
+	def __init__(self):
+		self.lines: List[str] = []
+
+	def metric(self, name: str, kind: str, description: str, samples: Dict[str, float]) -> None:
+		# samples maps label string (from labels()) -> value
+		self.lines.append(f"# HELP {name} {description}")
+		self.lines.append(f"# TYPE {name} {kind}")
+		for label, value in samples.items():
+			self.lines.append(f"{name}{label} {float(value)!r}")
+
+	def histogram(self, name: str, description: str, histograms: Dict[str, metrics.Histogram]) -> None:
+		# histograms maps label pairs (as a dict) frozen into a tuple -> histogram
+		self.lines.append(f"# HELP {name} {description}")
+		self.lines.append(f"# TYPE {name} histogram")
+		for pairs, histogram in histograms.items():
+			pairs = dict(pairs)
+			cumulative = 0
+			for bound, count in zip(metrics.bucket_bounds + [float("inf")], histogram.counts):
+				cumulative += count
+				self.lines.append(f"{name}_bucket{labels(**pairs, le='+Inf' if bound == float('inf') else repr(bound))} {cumulative}")
+			self.lines.append(f"{name}_sum{labels(**pairs)} {histogram.total!r}")
+			self.lines.append(f"{name}_count{labels(**pairs)} {histogram.count}")
+
+	def text(self) -> str:
+		return "\n".join(self.lines) + "\n"
+
+
+def collect() -> str:
+	out = Exposition()
+	uptime = time.perf_counter() - client.first_execution if client.first_execution is not None else 0.0
+	out.metric("bot_uptime_seconds", "gauge", "Seconds since the bot was started.", {"": uptime})
+	out.metric("bot_messages_total", "counter", "Messages seen.", {"": client.message_count})
+	out.metric("bot_commands_total", "counter", "Commands run.", {"": client.command_count})
+	out.metric("bot_commands_rejected_total", "counter", "Commands refused by rate limits.", {"": client.rejected_command_count})
+	out.metric("bot_message_handler_runs_skipped_total", "counter", "Message handler runs avoided by handler filters.", {"": client.skipped_handler_count})
+	out.metric("bot_message_handler_timeouts_total", "counter", "Message handlers cancelled for going over their time budget.",
+				{labels(handler=x): y for x, y in client.handler_timeouts.items()})
+	out.metric("bot_guilds", "gauge", "Servers the bot is in.", {"": len(client.guilds)})
+	out.metric("bot_voice_clients", "gauge", "Connected voice clients.", {"": len(client.voice_clients)})
+	out.metric("bot_voice_clients_playing", "gauge", "Voice clients currently playing.", {"": len([x for x in client.voice_clients if x.is_playing()])})
+	out.metric("bot_gateway_latency_seconds", "gauge", "Time between a gateway heartbeat and its acknowledgement.", {"": client.latency})
+
+	registry = client.metrics
+	out.histogram("bot_handler_duration_seconds", "Wall clock time taken by commands, handlers and background jobs.",
+				{(("kind", kind), ("module", module), ("handler", name)): timing.wall for (kind, module, name), timing in registry.handlers.items()})
+	out.metric("bot_handler_cpu_seconds_total", "counter", "CPU time used by commands, handlers and background jobs.",
+				{labels(kind=kind, module=module, handler=name): timing.cpu_total for (kind, module, name), timing in registry.handlers.items()})
+	out.metric("bot_handler_errors_total", "counter", "Commands, handlers and background jobs that raised or were cancelled.",
+				{labels(kind=kind, module=module, handler=name): timing.errors for (kind, module, name), timing in registry.handlers.items()})
+	out.metric("bot_process_cpu_seconds_total", "counter", "CPU time used by the whole process.", {"": registry.process_cpu()})
+
+	monitor = client.loop_monitor
+	if monitor is not None:
+		out.histogram("bot_loop_lag_seconds", "Event loop scheduling delay.", {(): monitor.lag})
+		out.metric("bot_loop_stalls_total", "counter", "Times the event loop was blocked for longer than the stall threshold.", {"": monitor.stall_count})
+
+	out.metric("bot_worker_queue_length", "gauge", "Commands waiting for a worker slot, by cost class.",
+				{labels(cost=x): y.queued for x, y in client.workers.classes.items()})
+	out.metric("bot_worker_running", "gauge", "Commands holding a worker slot, by cost class.",
+				{labels(cost=x): y.running for x, y in client.workers.classes.items()})
+	out.metric("bot_outbound_queue_length", "gauge", "Messages waiting in outbound send queues.", {"": client.outbound.depth()})
+	out.metric("bot_outbound_sends_total", "counter", "Requests made by the outbound send queues.", {"": client.outbound.sent})
+	out.metric("bot_outbound_merged_total", "counter", "Queued messages merged into another message.", {"": client.outbound.merged})
+
+	cache = client._connection._messages
+	if cache is not None:
+		out.metric("bot_message_cache_messages", "gauge", "Messages in the message cache.", {"": len(cache)})
+		if hasattr(cache, "evicted"):
+			out.metric("bot_message_cache_quota_evictions_total", "counter", "Messages dropped from the cache by guild/channel quotas.", {"": cache.evicted})
+	out.metric("bot_background_job_runs_total", "counter", "Background job runs.", {labels(job=x.name): x.runs for x in client.background_jobs.jobs})
+	out.metric("bot_background_job_missed_total", "counter", "Background job runs missed or skipped.", {labels(job=x.name): x.missed for x in client.background_jobs.jobs})
+
+	music = sys.modules.get("modules.music", None)
+	if music is not None:
+		out.metric("bot_music_queue_length", "gauge", "Songs queued, by server.", {labels(guild=x): len(y) for x, y in music.guild_queue.items()})
+	return out.text()
+
+
+async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+	try:
+		request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+		method, path = (request.split(b"\r\n", 1)[0].split(b" ") + [b"", b""])[:2]
+		if method != b"GET" or path.split(b"?", 1)[0] != b"/metrics":
+			status, body, content_type = "404 Not Found", b"Not found, try /metrics\n", "text/plain"
+		else:
+			status, body, content_type = "200 OK", collect().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+		writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii") + body)
+		await writer.drain()
+	except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+		pass
+	except Exception:
+		log.warning("Error answering a metrics scrape", include_exception=True)
+	finally:
+		writer.close()
+
+
+@client.ready
+async def start_metrics_server():
+	global server
+	if config.metrics_port is None or server is not None:
+		return
+	port = config.metrics_port + (shards.shard_id or 0)
+	try:
+		server = await asyncio.start_server(handle, config.metrics_host, port)
+	except OSError:
+		log.error(f"Could not start the metrics endpoint on {config.metrics_host}:{port}", include_exception=True)
+		return
+	log.info(f"Serving Prometheus metrics on http://{config.metrics_host}:{port}/metrics")
+
+
+@client.shutdown
+async def stop_metrics_server():
+	if server is not None:
+		server.close()
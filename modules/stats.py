@@ -2,17 +2,15 @@ from client import client
 from datetime import datetime
 
 import discord
+import lazyimport
 import os
+import shards
 import socket
 import threading
 import time
 
-try:
-	import psutil
-except ModuleNotFoundError:
-	has_psutil = False
-else:
-	has_psutil = True
+has_psutil = lazyimport.available("psutil")
+psutil = lazyimport.lazy_import("psutil")
 
 
 cmd_name = "stats"
@@ -20,8 +18,9 @@ cmd_name = "stats"
 client.basic_help(title=cmd_name, desc=f"shows various running statistics of {client.bot_name}")
 
 detailed_help = {
-	"Usage": f"{client.default_prefix}{cmd_name}",
-	"Description": f"This command shows different available statistics of {client.bot_name}, including servers, uptime, and commands run.",
+	"Usage": f"{client.default_prefix}{cmd_name} [--uptime] [--hostname] [--handlers]",
+	"Description": f"This command shows different available statistics of {client.bot_name}, including servers, uptime, and commands run. "
+					"`--handlers` instead shows how long each module's commands and handlers take (50th/95th/99th percentile) and how much of the bot's CPU time each module uses.",
 	"Related": f"`{client.default_prefix} info` - shows information about {client.bot_name}",
 }
 client.long_help(cmd=cmd_name, mapping=detailed_help)
@@ -41,6 +40,32 @@ async def readier():
 	return
 
 
+def format_duration(value: float) -> str:
+	if value < 1:
+		return f"{value*1000:.1f}ms"
+	return f"{value:.2f}s"
+
+
+def handler_stats_embed() -> discord.Embed:
+	registry = client.metrics
+	process_cpu = registry.process_cpu()
+	tracked_cpu = sum(x.cpu_total for x in registry.modules.values())
+	lines = [f"{'module':<16} {'runs':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'cpu':>6}"]
+	for module, timing in registry.top_modules(15):
+		lines.append(f"{module[:16]:<16} {timing.wall.count:>7} {format_duration(timing.wall.percentile(50)):>8} {format_duration(timing.wall.percentile(95)):>8} "
+					f"{format_duration(timing.wall.percentile(99)):>8} {timing.cpu_total / process_cpu * 100 if process_cpu else 0:>5.1f}%")
+	embed = discord.Embed(title=f"{client.bot_name} handler stats", description="```\n" + "\n".join(lines) + "\n```", color=0x404040)
+	embed = embed.add_field(name="CPU time", value=f"{process_cpu:.2f}s used by the process since startup, {tracked_cpu / process_cpu * 100 if process_cpu else 0:.1f}% of it in module code", inline=False)
+
+	slowest = sorted(registry.handlers.items(), key=lambda x: x[1].wall.percentile(99), reverse=True)[:8]
+	if slowest:
+		embed = embed.add_field(name="Slowest handlers (p99)",
+								value="\n".join(f"`{module}.{name}` ({kind}): {format_duration(timing.wall.percentile(99))}, {timing.wall.count} runs, {timing.errors} failed"
+												for (kind, module, name), timing in slowest), inline=False)
+	embed = embed.set_footer(text=datetime.utcnow().__str__())
+	return embed
+
+
 @client.command(trigger=cmd_name, aliases=["statistics", "s"])
 async def statistics(command: str, message: discord.Message):
 	if "--hostname" in command:
@@ -53,6 +78,10 @@ async def statistics(command: str, message: discord.Message):
 		await message.channel.send(f"Uptime:\n`{up:.3f}` seconds\n`{up/86400:.4f}` days")
 		return
 
+	if "--handlers" in command:
+		await message.channel.send(embed=handler_stats_embed())
+		return
+
 	async with message.channel.typing():
 
 		if has_psutil:
@@ -82,8 +111,20 @@ async def statistics(command: str, message: discord.Message):
 		mps = client.message_count / up
 		msg_freq = up / client.message_count
 		embed = embed.add_field(name="Total messages sent in all servers since last reboot", value=f"{client.message_count} ({mps:.4f}/sec) ({msg_freq:.4f} sec/message)", inline=False)
+		embed = embed.add_field(name="Message handler runs skipped by filters", value=client.skipped_handler_count, inline=False)
+		embed = embed.add_field(name="Outbound message queue", value=f"{client.outbound.depth()} waiting (most ever: {client.outbound.max_queued})\n"
+																		f"{client.outbound.sent} sent, {client.outbound.merged} merged into other messages", inline=False)
 		n_connected = len(client.voice_clients)
 		n_playing = len([x for x in client.voice_clients if x.is_playing()])
+		if shards.cluster:
+			totals = shards.totals()
+			embed = embed.add_field(name=f"All shards ({len(shards.cluster)}/{shards.shard_count} reporting, this is shard {shards.shard_id})",
+									value=f"Servers: {totals['guilds']}\n"
+										f"Commands run: {totals['commands']}\n"
+										f"Messages seen: {totals['messages']}\n"
+										f"Voice chats: {totals['voice_clients']}\n"
+										f"Shard process IDs: {', '.join(str(x['pid']) for _, x in sorted(shards.cluster.items()))}",
+									inline=False)
 		embed = embed.add_field(name="Connected voice chats", value=f"{n_connected} ({n_playing} playing)")
 		embed = embed.add_field(name="Bot Process ID", value=os.getpid())
 		if include_hostname: embed = embed.add_field(name="Host Machine Name", value=socket.gethostname())
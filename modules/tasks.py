@@ -0,0 +1,54 @@
+from client import client
+from datetime import datetime
+from modules import __common__
+
+import asyncio
+import discord
+import os
+import taskwatch
+
+
+cmd_name = "tasks"
+
+client.basic_help(title=cmd_name, desc="lists the commands, handlers and background jobs that have been running the longest")
+
+detailed_help = {
+	"Usage": f"{client.default_prefix}{cmd_name} [number]",
+	"Arguments": "`number` - show where that task (numbered as in the list) is right now, as a stack trace",
+	"Description": "Lists whatever the bot has been busy with for the longest, with what each one is waiting on, to find "
+					"commands and handlers that are stuck. Restricted to bot admins.",
+}
+client.long_help(cmd=cmd_name, mapping=detailed_help)
+
+
+@client.command(trigger=cmd_name, aliases=["stuck"], cost="admin")
+async def tasks(command: str, message: discord.Message):
+	if not __common__.check_permission(message.author):
+		await message.add_reaction("❌")
+		return
+
+	watchdog = client.watchdog
+	this_task = asyncio.current_task()
+	running = [x for x in watchdog.longest() if x.task is not this_task]  # not counting this command
+	parts = command.split(" ")
+	if len(parts) > 1:
+		try:
+			if int(parts[1]) < 1:
+				raise IndexError
+			entry = running[int(parts[1]) - 1]
+		except (ValueError, IndexError):
+			await message.channel.send(f"Give the number of one of the {len(running)} running tasks")
+			return
+		await message.channel.send(f"```\n{watchdog.describe(entry)[-1900:]}\n```")
+		return
+
+	embed = discord.Embed(title="Longest running tasks", description=f"{len(running)} running, {watchdog.overdue_count} went over their budget since startup", colour=0x404040)
+	for index, entry in enumerate(running[:10]):
+		stack, waiting_on = taskwatch.awaiting(entry.coro, entry.task)
+		where = f"`{os.path.basename(stack[-1].filename)}:{stack[-1].lineno}` in `{stack[-1].name}()`" if len(stack) else "unknown"
+		budget = f" (budget {entry.budget:g}s{', over' if entry.overdue else ''})" if entry.budget is not None else ""
+		embed = embed.add_field(name=f"{index + 1}. {entry.label}",
+								value=f"Running for {entry.runtime:.1f}s{budget}\nAt {where}\nWaiting on `{waiting_on[:100]}`",
+								inline=False)
+	embed = embed.set_footer(text=datetime.utcnow().__str__())
+	await message.channel.send(embed=embed)
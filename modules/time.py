@@ -16,18 +16,9 @@ client.long_help(cmd="time", mapping={
 				f"`{client.default_prefix}ntp` command.",
 })
 
-last_run = 0
 
-
-@client.command(trigger="time")
+@client.command(trigger="time", command_rate=(1, 15.0))  # one run every 15 seconds, across everyone
 async def show_simple_time(command: str, message: discord.Message):
-	global last_run
-
-	if (time.time()-last_run) < 15.0:  # if cooldown,
-		await message.add_reaction("❌")  # reject the command
-		return
-	last_run = time.time()
-
 	test_send_1 = await message.channel.send(".")  # First send a quick test message or 2 so that we "warm up" the pipes
 	# test_send_2 = await message.channel.send(".")  # First send a quick test message or 2 so that we "warm up" the pipes
 
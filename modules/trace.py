@@ -0,0 +1,70 @@
+from client import client
+from datetime import datetime
+from io import BytesIO
+from modules import __common__
+
+import discord
+import gzip
+import log
+import tracing
+
+
+cmd_name = "trace"
+
+client.basic_help(title=cmd_name, desc="traces where the time handling each message goes, for viewing on a timeline")
+
+detailed_help = {
+	"Usage": f"{client.default_prefix}{cmd_name} [on | off | dump | clear]",
+	"Arguments": "(nothing) - whether tracing is on and how many spans are buffered\n"
+				"`on`/`off` - turn tracing on or off\n"
+				"`dump` - post the buffered spans as a Chrome trace file, for chrome://tracing or ui.perfetto.dev\n"
+				"`clear` - empty the buffer",
+	"Description": "Records a span for every message and, inside it, for each handler, the command, messages sent, REST requests "
+					"and executor calls. Restricted to bot admins.",
+}
+client.long_help(cmd=cmd_name, mapping=detailed_help)
+
+max_attachment = 7 * 1024 * 1024  # leaves some room under Discord's 8 MiB upload limit
+
+
+@client.command(trigger=cmd_name, aliases=["tracing"], cost="admin")
+async def trace(command: str, message: discord.Message):
+	if not __common__.check_permission(message.author):
+		await message.add_reaction("❌")
+		return
+
+	parts = command.split(" ")
+	action = parts[1].lower() if len(parts) > 1 else None
+
+	if action == "on":
+		tracing.enable(client)
+		log.info(f"Tracing turned on by {message.author.name}#{message.author.discriminator}")
+		await message.channel.send(f"Tracing on, keeping the last {tracing.spans.maxlen} spans")
+	elif action == "off":
+		tracing.disable()
+		log.info(f"Tracing turned off by {message.author.name}#{message.author.discriminator}")
+		await message.channel.send(f"Tracing off, {len(tracing.spans)} spans still buffered for `{client.default_prefix}{cmd_name} dump`")
+	elif action == "clear":
+		tracing.clear()
+		await message.channel.send("Trace buffer cleared")
+	elif action == "dump":
+		if not tracing.spans:
+			await message.channel.send("No spans buffered")
+			return
+		async with message.channel.typing():
+			data = (await client.loop.run_in_executor(None, tracing.dump)).encode("utf-8")
+			filename = f"trace-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.json"
+			if len(data) > max_attachment:
+				data = gzip.compress(data)
+				filename += ".gz"
+			if len(data) > max_attachment:
+				await message.channel.send(f"The trace is too big to upload ({len(data) / 1024 / 1024:.1f} MiB compressed), "
+											f"`{client.default_prefix}{cmd_name} clear` and try again after less time")
+				return
+		await message.channel.send(f"{len(tracing.spans)} spans{f', {tracing.dropped} older ones were dropped' if tracing.dropped else ''}",
+									file=discord.File(BytesIO(data), filename=filename))
+	elif action is None:
+		await message.channel.send(f"Tracing is {'on' if tracing.enabled else 'off'}. {len(tracing.spans)}/{tracing.spans.maxlen} spans buffered"
+									f"{f', {tracing.dropped} dropped' if tracing.dropped else ''}.")
+	else:
+		await message.channel.send(f"Unknown option `{action}`, see `{client.default_prefix}help {cmd_name}`")
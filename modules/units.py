@@ -2,7 +2,6 @@ from client import client
 
 import asyncio
 import discord
-import subprocess
 
 client.basic_help(title="unit", desc="Converts units with the `units` Unix command.")
 help_dict = {
@@ -22,7 +21,7 @@ help_dict = {
 client.long_help(cmd="units", mapping=help_dict)
 
 
-@client.command(trigger="units", aliases=["unit", "convert", "u"])
+@client.command(trigger="units", aliases=["unit", "convert", "u"], cost="heavy")
 async def convert_units(command: str, message: discord.Message):
 	parts = command.split(" ")
 
@@ -31,16 +30,22 @@ async def convert_units(command: str, message: discord.Message):
 		await message.channel.send(f"Need more arguments to run command. See command help for help.")
 		return
 	if len(parts) == 2:
-		proc = subprocess.Popen(["units", "-t", parts[1]], stdout=subprocess.PIPE)
+		args = [parts[1]]
 	if len(parts) == 3:
-		proc = subprocess.Popen(["units", "-t", parts[1], parts[2]], stdout=subprocess.PIPE)
+		args = [parts[1], parts[2]]
 	if len(parts) == 4:
-		proc = subprocess.Popen(["units", "-t", parts[1]+parts[2], parts[3]], stdout=subprocess.PIPE)
+		args = [parts[1]+parts[2], parts[3]]
 	if len(parts) == 5:
-		proc = subprocess.Popen(["units", "-t", parts[1]+parts[2], parts[3]+parts[4]], stdout=subprocess.PIPE)
+		args = [parts[1]+parts[2], parts[3]+parts[4]]
 
-
-	await asyncio.sleep(1)
-	stdout, stderr = proc.communicate(timeout=0.01)
+	# an asyncio subprocess, so waiting on units doesn't hold up the event loop
+	proc = await asyncio.create_subprocess_exec("units", "-t", *args, stdout=asyncio.subprocess.PIPE)
+	try:
+		stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=1.0)
+	finally:
+		if proc.returncode is None:
+			# timed out, or the command was cancelled: don't leave units running, and reap it so it isn't left a zombie
+			proc.kill()
+			await proc.wait()
 	await message.channel.send(stdout.decode())
 	return
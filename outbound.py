@@ -0,0 +1,145 @@
+# Outbound message queue, one per channel.
+#
+# Discord limits how fast a bot can post in any one channel (5 messages every 5 seconds), and discord.py's answer to
+# going over that is to wait out a 429 and retry. Modules that send a burst of messages (debug output, profiling lines,
+# several embeds in a row) ran straight into that. Messages sent with client.send() instead go through a queue for their
+# channel that's paced with a token bucket matching the channel's rate limit, so they never get sent faster than Discord
+# will accept them. Messages queued with merge=True, meant for bursts of output from one command like debug lines, are
+# merged while they're waiting their turn anyway: plain text messages queued back to back go out as one message (up to
+# the 2000 character limit), and text queued right before an embed is sent along with that embed, so a burst of debug
+# lines costs one request instead of ten. Merging is off by default, since replies to different commands and users
+# queued in the same channel would otherwise arrive glued together.
+#
+# discord.py 1.x can only send one embed per message, so queued embeds are each sent as their own message, only paced
+# rather than merged. It also doesn't pass the X-RateLimit-* headers of its responses on to callers, so the pace is
+# Discord's documented per channel limit from config.outbound_rate rather than one learned from the route's bucket.
+# discord.py still goes by the headers itself, waiting out a bucket they say is exhausted before its next request.
+
+from collections import deque
+from typing import Deque, Dict, List, Tuple, Union
+
+import asyncio
+import discord
+import log
+import ratelimit
+import tracing
+
+
+max_content_length = 2000
+
+
+class _Outgoing:
+	__slots__ = ("content", "embed", "kwargs", "merge", "future", "span")
+
+	def __init__(self, content: Union[str, None], embed: Union[discord.Embed, None], kwargs: dict, merge: bool,
+					future: Union[asyncio.Future, None], span: Union[tracing.Span, None]):
+		self.content = content
+		self.embed = embed
+		self.kwargs = kwargs
+		self.merge = merge and not kwargs  # things like files or delete_after only make sense for the message they were meant for
+		self.future = future
+		self.span = span  # trace span it was queued from, so sending it shows up in the same trace
+
+
+class _ChannelQueue:
+	def __init__(self, channel: discord.abc.Messageable):
+		self.channel = channel
+		self.items: Deque[_Outgoing] = deque()
+		self.task: asyncio.Task = None
+
+
+class OutboundQueue:
+	def __init__(self, rate: Tuple[int, float]):
+		self.buckets = ratelimit.BucketStore(rate[0], rate[1])
+		self.queues: Dict[int, _ChannelQueue] = {}
+		self.queued = 0  # messages waiting across every channel right now
+		self.max_queued = 0
+		self.sent = 0  # requests actually made
+		self.merged = 0  # messages that went out as part of another message instead of costing a request of their own
+
+	def depth(self, channel_id: int = None) -> int:
+		# Messages waiting to be sent, in one channel or overall
+		if channel_id is None:
+			return self.queued
+		queue = self.queues.get(channel_id, None)
+		return len(queue.items) if queue is not None else 0
+
+	def enqueue(self, channel: discord.abc.Messageable, content: str = None, embed: discord.Embed = None, merge: bool = False,
+				wait: bool = True, **kwargs) -> Union[asyncio.Future, None]:
+		# Queues a message and returns a future for the discord.Message it ends up in (which is shared with whatever it was
+		# merged with), or None when wait is False, in which case errors are only logged.
+		future = asyncio.get_event_loop().create_future() if wait else None
+		queue = self.queues.get(channel.id, None)
+		if queue is None:
+			queue = self.queues[channel.id] = _ChannelQueue(channel)
+		queue.items.append(_Outgoing(None if content is None else str(content), embed, kwargs, merge, future, tracing.current()))
+		self.queued += 1
+		self.max_queued = max(self.max_queued, self.queued)
+		if queue.task is None:
+			queue.task = asyncio.ensure_future(self._drain(queue))
+		return future
+
+	async def send(self, channel: discord.abc.Messageable, content: str = None, embed: discord.Embed = None, merge: bool = False,
+					wait: bool = True, **kwargs) -> Union[discord.Message, None]:
+		future = self.enqueue(channel, content, embed, merge, wait, **kwargs)
+		if future is not None:
+			return await future
+
+	async def _drain(self, queue: _ChannelQueue) -> None:
+		bucket = self.buckets.get(queue.channel.id)
+		try:
+			while queue.items:
+				if not bucket.consume():
+					await asyncio.sleep(bucket.retry_after())
+					continue
+				batch = self._take(queue)
+				self.queued -= len(batch)
+				self.merged += len(batch) - 1
+				self.sent += 1
+				contents = [x.content for x in batch if x.content is not None]
+				try:
+					with tracing.span("outbound send", parent=batch[0].span, channel=queue.channel.id, messages=len(batch)):
+						sent = await queue.channel.send(content="\n".join(contents) if contents else None, embed=batch[-1].embed, **batch[-1].kwargs)
+				except Exception as e:
+					for x in batch:
+						if x.future is not None and not x.future.done():
+							x.future.set_exception(e)
+					if not any(x.future is not None for x in batch):
+						log.error(f"Error sending queued message to channel {queue.channel.id}", include_exception=True)
+				else:
+					for x in batch:
+						if x.future is not None and not x.future.done():
+							x.future.set_result(sent)
+		finally:
+			queue.task = None
+			if queue.items:
+				# cancelled with messages still waiting, nobody is going to send them now
+				self.queued -= len(queue.items)
+				for x in queue.items:
+					if x.future is not None and not x.future.done():
+						x.future.cancel()
+				queue.items.clear()
+			if self.queues.get(queue.channel.id, None) is queue:
+				del self.queues[queue.channel.id]
+
+	@staticmethod
+	def _take(queue: _ChannelQueue) -> List[_Outgoing]:
+		# Takes the next message off the queue, plus whatever can be merged into it: more plain text as long as it fits, and
+		# at most one embed to finish it off.
+		first = queue.items.popleft()
+		batch = [first]
+		if not first.merge or first.embed is not None or first.content is None:
+			return batch
+		length = len(first.content)
+		while queue.items:
+			following = queue.items[0]
+			if not following.merge:
+				break
+			if following.content is not None:
+				if length + 1 + len(following.content) > max_content_length:
+					break
+				length += 1 + len(following.content)
+			batch.append(queue.items.popleft())
+			if following.embed is not None:
+				break
+		return batch
@@ -1,4 +1,6 @@
-from typing import List, Tuple, Union
+from typing import Iterable, List, Tuple, Union
+
+import re
 
 
 def check_command_prefix(message: str, prefixes: List[str]) -> Tuple[bool, Union[str, None]]:
@@ -18,3 +20,41 @@ def check_bot_prefix(message: str, prefixes: List[str]) -> Tuple[bool, Union[str
 		if message.lower().startswith(prefix.lower()):
 			return True, prefix
 	return False, None
+
+
+def get_command_token(command: str) -> str:
+	# Pulls the command word off the front of a message that has already had its bot prefix removed. This is what the
+	# dispatcher looks up in the command table, so it's normalised the same way check_command_prefix() compares (split on
+	# the first space, then lowercased) but only done once per message instead of once per registered command.
+	return command.split(" ", 1)[0].lower()
+
+
+class PrefixMatcher:
+	# All of the bot's prefixes compiled into one anchored regex, so checking a message is a single match() call no matter
+	# how many prefixes there are, and the message text is never copied or lowercased. Alternatives are ordered longest
+	# first so that a prefix which is the start of another one (say "c" and "c!") can't shadow the longer one.
+	# Matchers are immutable; to change the prefixes, build a new one.
+
+	def __init__(self, prefixes: Iterable[str]):
+		self.prefixes: List[str] = []
+		for prefix in prefixes:
+			if prefix and prefix.lower() not in self.prefixes:
+				self.prefixes.append(prefix.lower())
+		if self.prefixes:
+			ordered = sorted(self.prefixes, key=len, reverse=True)
+			self._regex = re.compile("|".join(re.escape(x) for x in ordered), re.IGNORECASE)
+		else:
+			self._regex = None
+
+	def match(self, message: str) -> Tuple[bool, Union[str, None]]:
+		# Same return convention as check_bot_prefix(). The prefix returned is the text as it appears in the message, so
+		# len() of it is always the right amount to slice off the front.
+		if self._regex is None:
+			return False, None
+		found = self._regex.match(message)
+		if found is None:
+			return False, None
+		return True, found.group(0)
+
+	def __len__(self):
+		return len(self.prefixes)
@@ -0,0 +1,156 @@
+# Sampling profiler for the running bot.
+#
+# cProfile hooks every function call, which slows the whole bot down by a lot and only sees the thread it was started
+# in. This instead runs a thread that wakes up every `interval` seconds and reads every other thread's current stack with
+# sys._current_frames(), so the bot itself does no extra work and the event loop, the voice player threads and executor
+# threads are all covered. What comes out is statistical: a function that shows up in 30% of the event loop thread's
+# samples was running (or waiting in something it called) about 30% of the time.
+#
+# The samples can be written out as collapsed stacks (one line per distinct stack with a count, the input format of
+# flamegraph.pl, speedscope and friends) and as pstats data, where ncalls are sample counts and times are sample counts
+# times the actual time between samples (which is longer than the interval when the bot keeps the GIL busy), so the usual
+# pstats sorting and printing works on it and the .prof can be opened with snakeviz.
+
+from io import StringIO
+from typing import Dict, List, Tuple
+
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+
+
+FunctionKey = Tuple[str, int, str]  # (filename, first line, function name), the same as pstats uses
+
+
+class _Stats:
+	# Just enough for pstats.Stats() to load from
+	def __init__(self, stats: dict):
+		self.stats = stats
+
+	def create_stats(self):
+		pass
+
+
+class SamplingProfiler:
+	def __init__(self, interval: float = 0.005):
+		self.interval = interval
+		self.stacks: Dict[Tuple[str, Tuple[FunctionKey, ...]], int] = {}
+		# (thread name, stack outermost first) -> times it was seen
+		self.samples = 0
+		self.duration = 0.0
+		self.overhead = 0.0  # seconds the sampling thread spent reading stacks
+
+	def run(self, duration: float) -> None:
+		# Samples every thread but the one it's called in for `duration` seconds. Blocks, so call it in its own thread (or
+		# with loop.run_in_executor()).
+		own = threading.get_ident()
+		names: Dict[int, str] = {}
+		start = time.perf_counter()
+		end = start + duration
+		next_sample = start
+		while True:
+			now = time.perf_counter()
+			if now >= end:
+				break
+			if now < next_sample:
+				time.sleep(next_sample - now)
+			next_sample += self.interval
+			if next_sample < time.perf_counter():
+				next_sample = time.perf_counter()  # fell behind, don't try to catch up by sampling in a burst
+			taken = time.perf_counter()
+			frames = sys._current_frames()
+			for ident, frame in frames.items():
+				if ident == own:
+					continue
+				name = names.get(ident, None)
+				if name is None:
+					name = names[ident] = self._thread_name(ident)
+				stack = []
+				while frame is not None:
+					code = frame.f_code
+					stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+					frame = frame.f_back
+				key = (name, tuple(reversed(stack)))
+				self.stacks[key] = self.stacks.get(key, 0) + 1
+			del frames
+			self.samples += 1
+			self.overhead += time.perf_counter() - taken
+		self.duration = time.perf_counter() - start
+
+	@staticmethod
+	def _thread_name(ident: int) -> str:
+		for thread in threading.enumerate():
+			if thread.ident == ident:
+				return thread.name
+		return f"Thread-{ident}"
+
+	def collapsed(self) -> str:
+		# flamegraph.pl format: "thread;outer;...;inner count", one line per distinct stack
+		lines = []
+		for (thread, stack), count in sorted(self.stacks.items(), key=lambda x: x[1], reverse=True):
+			frames = ";".join(self._label(x) for x in stack)
+			lines.append(f"{thread.replace(';', ':').replace(' ', '_')};{frames} {count}")
+		return "\n".join(lines) + "\n"
+
+	@staticmethod
+	def _label(function: FunctionKey) -> str:
+		filename, line, name = function
+		return f"{os.path.basename(filename)}:{name}:{line}".replace(";", ":").replace(" ", "_")
+
+	def pstats_data(self, thread: str = None) -> dict:
+		# Samples in pstats' format: {function: (primitive calls, calls, self time, cumulative time, {caller: (...)})},
+		# with a function counted once per sample even when it's on the stack more than once (recursion)
+		self_samples: Dict[FunctionKey, int] = {}
+		cumulative: Dict[FunctionKey, int] = {}
+		callers: Dict[FunctionKey, Dict[FunctionKey, int]] = {}
+		for (name, stack), count in self.stacks.items():
+			if thread is not None and name != thread or not stack:
+				continue
+			self_samples[stack[-1]] = self_samples.get(stack[-1], 0) + count
+			for function in set(stack):
+				cumulative[function] = cumulative.get(function, 0) + count
+			for pair in set(zip(stack, stack[1:])):
+				caller, callee = pair
+				counts = callers.setdefault(callee, {})
+				counts[caller] = counts.get(caller, 0) + count
+		period = self.period
+		data = {}
+		for function, total in cumulative.items():
+			own = self_samples.get(function, 0)
+			data[function] = (total, total, own * period, total * period,
+							{x: (y, y, 0.0, y * period) for x, y in callers.get(function, {}).items()})
+		return data
+
+	@property
+	def period(self) -> float:
+		# Average time between samples
+		return self.duration / self.samples if self.samples else self.interval
+
+	def stats(self, thread: str = None, stream=None) -> pstats.Stats:
+		return pstats.Stats(_Stats(self.pstats_data(thread)), stream=stream)
+
+	def dump_stats(self) -> bytes:
+		# Contents of a .prof file, as written by cProfile/pstats' dump_stats()
+		return marshal.dumps(self.pstats_data())
+
+	def threads(self) -> List[Tuple[str, int]]:
+		# Threads seen and how many samples each was in, most first
+		counts: Dict[str, int] = {}
+		for (name, _), count in self.stacks.items():
+			counts[name] = counts.get(name, 0) + count
+		return sorted(counts.items(), key=lambda x: x[1], reverse=True)
+
+	def top(self, count: int = 40) -> str:
+		# pstats listing per thread, by self time and then by cumulative time
+		out = StringIO()
+		out.write(f"{self.samples} samples over {self.duration:.2f}s, one every {self.period*1000:.2f} ms (asked for {self.interval*1000:.2f} ms), "
+				f"sampling overhead {self.overhead:.3f}s. ncalls are sample counts, times are samples x {self.period*1000:.2f} ms.\n")
+		for thread, samples in self.threads():
+			out.write(f"\n{'=' * 20} Thread {thread}: {samples} samples {'=' * 20}\n")
+			for order in ["tottime", "cumulative"]:
+				stats = self.stats(thread, stream=out)
+				stats.sort_stats(order).print_stats(count)
+		return out.getvalue()
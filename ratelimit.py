@@ -0,0 +1,131 @@
+# Token buckets for rate limiting commands and outgoing API calls.
+#
+# A bucket holds up to `capacity` tokens and refills continuously at capacity/per tokens per second, so a command limited
+# to (3, 60) can be run in a burst of 3 and then once every 20 seconds after that. Checking a bucket is O(1): it's just
+# topped up from the time since it was last touched, so there's no history to scan.
+#
+# A bucket lets through up to twice its capacity within any one `per` seconds (a full burst, then everything that refilled
+# since). Where a limit mustn't be exceeded at all, like an external API's quota, use a SlidingWindow instead: it keeps
+# the time of each use in the window, so it never allows more than `limit` in any `window` seconds. admit() takes either.
+
+from collections import deque
+from typing import Deque, Dict, Hashable, List, Tuple, Union
+
+import time
+
+
+class TokenBucket:
+	__slots__ = ("capacity", "rate", "tokens", "updated", "notified")
+
+	def __init__(self, capacity: int, per: float):
+		self.capacity = capacity
+		self.rate = capacity / per
+		self.tokens = float(capacity)
+		self.updated = time.monotonic()
+		self.notified = False  # whether whoever got rejected by this bucket has been told about it yet
+
+	def refill(self, now: float) -> None:
+		if now > self.updated:
+			self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+			self.updated = now
+
+	def ready(self, now: float) -> bool:
+		self.refill(now)
+		return self.tokens >= 1
+
+	def consume(self, now: float = None) -> bool:
+		now = time.monotonic() if now is None else now
+		if not self.ready(now):
+			return False
+		self.take(now)
+		return True
+
+	def take(self, now: float) -> None:
+		self.tokens -= 1
+		self.notified = False
+
+	def retry_after(self, now: float = None) -> float:
+		# Seconds until the next token is available
+		now = time.monotonic() if now is None else now
+		self.refill(now)
+		return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class SlidingWindow:
+	__slots__ = ("limit", "window", "uses", "notified")
+
+	def __init__(self, limit: int, window: float):
+		self.limit = limit
+		self.window = window
+		self.uses: Deque[float] = deque()
+		self.notified = False
+
+	def ready(self, now: float) -> bool:
+		while self.uses and now - self.uses[0] >= self.window:
+			self.uses.popleft()
+		return len(self.uses) < self.limit
+
+	def consume(self, now: float = None) -> bool:
+		now = time.monotonic() if now is None else now
+		if not self.ready(now):
+			return False
+		self.take(now)
+		return True
+
+	def take(self, now: float) -> None:
+		self.uses.append(now)
+		self.notified = False
+
+	def retry_after(self, now: float = None) -> float:
+		now = time.monotonic() if now is None else now
+		if self.ready(now):
+			return 0.0
+		return max(0.0, self.uses[0] + self.window - now)
+
+
+class BucketStore:
+	# A set of identically configured buckets, one per key (user ID, guild ID, ...). Buckets that have filled back up are
+	# indistinguishable from new ones, so they get dropped every so often to keep this from growing forever.
+
+	def __init__(self, capacity: int, per: float, prune_at: int = 1024):
+		self.capacity = capacity
+		self.per = per
+		self.buckets: Dict[Hashable, TokenBucket] = {}
+		self._prune_at = prune_at
+
+	def get(self, key: Hashable) -> TokenBucket:
+		bucket = self.buckets.get(key, None)
+		if bucket is None:
+			if len(self.buckets) >= self._prune_at:
+				self.prune()
+			bucket = self.buckets[key] = TokenBucket(self.capacity, self.per)
+		return bucket
+
+	def prune(self) -> None:
+		now = time.monotonic()
+		for key in [k for k, v in self.buckets.items() if v.ready(now) and v.tokens >= v.capacity]:
+			del self.buckets[key]
+		# if most of them are still in use, wait until there's twice as many before bothering again
+		self._prune_at = max(self._prune_at, len(self.buckets) * 2)
+
+	def __len__(self):
+		return len(self.buckets)
+
+
+def admit(buckets: List[Union[TokenBucket, SlidingWindow]], now: float = None) -> Union[TokenBucket, SlidingWindow, None]:
+	# Takes a token from every bucket if all of them have one. Otherwise nothing is taken, and the first bucket that's
+	# out of tokens is returned so the caller can see why it was refused.
+	now = time.monotonic() if now is None else now
+	for bucket in buckets:
+		if not bucket.ready(now):
+			return bucket
+	for bucket in buckets:
+		bucket.take(now)
+	return None
+
+
+def store_for(rate: Union[Tuple[int, float], None]) -> Union[BucketStore, None]:
+	# Helper for decorators taking a (count, seconds) rate
+	if rate is None:
+		return None
+	return BucketStore(rate[0], rate[1])
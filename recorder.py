@@ -0,0 +1,188 @@
+# Gateway event recorder, for replaying real traffic offline (see benchmarks/replay.py).
+#
+# Off unless config.record_file is set. Gateway events are recorded by wrapping the parsers in discord.py's
+# ConnectionState.parsers, which the gateway connection looks events up in, so each recorded event gets written down
+# right before discord.py parses it, with no extra task per event. Only the event types in config.record_events are kept:
+# messages, reactions and member joins/leaves, plus READY and the guild/channel events needed to rebuild the cache they
+# refer to when replaying.
+#
+# File format: the magic bytes b"BOTREC\x00\x01", the wall clock time the recording started as a big endian double, then a
+# zlib stream of frames. Each frame is a big endian double (seconds since the recording started), a big endian unsigned
+# 32 bit length, and that many bytes of JSON: {"t": event type, "d": event data}. The stream is sync-flushed every
+# config.record_flush_interval seconds, so a recording cut short by a crash is readable up to the last flush.
+#
+# Before being written, event data goes through config.record_redact, which maps field names (anywhere in the event) to
+# what happens to them: "drop" replaces the value with None, "hash" with a short stable hash (so the same username maps to
+# the same placeholder all through the recording), and "shape" replaces letters and digits with x and 0, keeping the
+# length, whitespace, punctuation, mentions, custom emoji, and the prefix and command word of messages that start with
+# one of the bot's prefixes, so commands still get dispatched the same way on replay. "drop" and "hash" apply to whole
+# objects and lists too; "shape" only changes strings, so it's applied to the fields inside objects and lists instead.
+#
+# All file writes happen in order on one thread of the recorder's own, so the final block written on close can't overtake
+# a flush that's still being written.
+
+from typing import Callable, Dict, Iterator, List, Tuple
+
+import asyncio
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import log
+import os
+import re
+import struct
+import time
+import zlib
+
+
+magic = b"BOTREC\x00\x01"
+frame_header = struct.Struct(">dI")
+start_header = struct.Struct(">d")
+
+_tokens = re.compile(r"(<[@#][!&]?\d+>|<a?:\w+:\d+>)")
+_letters = re.compile(r"[^\W\d_]")
+_digits = re.compile(r"\d")
+
+
+def shape(text: str, prefixes: List[str]) -> str:
+	kept = ""
+	lowered = text.lower()
+	for prefix in prefixes:
+		if lowered.startswith(prefix):
+			word = text[len(prefix):].split(" ", 1)[0]
+			kept = text[:len(prefix) + len(word)]
+			text = text[len(kept):]
+			break
+	parts = _tokens.split(text)
+	# odd indices are the mentions and emoji the split kept
+	return kept + "".join(x if index % 2 else _digits.sub("0", _letters.sub("x", x)) for index, x in enumerate(parts))
+
+
+def redact(value, rules: Dict[str, str], prefixes: List[str]):
+	# A copy of value with the fields named in rules redacted
+	if isinstance(value, dict):
+		result = {}
+		for key, item in value.items():
+			rule = rules.get(key, None)
+			if item is None or rule == "drop":
+				result[key] = None
+			elif rule == "hash":
+				text = json.dumps(item, sort_keys=True) if isinstance(item, (dict, list)) else str(item)
+				result[key] = hashlib.sha1(text.encode("utf-8")).hexdigest()[:10]
+			elif rule == "shape" and isinstance(item, str):
+				result[key] = shape(item, prefixes)
+			elif isinstance(item, (dict, list)):
+				result[key] = redact(item, rules, prefixes)
+			else:
+				result[key] = item
+		return result
+	if isinstance(value, list):
+		return [redact(x, rules, prefixes) for x in value]
+	return value
+
+
+class Recorder:
+	def __init__(self, path: str, events: List[str], rules: Dict[str, str], prefixes: Callable[[], List[str]]):
+		self.path = path
+		self.events = events
+		self.rules = rules
+		self.prefixes = prefixes  # called for the bot's current prefixes when shaping message content
+		self.started = time.monotonic()
+		self.frames = 0
+		self.counts: Dict[str, int] = {}
+		self.raw_bytes = 0  # JSON written, before compression
+		self.written_bytes = 0
+		self._compressor = zlib.compressobj(6)
+		self._pending: List[bytes] = [magic + start_header.pack(time.time())]
+		self._closed = False
+		self._writer = concurrent.futures.ThreadPoolExecutor(max_workers=1)  # one thread, so writes land in order
+		os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+	def install(self, client) -> None:
+		parsers = client._connection.parsers
+		for event in self.events:
+			original = parsers.get(event, None)
+			if original is None:
+				log.warning(f"Recorder: discord.py has no parser for {event}, it won't be recorded")
+				continue
+			parsers[event] = self._wrap(event, original)
+		log.info(f"Recording gateway events to {self.path}")
+
+	def _wrap(self, event: str, original: Callable[[dict], None]) -> Callable[[dict], None]:
+		def parse(data: dict):
+			try:
+				self.record(event, data)
+			except Exception:
+				log.warning(f"Recorder: could not record a {event} event", include_exception=True)
+			return original(data)
+		return parse
+
+	def record(self, event: str, data: dict) -> None:
+		if self._closed:
+			return
+		if self.rules:
+			data = redact(data, self.rules, [x.lower() for x in self.prefixes()])
+		body = json.dumps({"t": event, "d": data}, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+		self._pending.append(self._compressor.compress(frame_header.pack(time.monotonic() - self.started, len(body)) + body))
+		self.frames += 1
+		self.counts[event] = self.counts.get(event, 0) + 1
+		self.raw_bytes += len(body)
+
+	def _take(self, mode: int) -> bytes:
+		self._pending.append(self._compressor.flush(mode))
+		data = b"".join(self._pending)
+		self._pending = []
+		return data
+
+	def _write(self, data: bytes) -> None:
+		with open(self.path, "ab") as fp:
+			fp.write(data)
+		self.written_bytes += len(data)
+
+	async def flush(self) -> None:
+		# Background job: writes out what's been recorded so far, the file write happening off the event loop
+		if self._closed:
+			return
+		data = self._take(zlib.Z_SYNC_FLUSH)
+		await asyncio.get_event_loop().run_in_executor(self._writer, self._write, data)
+
+	async def close(self) -> None:
+		if self._closed:
+			return
+		self._closed = True
+		# queued behind any flush still being written, even one whose background job was just cancelled
+		await asyncio.get_event_loop().run_in_executor(self._writer, self._write, self._take(zlib.Z_FINISH))
+		self._writer.shutdown(wait=False)
+		log.info(f"Recorded {self.frames} gateway events to {self.path} ({self.raw_bytes / 1024:.0f} KiB of JSON in {self.written_bytes / 1024:.0f} KiB)")
+
+
+def read(path: str) -> Tuple[datetime.datetime, Iterator[Tuple[float, str, dict]]]:
+	# Opens a recording, returning when it started and an iterator over its (seconds since start, event type, data) frames
+	fp = open(path, "rb")
+	header = fp.read(len(magic) + start_header.size)
+	if header[:len(magic)] != magic:
+		fp.close()
+		raise ValueError(f"{path} is not an event recording")
+	started = datetime.datetime.utcfromtimestamp(start_header.unpack(header[len(magic):])[0])
+
+	def frames():
+		decompressor = zlib.decompressobj()
+		buffer = b""
+		with fp:
+			while True:
+				chunk = fp.read(1 << 16)
+				if chunk:
+					buffer += decompressor.decompress(chunk)
+				while len(buffer) >= frame_header.size:
+					offset, length = frame_header.unpack_from(buffer)
+					if len(buffer) < frame_header.size + length:
+						break
+					body = buffer[frame_header.size:frame_header.size + length]
+					buffer = buffer[frame_header.size + length:]
+					frame = json.loads(body)
+					yield offset, frame["t"], frame["d"]
+				if not chunk:
+					return  # anything left is a frame cut off by the recording ending without a flush
+
+	return started, frames()
@@ -0,0 +1,62 @@
+# State for when the bot is run as several shard processes by supervisor.py.
+#
+# Started normally (python main.py) none of this is set, and the bot is a single process connected as a single shard.
+# Under the supervisor every process runs main.py with shard_id and shard_count filled in (the client passes them on to
+# discord.py) and a pipe back to the supervisor. Every shard_report_interval seconds the client sends its counters down
+# the pipe, and the supervisor answers with the latest counters of every shard, so things like the stats command can show
+# numbers for the whole bot and not just the shard that happened to get the command.
+
+from multiprocessing.connection import Connection
+from typing import Dict
+
+import log
+import runpy
+
+shard_id: int = None
+shard_count: int = None
+connection: Connection = None
+cluster: Dict[int, dict] = {}
+# shard ID -> latest counters from that shard, as relayed by the supervisor (including our own)
+
+
+def client_kwargs() -> dict:
+	# Extra arguments for the client constructor
+	if shard_count is None:
+		return {}
+	return {"shard_id": shard_id, "shard_count": shard_count}
+
+
+def exchange(counters: dict) -> None:
+	# Sends our counters to the supervisor and picks up whatever it's sent back since last time. These are a few hundred
+	# bytes at most, so this doesn't block the event loop in practice.
+	global connection
+	if connection is None:
+		return
+	try:
+		connection.send(counters)
+		while connection.poll():
+			cluster.clear()
+			cluster.update(connection.recv())
+	except (EOFError, OSError):
+		log.error("Lost the connection to the shard supervisor, shard stats will no longer be updated", include_exception=True)
+		connection = None
+
+
+def totals() -> Dict[str, float]:
+	# Sums every numeric counter across all shards
+	result = {}
+	for counters in cluster.values():
+		for key, value in counters.items():
+			if isinstance(value, (int, float)) and not isinstance(value, bool) and key not in ["shard", "pid"]:
+				result[key] = result.get(key, 0) + value
+	return result
+
+
+def run_shard(shard: int, count: int, pipe: Connection, script: str) -> None:
+	# Entry point of each shard process
+	global shard_id, shard_count, connection
+	shard_id = shard
+	shard_count = count
+	connection = pipe
+	log.info(f"Starting shard {shard_id} of {shard_count}")
+	runpy.run_path(script, run_name="__main__")
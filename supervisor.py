@@ -0,0 +1,132 @@
+# Runs the bot as several processes, one gateway shard each, so that busy bots aren't limited to one event loop on one core.
+#
+#     python supervisor.py [number of shards]
+#
+# The number of shards defaults to config.shard_processes, or one per CPU core if that's None. Each shard process runs
+# main.py as usual (see shards.py for what's different inside one), and the supervisor:
+# - starts them config.shard_identify_interval seconds apart, since Discord only lets a bot identify once every 5 seconds
+# - restarts shards that crash, waiting config.shard_restart_delay seconds and doubling that for every crash in a row up to
+#   config.shard_restart_max_delay. Shards that exit cleanly (the kill command) are left stopped, and the supervisor exits
+#   once every shard has.
+# - passes the counters every shard reports on to all the others
+#
+# discord.py's plain Client (which FrameworkClient is) connects as exactly one shard, so each process owns one shard ID.
+
+from multiprocessing.connection import Connection, wait
+from typing import Dict
+
+import config
+import log
+import multiprocessing
+import os
+import shards
+import sys
+import time
+
+
+main_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+
+class ShardProcess:
+	def __init__(self, shard: int, count: int):
+		self.shard = shard
+		self.count = count
+		self.process: multiprocessing.Process = None
+		self.pipe: Connection = None
+		self.started: float = None
+		self.start_at: float = 0.0  # monotonic time the process should next be started at
+		self.crashes = 0  # crashes in a row
+		self.restarts = 0
+		self.finished = False
+
+	def start(self, context) -> None:
+		ours, theirs = context.Pipe()
+		self.process = context.Process(target=shards.run_shard, args=(self.shard, self.count, theirs, main_script), name=f"shard-{self.shard}")
+		self.process.start()
+		theirs.close()
+		self.pipe = ours
+		self.started = time.monotonic()
+		log.info(f"Started shard {self.shard} (pid {self.process.pid})")
+
+	def reap(self) -> int:
+		self.process.join()
+		code = self.process.exitcode
+		self.process = None
+		self.pipe.close()
+		self.pipe = None
+		return code
+
+
+def supervise(count: int) -> None:
+	context = multiprocessing.get_context("spawn")  # every shard gets a fresh interpreter rather than a fork of this one
+	processes = [ShardProcess(x, count) for x in range(count)]
+	now = time.monotonic()
+	for x in processes:
+		x.start_at = now + x.shard * config.shard_identify_interval
+	latest: Dict[int, dict] = {}
+
+	log.info(f"Supervising {count} shards")
+	try:
+		while not all(x.finished for x in processes):
+			now = time.monotonic()
+			for x in processes:
+				if x.process is None and not x.finished and x.start_at <= now:
+					x.start(context)
+
+			running = [x for x in processes if x.process is not None]
+			pipes = {x.pipe: x for x in running}
+			sentinels = {x.process.sentinel: x for x in running}
+			waiting = [x.start_at - now for x in processes if x.process is None and not x.finished]
+			timeout = max(0.0, min(waiting)) if waiting else None
+			for ready in wait(list(pipes.keys()) + list(sentinels.keys()), timeout):
+				if ready in pipes:
+					relay(pipes[ready], latest)
+				elif ready in sentinels:
+					exited(sentinels[ready], latest)
+	except KeyboardInterrupt:
+		log.info("Stopping all shards")
+		for x in processes:
+			if x.process is not None:
+				x.process.terminate()
+		for x in processes:
+			if x.process is not None:
+				x.process.join(10)
+	log.info("All shards have stopped")
+
+
+def relay(shard: ShardProcess, latest: Dict[int, dict]) -> None:
+	if shard.pipe is None:
+		return  # exited and reaped in the same wait() round
+	try:
+		latest[shard.shard] = shard.pipe.recv()
+		shard.pipe.send(latest)
+	except (EOFError, OSError):
+		pass  # it's exiting, we'll see its sentinel next
+
+
+def exited(shard: ShardProcess, latest: Dict[int, dict]) -> None:
+	uptime = time.monotonic() - shard.started
+	code = shard.reap()
+	latest.pop(shard.shard, None)
+	if code == 0:
+		shard.finished = True
+		log.info(f"Shard {shard.shard} shut down after {uptime:.1f}s, not restarting it")
+		return
+	if uptime > config.shard_restart_max_delay:
+		shard.crashes = 0  # it had been fine for a while, so this isn't part of a crash loop
+	delay = min(config.shard_restart_delay * 2 ** shard.crashes, config.shard_restart_max_delay)
+	shard.crashes += 1
+	shard.restarts += 1
+	shard.start_at = time.monotonic() + delay
+	log.error(f"Shard {shard.shard} exited with code {code} after {uptime:.1f}s, restarting it in {delay:.1f}s (restart #{shard.restarts})")
+
+
+if __name__ == "__main__":
+	try:
+		shard_total = int(sys.argv[1])
+	except IndexError:
+		shard_total = config.shard_processes or os.cpu_count() or 1
+	except ValueError:
+		print("Usage: python supervisor.py [number of shards]")
+		sys.exit(1)
+	supervise(shard_total)
@@ -0,0 +1,120 @@
+# Watchdog for commands, handlers and background jobs that have been running for too long ("tasks" below, though a
+# message handler run without concurrent_message_handlers shares its task with the command dispatch).
+#
+# A coroutine that's stuck (waiting on something that's never going to happen, or looping forever) doesn't block the
+# event loop, so the loop monitor can't see it, and nothing else notices either until someone complains. Everything the
+# framework runs on behalf of a module goes through metrics.Registry.measure(), which registers it here for as long as it
+# runs. A background job checks every so often for any that have gone over their time budget, and logs where each one is
+# stuck: the chain of coroutines it's awaiting, followed from the handler down to the innermost one, as a stack trace.
+# Each is only logged once when it goes over budget (and again when it finally finishes), and the `tasks` command lists
+# whatever's been running the longest.
+#
+# Budgets are config.task_budget seconds unless config.task_budgets has one for the "module.handler" in question (None
+# meaning it's expected to run for as long as it likes, like the music player's play loop).
+
+from typing import Dict, Iterator, List, Tuple, Union
+
+import asyncio
+import contextlib
+import itertools
+import log
+import time
+import traceback
+
+
+class Running:
+	__slots__ = ("kind", "module", "name", "coro", "task", "started", "budget", "overdue")
+
+	def __init__(self, kind: str, module: str, name: str, coro, task: Union[asyncio.Task, None], budget: Union[float, None]):
+		self.kind = kind  # command, message, reaction, member, background, ready or shutdown
+		self.module = module
+		self.name = name
+		self.coro = coro
+		self.task = task
+		self.started = time.monotonic()
+		self.budget = budget
+		self.overdue = False  # logged as over budget already
+
+	@property
+	def runtime(self) -> float:
+		return time.monotonic() - self.started
+
+	@property
+	def label(self) -> str:
+		return f"{self.kind} {self.module}.{self.name}()"
+
+
+def awaiting(coro, task: asyncio.Task = None) -> Tuple[traceback.StackSummary, str]:
+	# Follows a suspended coroutine down through what it's awaiting. Returns the stack, outermost first, and a description
+	# of the innermost thing being waited on (the future the task is waiting for, when there's a task to ask).
+	frames = []
+	current = coro
+	while current is not None:
+		frame = getattr(current, "cr_frame", None) or getattr(current, "gi_frame", None) or getattr(current, "ag_frame", None)
+		if frame is None:
+			break
+		frames.append(frame)
+		following = getattr(current, "cr_await", None) or getattr(current, "gi_yieldfrom", None) or getattr(current, "ag_await", None)
+		if following is None:
+			break
+		current = following
+	stack = traceback.StackSummary.extract(((x, x.f_lineno) for x in frames), lookup_lines=True)
+	if current is None or getattr(current, "cr_frame", None) is not None or getattr(current, "gi_frame", None) is not None:
+		waiting_on = "running or about to be" if not frames else "nothing it's awaiting"
+	else:
+		waiter = getattr(task, "_fut_waiter", None)  # awaiting a future only leaves an opaque iterator in cr_await
+		waiting_on = repr(waiter if waiter is not None else current)[:200]
+	return stack, waiting_on
+
+
+class Watchdog:
+	def __init__(self, budget: Union[float, None], budgets: Dict[str, Union[float, None]] = None):
+		self.budget = budget
+		self.budgets = budgets or {}
+		self.running: Dict[int, Running] = {}
+		self.overdue_count = 0  # times anything went over its budget
+		self._ids = itertools.count()
+
+	@contextlib.contextmanager
+	def track(self, kind: str, module: str, name: str, coro) -> Iterator[Running]:
+		# Registers a coroutine for as long as the block runs (metrics.Registry.measure() runs it in there)
+		try:
+			task = asyncio.current_task()
+		except RuntimeError:
+			task = None
+		entry = Running(kind, module, name, coro, task, self.budgets.get(f"{module}.{name}", self.budget))
+		key = next(self._ids)
+		self.running[key] = entry
+		try:
+			yield entry
+		finally:
+			del self.running[key]
+			if entry.overdue:
+				log.info(f"Over budget {entry.label} finished after {entry.runtime:.1f} seconds")
+
+	def longest(self, count: int = None) -> List[Running]:
+		result = sorted(self.running.values(), key=lambda x: x.started)
+		return result if count is None else result[:count]
+
+	def describe(self, entry: Running) -> str:
+		# Where a running entry is stuck, with the handlers it was started from in the same task
+		stack, waiting_on = awaiting(entry.coro, entry.task)
+		outer = [x.label for x in self.longest() if x.task is not None and x.task is entry.task and x is not entry and x.started <= entry.started]
+		lines = [f"{entry.label} has been running for {entry.runtime:.1f} seconds{f' (budget {entry.budget:g}s)' if entry.budget is not None else ''}"]
+		if outer:
+			lines.append(f"Called from: {' -> '.join(outer)}")
+		if entry.task is not None:
+			lines.append(f"Task: {entry.task.get_name() if hasattr(entry.task, 'get_name') else id(entry.task)}")
+		lines.append("Stack (most recent call last):")
+		lines.extend(x.rstrip("\n") for x in stack.format())
+		lines.append(f"Waiting on: {waiting_on}")
+		return "\n".join(lines)
+
+	async def check(self) -> None:
+		# Background job: logs anything that's just gone over its budget
+		for entry in list(self.running.values()):
+			if entry.overdue or entry.budget is None or entry.runtime <= entry.budget:
+				continue
+			entry.overdue = True
+			self.overdue_count += 1
+			log.warning(f"Watchdog: {self.describe(entry)}")
@@ -0,0 +1,192 @@
+# Per-message tracing, for seeing where a slow message's time went.
+#
+# Off unless turned on (config.tracing, or the trace command). While on, every message gets a span from
+# FrameworkClient.on_message, and everything that runs on its behalf gets a child span: each message handler and the
+# command (through metrics.Registry.measure(), so background jobs, reactions and lifecycle handlers get spans of their
+# own too), messages sent through the outbound queue, every REST request made through discord.py's HTTP client, and
+# functions handed to loop.run_in_executor() (one span from submitting it to getting the result back, and a child span
+# for when it actually ran in the executor thread). The span in progress is kept in a context variable, which asyncio
+# copies into every task created while it's set, so the handler tasks a message fans out to stay in its trace.
+#
+# Finished spans go into a ring buffer (config.trace_buffer_size spans), and dump() turns the buffer into Chrome trace
+# event JSON, which chrome://tracing and https://ui.perfetto.dev open as a timeline. Spans are written as nestable async
+# events with the message's trace ID as their ID, so each message gets its own track with its handlers nested inside.
+#
+# When tracing is off, span() hands back a shared do-nothing context manager, so the cost is one global lookup.
+
+from collections import deque
+from contextvars import ContextVar
+from typing import Callable, Deque, Dict, List, Tuple, Union
+
+import config
+import functools
+import itertools
+import json
+import log
+import os
+import threading
+import time
+
+
+enabled = False
+spans: Deque[Tuple[str, int, float, float, Union[Dict, None]]] = deque(maxlen=config.trace_buffer_size)
+# finished spans: (name, trace ID, start, end, args) with perf_counter() times
+dropped = 0
+# spans pushed out of the ring buffer by newer ones
+origin = time.perf_counter()
+# trace timestamps are microseconds since this
+
+_current: ContextVar = ContextVar("trace_span", default=None)
+_trace_ids = itertools.count(1)
+_originals: Dict[str, Tuple[object, str, Callable]] = {}
+# things patched by enable(): name -> (object, attribute, original value)
+_unset = object()
+
+
+class Span:
+	__slots__ = ("name", "trace", "start", "args", "_token")
+
+	def __init__(self, name: str, trace: int, args: Union[Dict, None]):
+		self.name = name
+		self.trace = trace
+		self.start: float = None
+		self.args = args
+		self._token = None
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		self._token = _current.set(self)
+		return self
+
+	def __exit__(self, kind, value, tb):
+		_current.reset(self._token)
+		if kind is not None:
+			if self.args is None:
+				self.args = {}
+			self.args["error"] = kind.__name__
+		record(self.name, self.trace, self.start, time.perf_counter(), self.args)
+		return False
+
+
+class _NoSpan:
+	__slots__ = ()
+
+	def __enter__(self):
+		return None
+
+	def __exit__(self, kind, value, tb):
+		return False
+
+
+_no_span = _NoSpan()
+
+
+def record(name: str, trace: int, start: float, end: float, args: Union[Dict, None] = None) -> None:
+	# Adds a finished span to the buffer. Safe to call from other threads, deque appends are atomic.
+	global dropped
+	if len(spans) == spans.maxlen:
+		dropped += 1
+	spans.append((name, trace, start, end, args))
+
+
+def span(name: str, parent: Union[Span, None] = _unset, **args) -> Union[Span, _NoSpan]:
+	# Context manager for a span, as a child of the span in progress (or of `parent`, for work done later on behalf of
+	# something else). A span without a parent starts a new trace.
+	if not enabled:
+		return _no_span
+	if parent is _unset:
+		parent = _current.get()
+	return Span(name, parent.trace if parent is not None else next(_trace_ids), args or None)
+
+
+def current() -> Union[Span, None]:
+	# The span in progress, to hand to span(parent=...) later on. None when tracing is off.
+	return _current.get() if enabled else None
+
+
+def _patch(name: str, target: object, attribute: str, replacement: Callable) -> None:
+	try:
+		original = getattr(target, attribute)
+		setattr(target, attribute, replacement(original))
+	except (AttributeError, TypeError):
+		log.debug(f"tracing: can't trace {name} here ({type(target).__name__}.{attribute} can't be replaced)")
+		return
+	_originals[name] = (target, attribute, original)
+
+
+def _traced_request(original: Callable) -> Callable:
+	@functools.wraps(original)
+	async def request(route, *args, **kwargs):
+		with span(f"{route.method} {route.path}", url=route.url):
+			return await original(route, *args, **kwargs)
+	return request
+
+
+def _traced_run_in_executor(original: Callable) -> Callable:
+	@functools.wraps(original)
+	def run_in_executor(executor, func, *args):
+		parent = current()
+		if parent is None:
+			return original(executor, func, *args)
+		name = getattr(func, "__qualname__", None) or getattr(func, "__name__", None) or repr(func)
+		hop = Span(f"executor {name}", parent.trace, None)
+		hop.start = time.perf_counter()
+
+		def run():
+			start = time.perf_counter()
+			try:
+				return func(*args)
+			finally:
+				record(f"run {name}", parent.trace, start, time.perf_counter(), {"thread": threading.current_thread().name})
+
+		future = original(executor, run)
+		future.add_done_callback(lambda _: record(hop.name, hop.trace, hop.start, time.perf_counter()))
+		return future
+	return run_in_executor
+
+
+def enable(client) -> None:
+	global enabled
+	if enabled:
+		return
+	enabled = True
+	_patch("REST requests", client.http, "request", _traced_request)
+	_patch("executor calls", client.loop, "run_in_executor", _traced_run_in_executor)
+	log.info(f"Tracing turned on, keeping the last {spans.maxlen} spans")
+
+
+def disable() -> None:
+	global enabled
+	if not enabled:
+		return
+	enabled = False
+	for target, attribute, original in _originals.values():
+		setattr(target, attribute, original)
+	_originals.clear()
+	log.info("Tracing turned off")
+
+
+def clear() -> None:
+	global dropped
+	spans.clear()
+	dropped = 0
+
+
+def events() -> List[Dict]:
+	# The buffer as Chrome trace events: a begin and an end event per span, in time order with spans that start at the
+	# same time opened outermost first and closed innermost first
+	pid = os.getpid()
+	ordered = []
+	for name, trace, start, end, args in list(spans):
+		begin = {"name": name, "cat": "bot", "ph": "b", "id": hex(trace), "pid": pid, "tid": 0, "ts": round((start - origin) * 1000000, 3)}
+		if args:
+			begin["args"] = args
+		ordered.append((begin["ts"], 1, start - end, begin))
+		finish = {"name": name, "cat": "bot", "ph": "e", "id": hex(trace), "pid": pid, "tid": 0, "ts": round((end - origin) * 1000000, 3)}
+		ordered.append((finish["ts"], 0, end - start, finish))
+	ordered.sort(key=lambda x: x[:3])
+	return [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": f"bot (pid {pid})"}}] + [x[3] for x in ordered]
+
+
+def dump() -> str:
+	return json.dumps({"traceEvents": events(), "displayTimeUnit": "ms"}, default=str, separators=(",", ":"))
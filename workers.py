@@ -0,0 +1,111 @@
+# Bounded scheduler for commands that are expensive to run (reading every log file, building markov chains, running
+# youtube_dl, ...). Each cost class has a limit on how many commands in it may run at once; anything over that waits its
+# turn in a queue, either first come first served or by priority. Cost classes that aren't configured are unbounded and
+# never wait, and the "admin" class can never be queued so that kill and _exec always go through.
+
+from exceptions import QueueFullError
+from typing import Awaitable, Callable, Dict, List
+
+import asyncio
+import heapq
+import itertools
+
+
+unbounded_classes = ["light", "admin"]
+
+
+class CostClass:
+	def __init__(self, name: str, limit: int = 1, mode: str = "fifo", max_queued: int = None):
+		if mode not in ["fifo", "priority"]:
+			raise ValueError(f"unknown queue mode {mode} for cost class {name} (should be fifo or priority)")
+		self.name = name
+		self.limit = limit
+		self.mode = mode
+		self.max_queued = max_queued
+		self.running = 0
+		self._waiters: List[list] = []  # heap of [priority, sequence number, future]
+		self._sequence = itertools.count()
+
+	@property
+	def queued(self) -> int:
+		return len([x for x in self._waiters if not x[2].done()])
+
+	def position(self, entry: list) -> int:
+		# 1-based position in the queue, counting only commands that are still waiting
+		return 1 + len([x for x in self._waiters if (x[0], x[1]) < (entry[0], entry[1]) and not x[2].done()])
+
+	async def acquire(self, priority: int = 0, on_queued: Callable[[int], Awaitable[None]] = None) -> bool:
+		# Waits for a free slot. Returns True if the caller had to wait in the queue for it.
+		if self.running < self.limit and not self.queued:
+			self.running += 1
+			return False
+
+		if self.max_queued is not None and self.queued >= self.max_queued:
+			raise QueueFullError(f"the {self.name} queue is full ({self.queued} waiting)")
+
+		future = asyncio.get_event_loop().create_future()
+		entry = [priority if self.mode == "priority" else 0, next(self._sequence), future]
+		heapq.heappush(self._waiters, entry)
+		try:
+			if on_queued is not None:
+				await on_queued(self.position(entry))
+			await future
+		except asyncio.CancelledError:
+			if future.done() and not future.cancelled():
+				# we were handed a slot right as we got cancelled, so give it to the next in line
+				self.release()
+			else:
+				future.cancel()  # release() skips over cancelled entries
+			raise
+		return True
+
+	def release(self) -> None:
+		self.running -= 1
+		while self._waiters:
+			_, _, future = heapq.heappop(self._waiters)
+			if not future.done():
+				self.running += 1
+				future.set_result(None)
+				return
+
+
+class _Slot:
+	def __init__(self, cost_class: CostClass, priority: int, on_queued: Callable[[int], Awaitable[None]], on_started: Callable[[], Awaitable[None]]):
+		self.cost_class = cost_class
+		self.priority = priority
+		self.on_queued = on_queued
+		self.on_started = on_started
+
+	async def __aenter__(self):
+		if self.cost_class is not None:
+			waited = await self.cost_class.acquire(self.priority, self.on_queued)
+			if waited and self.on_started is not None:
+				try:
+					await self.on_started()
+				except BaseException:
+					self.cost_class.release()
+					raise
+		return self
+
+	async def __aexit__(self, exc_type, exc, tb):
+		if self.cost_class is not None:
+			self.cost_class.release()
+		return False
+
+
+class WorkerScheduler:
+	def __init__(self, classes: Dict[str, dict]):
+		self.classes: Dict[str, CostClass] = {}
+		for name, options in classes.items():
+			if name in unbounded_classes:
+				continue
+			self.classes[name] = CostClass(name, **options)
+
+	def is_bounded(self, cost: str) -> bool:
+		return cost in self.classes
+
+	def slot(self, cost: str, priority: int = 0, on_queued: Callable[[int], Awaitable[None]] = None, on_started: Callable[[], Awaitable[None]] = None) -> _Slot:
+		# Async context manager that holds one of the cost class's slots for as long as it's entered. If there's no free
+		# slot right away, on_queued is awaited with the queue position, and on_started once the wait is over. Raises
+		# QueueFullError if the queue is full.
+		return _Slot(self.classes.get(cost, None), priority, on_queued, on_started)